@@ -0,0 +1,57 @@
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Optional
+
+AUTH_CACHE_TTL = 60  # Secondes : au-delà, l'état est relu en base (filet de sécurité entre plusieurs processus)
+
+
+# --- CACHE DE L'ÉTAT D'AUTHENTIFICATION ---
+# get_current_user (main.py) n'a besoin que de trois informations sur l'utilisateur :
+# le bannissement, sa date de fin et la version d'authentification (auth_version,
+# aussi inscrite dans le jeton sous "ver"). On les garde en mémoire par user_id :
+# la plupart des requêtes sont autorisées sans aucune requête SQL.
+# crud.py invalide l'entrée à chaque changement (ban, résolution de signalement, pseudo).
+
+
+@dataclass(frozen=True)
+class AuthState:
+    auth_version: int
+    is_banned: bool
+    ban_expires_at: Optional[datetime]
+    loaded_at: float
+
+
+class AuthCache:
+    def __init__(self, ttl: float = AUTH_CACHE_TTL):
+        self.ttl = ttl
+        self._states: Dict[int, AuthState] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int) -> Optional[AuthState]:
+        state = self._states.get(user_id)
+        if state is None or time.monotonic() - state.loaded_at > self.ttl:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return state
+
+    def put(self, user) -> AuthState:
+        state = AuthState(
+            auth_version=user.auth_version or 0,
+            is_banned=bool(user.is_banned),
+            ban_expires_at=user.ban_expires_at,
+            loaded_at=time.monotonic(),
+        )
+        self._states[user.id] = state
+        return state
+
+    def invalidate(self, user_id: int):
+        self._states.pop(user_id, None)
+
+    def clear(self):
+        self._states.clear()
+
+
+auth_cache = AuthCache()
@@ -0,0 +1,135 @@
+"""
+Benchmark : coût de get_current_user (main.py) avec et sans le cache d'authentification.
+
+"db"    : chaque requête relit l'utilisateur en base (ancien comportement, TTL négatif).
+"cache" : l'état (ban, auth_version) est servi par auth_cache.py, sans requête SQL.
+
+Vérifie aussi l'invalidation : un ban ou un changement de pseudo est vu
+immédiatement, et l'ancien jeton est refusé après un changement de pseudo.
+
+Usage (depuis la racine du dépôt) :
+    python -m benchmarks.bench_auth --users 200 --requests 20000
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from fastapi import HTTPException
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from database.models import User, enable_foreign_keys_configure_sqlite
+from database.shemas import BanUserSchema
+import database.crud as db_inter
+from security import create_access_token
+from auth_cache import auth_cache
+from main import get_current_user
+from benchmarks.bench_ws_latency import prepare_db, percentile
+
+
+def token_for(user):
+    return create_access_token(data={"sub": str(user.id), "pseudo": user.pseudo, "role": user.role, "email": user.email, "ver": user.auth_version})
+
+
+async def run(mode, path, tokens, requests, concurrency):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    event.listen(engine.sync_engine, "connect", enable_foreign_keys_configure_sqlite)
+    queries = 0
+
+    def count(*args):
+        nonlocal queries
+        queries += 1
+
+    event.listen(engine.sync_engine, "before_cursor_execute", count)
+    Session = async_sessionmaker(bind=engine, expire_on_commit=False)
+
+    auth_cache.clear()
+    auth_cache.ttl = -1 if mode == "db" else 60
+    latencies = []
+
+    async def client(worker):
+        for i in range(worker, requests, concurrency):
+            start = time.perf_counter()
+            async with Session() as db:
+                await get_current_user(tokens[i % len(tokens)], db)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(w) for w in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    await engine.dispose()
+    return elapsed, latencies, queries
+
+
+async def expect_status(token, Session, expected):
+    async with Session() as db:
+        try:
+            await get_current_user(token, db)
+            status = 200
+        except HTTPException as e:
+            status = e.status_code
+    assert status == expected, (status, expected)
+
+
+async def check_invalidation(path, sync_engine):
+    """Le cache ne doit jamais masquer un ban ou un jeton révoqué."""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    Session = async_sessionmaker(bind=engine, expire_on_commit=False)
+    SyncSession = sessionmaker(bind=sync_engine)
+    auth_cache.clear()
+    auth_cache.ttl = 60
+
+    with SyncSession() as db:
+        user = db.get(User, 1)
+        old_token = token_for(user)
+    await expect_status(old_token, Session, 200)  # Mise en cache
+
+    with SyncSession() as db:
+        user = db_inter.update_user_pseudo(db, 1, "Renommé")
+        new_token = token_for(user)
+    await expect_status(old_token, Session, 401)
+    await expect_status(new_token, Session, 200)
+
+    with SyncSession() as db:
+        db_inter.update_user_ban_status(db, 1, BanUserSchema(ban=True, reason="bench", duration_hours=1))
+    await expect_status(new_token, Session, 403)
+
+    with SyncSession() as db:
+        user = db_inter.update_user_ban_status(db, 1, BanUserSchema(ban=False))
+        await expect_status(token_for(user), Session, 200)
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        sync_engine = prepare_db(path, args.users)
+        with sessionmaker(bind=sync_engine)() as db:
+            tokens = [token_for(db.get(User, i + 1)) for i in range(args.users)]
+
+        print(f"{args.requests} authentifications, {args.users} utilisateurs, {args.concurrency} en parallèle\n")
+        print(f"{'mode':<6} {'auth/s':>8} {'p50 (ms)':>9} {'p99 (ms)':>9} {'SQL/requête':>12}")
+        for mode in ("db", "cache"):
+            elapsed, latencies, queries = asyncio.run(run(mode, path, tokens, args.requests, args.concurrency))
+            print(
+                f"{mode:<6} {len(latencies) / elapsed:>8.0f} {percentile(latencies, 0.5):>9.3f} "
+                f"{percentile(latencies, 0.99):>9.3f} {queries / args.requests:>12.3f}"
+            )
+
+        asyncio.run(check_invalidation(path, sync_engine))
+        print("\ninvalidation : ban et changement de pseudo vus immédiatement")
+        sync_engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
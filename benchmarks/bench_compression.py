@@ -0,0 +1,139 @@
+"""
+Benchmark : compression des réponses (compression.py), coût CPU contre octets économisés.
+
+Charges typiques : chargement initial d'un salon (max(50, non lus + 100) messages),
+/reports et /users de l'admin, liste des salons, en JSON et en MessagePack.
+Pour chaque niveau gzip / brotli : taille, temps de compression et de décompression,
+et gain net sur un lien lent (temps de transfert économisé moins le temps CPU).
+Puis permessage-deflate sur une suite de trames WebSocket (contexte conservé entre trames).
+
+Usage (depuis la racine du dépôt) :
+    python -m benchmarks.bench_compression --mbits 2
+"""
+
+import argparse
+import gzip
+import random
+from datetime import datetime, timedelta
+
+from websockets.extensions.permessage_deflate import PerMessageDeflate
+from websockets.frames import Frame, Opcode
+
+from compression import brotli
+from content_negotiation import encode_frame
+from benchmarks.bench_json import history_page, timed
+from benchmarks.bench_msgpack import room_list
+
+
+def reports(size):
+    """Réponse de /reports (ReportFullSchema)."""
+    start = datetime(2026, 1, 5, 8, 0)
+    return [
+        {
+            "id": i + 1,
+            "raison": ["Spam", "Insulte", "Hors sujet", "Contenu inapproprié"][i % 4],
+            "status": "pending" if i % 3 else "resolved",
+            "created_at": (start + timedelta(minutes=17 * i)).isoformat(),
+            "reporter_id": i % 40 + 1,
+            "reported_id": i % 25 + 2,
+            "message_id": 10_000 + i * 7,
+            "reporter": {"id": i % 40 + 1, "pseudo": f"Élève {i % 40}"},
+            "reported": {"id": i % 25 + 2, "pseudo": f"Élève {i % 25 + 1}"},
+            "message": {"content": f"Message signalé n°{i} : contenu du message en question " * (1 + i % 3)},
+        }
+        for i in range(size)
+    ]
+
+
+def users(size):
+    """Réponse de /users (UserSchema)."""
+    return [
+        {
+            "id": i + 1,
+            "email": f"eleve.{i}@cif.fr",
+            "pseudo": f"Élève {i}",
+            "role": "admin" if i == 0 else "user",
+            "is_banned": i % 50 == 0,
+            "created_at": "2026-01-05T08:00:00",
+            "last_pseudo_update": "2026-01-05T08:00:00",
+        }
+        for i in range(size)
+    ]
+
+
+def varied_history(size):
+    """Page d'historique au texte varié (history_page répète ses phrases, donc compresse trop bien)."""
+    rng = random.Random(42)
+    words = (
+        "le la les un une des de du et à en pour sur avec dans ce cette qui que on nous vous ils "
+        "cours exercice chapitre contrôle demain ce soir révision prof salle bibliothèque projet "
+        "groupe rendu note question réponse merci oui non peut-être exemple correction devoir "
+        "maths physique anglais histoire français informatique stage examen partiel retard"
+    ).split()
+    page = history_page(size)
+    for msg in page:
+        msg["content"] = " ".join(rng.choice(words) for _ in range(rng.randint(4, 40))).capitalize() + rng.choice([".", " ?", " !", ""])
+    return page
+
+
+def codecs():
+    yield "gzip 1", lambda b: gzip.compress(b, 1, mtime=0), gzip.decompress
+    yield "gzip 6", lambda b: gzip.compress(b, 6, mtime=0), gzip.decompress
+    yield "gzip 9", lambda b: gzip.compress(b, 9, mtime=0), gzip.decompress
+    if brotli is not None:
+        for quality in (1, 4, 6, 11):
+            yield f"br {quality}", lambda b, q=quality: brotli.compress(b, quality=q), brotli.decompress
+
+
+def deflate_frames(frames, level):
+    """Octets envoyés pour une suite de trames, comme un serveur permessage-deflate (contexte conservé)."""
+    extension = PerMessageDeflate(False, False, 15, 15, {"level": level, "memLevel": 5})
+    total = 0
+    for frame in frames:
+        total += len(extension.encode(Frame(Opcode.TEXT, frame)).data)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mbits", type=float, default=2, help="débit du lien simulé (Mbit/s)")
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--frames", type=int, default=200, help="trames WebSocket (nouveaux messages)")
+    args = parser.parse_args()
+    transfer_ms = lambda size: size * 8 / (args.mbits * 1_000_000) * 1000
+
+    payloads = [
+        ("historique 150 (json)", encode_frame(history_page(150)).encode()),
+        ("historique 150 (mp)", encode_frame(history_page(150), "msgpack")),
+        ("historique 150 varié", encode_frame(varied_history(150)).encode()),
+        ("historique 200 (json)", encode_frame(history_page(200)).encode()),
+        ("/reports 300", encode_frame(reports(300)).encode()),
+        ("/users 500", encode_frame(users(500)).encode()),
+        ("salons 30", encode_frame(room_list(30)).encode()),
+    ]
+
+    print(f"gain net = transfert économisé à {args.mbits:g} Mbit/s - compression - décompression\n")
+    print(f"{'charge':<22} {'codec':<7} {'octets':>8} {'ratio':>6} {'comp (ms)':>10} {'décomp (ms)':>12} {'gain net (ms)':>14}")
+    for name, body in payloads:
+        print(f"{name:<22} {'aucun':<7} {len(body):>8} {'100%':>6} {'':>10} {'':>12} {'':>14}")
+        for codec, compress, decompress in codecs():
+            packed = compress(body)
+            assert decompress(packed) == body
+            comp = timed(lambda: compress(body), args.rounds)
+            decomp = timed(lambda: decompress(packed), args.rounds)
+            gain = transfer_ms(len(body)) - transfer_ms(len(packed)) - comp - decomp
+            print(f"{'':<22} {codec:<7} {len(packed):>8} {len(packed) / len(body):>6.0%} {comp:>10.3f} {decomp:>12.3f} {gain:>14.1f}")
+
+    print(f"\npermessage-deflate : {args.frames} trames \"nouveau message\"\n")
+    frames = [encode_frame(dict(message, action="new")).encode() for message in varied_history(args.frames)]
+    raw = sum(len(frame) for frame in frames)
+    print(f"{'niveau':<7} {'octets':>8} {'ratio':>6} {'µs/trame':>9}")
+    print(f"{'aucun':<7} {raw:>8} {'100%':>6}")
+    for level in (1, 3, 6, 9):
+        size = deflate_frames(frames, level)
+        per_frame = timed(lambda: deflate_frames(frames, level), max(1, args.rounds // 10)) / len(frames) * 1000
+        print(f"{level:<7} {size:>8} {size / raw:>6.0%} {per_frame:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
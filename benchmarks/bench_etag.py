@@ -0,0 +1,97 @@
+"""
+Benchmark : GET conditionnel (ETag / If-None-Match, voir resource_versions.py).
+
+Pour /user/rooms, /rooms et la première page de /room/1/messages, compare une
+réponse complète (200) à une réponse 304 : latence, octets et requêtes SQL.
+Vérifie aussi qu'un nouveau message change bien l'ETag.
+
+Usage (depuis la racine du dépôt) :
+    python -m benchmarks.bench_etag --rooms 30 --messages 200 --requests 500
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import httpx
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from security import create_access_token
+from main import app
+from write_queue import write_queue
+from benchmarks.bench_user_rooms import build_db
+from benchmarks.bench_login import use_database
+from benchmarks.bench_ws_latency import percentile
+
+ENDPOINTS = ["/user/rooms", "/rooms", "/room/1/messages"]
+
+
+async def run(endpoint, headers, requests, conditional, queries):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        first = await client.get(endpoint, headers=headers)
+        assert first.status_code == 200, first.text
+        if conditional:
+            headers = dict(headers, **{"If-None-Match": first.headers["etag"]})
+
+        latencies, size = [], 0
+        queries.clear()
+        for _ in range(requests):
+            start = time.perf_counter()
+            r = await client.get(endpoint, headers=headers)
+            latencies.append(time.perf_counter() - start)
+            assert r.status_code == (304 if conditional else 200), r.status_code
+            size = len(r.content)
+        return latencies, size, len(queries) / requests
+
+
+async def check_invalidation(headers):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        etags = {endpoint: (await client.get(endpoint, headers=headers)).headers["etag"] for endpoint in ENDPOINTS}
+        r = await client.post("/room/1/messages", json={"content": "nouveau"}, headers=headers)
+        assert r.status_code == 201, r.text
+        for endpoint, etag in etags.items():
+            r = await client.get(endpoint, headers=dict(headers, **{"If-None-Match": etag}))
+            assert r.status_code == 200 and r.headers["etag"] != etag, (endpoint, r.status_code)
+        await write_queue.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rooms", type=int, default=30)
+    parser.add_argument("--messages", type=int, default=200, help="messages par salon")
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        engine = build_db(path, args.rooms, args.messages)
+        async_engine = use_database(engine, path)
+        write_queue.session_factory = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+        queries = []
+        for target in (engine, async_engine.sync_engine):
+            event.listen(target, "before_cursor_execute", lambda *a: queries.append(1))
+
+        token = create_access_token(data={"sub": "1", "pseudo": "Bench", "role": "user", "email": "bench@cif", "ver": 0})
+        headers = {"Authorization": f"Bearer {token}"}
+
+        print(f"{args.rooms} salons, {args.messages} messages par salon, {args.requests} requêtes par mesure\n")
+        print(f"{'endpoint':<18} {'réponse':<8} {'octets':>7} {'SQL/req':>8} {'p50 (ms)':>9} {'p99 (ms)':>9}")
+        for endpoint in ENDPOINTS:
+            for conditional in (False, True):
+                latencies, size, sql = asyncio.run(run(endpoint, headers, args.requests, conditional, queries))
+                print(
+                    f"{endpoint:<18} {'304' if conditional else '200':<8} {size:>7} {sql:>8.1f} "
+                    f"{percentile(latencies, 0.5):>9.3f} {percentile(latencies, 0.99):>9.3f}"
+                )
+
+        asyncio.run(check_invalidation(headers))
+        print("\ninvalidation : un nouveau message change l'ETag des trois endpoints")
+        asyncio.run(async_engine.dispose())
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
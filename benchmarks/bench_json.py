@@ -0,0 +1,120 @@
+"""
+Micro-benchmark : encodage JSON des réponses HTTP et des trames WebSocket.
+
+Réponses : page d'historique (MessageCompactSchema) de 50 à 500 messages,
+JSONResponse (json de la bibliothèque standard) contre ORJSONResponse (main.py).
+Diffusion : un message envoyé à N sockets, `send_json` (une sérialisation par socket,
+ancien ConnectionManager) contre encode_frame une seule fois puis `send_text`.
+
+Usage (depuis la racine du dépôt) :
+    python -m benchmarks.bench_json --sizes 50 200 500 --sockets 200
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from pydantic import TypeAdapter
+from starlette.websockets import WebSocket, WebSocketState
+
+from database.shemas import MessageCompactSchema
+from websocket_manager import encode_frame
+
+EMOJIS = ["👍", "❤️", "😂", "😮", "😢", "😡"]
+
+
+def history_page(size):
+    """Page réaliste : réponses, réactions, accents et emojis, validée comme par response_model."""
+    start = datetime(2026, 1, 5, 8, 0)
+    messages = [
+        {
+            "id": 10_000 + i,
+            "room_id": 1,
+            "author_id": i % 30 + 1,
+            "author_display_name": f"Élève {i % 30}",
+            "content": f"Message n°{i} : on révise le chapitre {i % 12} ce soir ? " * (1 + i % 4),
+            "message_type": "chat",
+            "created_at": start + timedelta(seconds=37 * i),
+            "modified": i % 9 == 0,
+            "parent_id": 10_000 + i - 3 if i % 3 == 0 and i >= 3 else None,
+            "parent_author": f"Élève {(i - 3) % 30}" if i % 3 == 0 and i >= 3 else None,
+            "parent_excerpt": "Message précédent cité dans la réponse" if i % 3 == 0 and i >= 3 else None,
+            "reactions": {EMOJIS[(i + k) % 6]: 1 + k for k in range(i % 4)},
+            "my_reaction": EMOJIS[i % 6] if i % 5 == 0 else None,
+        }
+        for i in range(size)
+    ]
+    adapter = TypeAdapter(List[MessageCompactSchema])
+    return adapter.dump_python(adapter.validate_python(messages), mode="json")
+
+
+def timed(func, rounds):
+    func()  # Échauffement
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func()
+    return (time.perf_counter() - start) / rounds * 1000
+
+
+class NullSend:
+    async def __call__(self, message):
+        pass
+
+
+def connected_socket():
+    """Vrai WebSocket Starlette (send_json / send_text inchangés) branché sur un envoi factice."""
+    scope = {"type": "websocket", "path": "/ws/1", "headers": [], "query_string": b""}
+    ws = WebSocket(scope, receive=None, send=NullSend())
+    ws.client_state = WebSocketState.CONNECTED
+    ws.application_state = WebSocketState.CONNECTED
+    return ws
+
+
+async def broadcast_per_socket(sockets, frame):
+    for ws in sockets:
+        await ws.send_json(frame)
+
+
+async def broadcast_once(sockets, frame):
+    text = encode_frame(frame)
+    for ws in sockets:
+        await ws.send_text(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 200, 500])
+    parser.add_argument("--sockets", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    print("Réponses HTTP (page d'historique)\n")
+    print(f"{'messages':>8} {'octets':>8} {'json (ms)':>10} {'orjson (ms)':>12} {'gain':>6}")
+    for size in args.sizes:
+        page = history_page(size)
+        stdlib = JSONResponse(page).body
+        fast = ORJSONResponse(page).body
+        assert json.loads(stdlib) == json.loads(fast)  # Même contenu
+        before = timed(lambda: JSONResponse(page), args.rounds)
+        after = timed(lambda: ORJSONResponse(page), args.rounds)
+        print(f"{size:>8} {len(fast):>8} {before:>10.3f} {after:>12.3f} {before / after:>5.1f}x")
+
+    print(f"\nDiffusion WebSocket d'un message à {args.sockets} sockets\n")
+    print(f"{'mode':<14} {'ms/diffusion':>13}")
+    frame = dict(history_page(1)[0], action="new")
+    sockets = [connected_socket() for _ in range(args.sockets)]
+    loop = asyncio.new_event_loop()
+    results = {}
+    for name, broadcast in (("send_json", broadcast_per_socket), ("encode_frame", broadcast_once)):
+        results[name] = timed(lambda: loop.run_until_complete(broadcast(sockets, frame)), args.rounds)
+        print(f"{name:<14} {results[name]:>13.3f}")
+    loop.close()
+    print(f"\ngain diffusion : {results['send_json'] / results['encode_frame']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
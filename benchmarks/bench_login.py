@@ -0,0 +1,153 @@
+"""
+Benchmark : pic de connexions (/login) et réactivité des autres routes synchrones.
+
+"inline" : ancienne route `def login`, bcrypt appelé directement dans le threadpool
+partagé d'AnyIO (40 threads) : les autres routes `def` attendent un thread libre.
+"pool"   : route actuelle, bcrypt dans le pool de processus de password_hasher.py,
+avec 503 immédiat quand la file d'attente est pleine.
+
+Pendant les connexions, une sonde appelle GET /users (route synchrone) en continu.
+
+Usage (depuis la racine du dépôt) :
+    python -m benchmarks.bench_login --logins 100 --seconds 10
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import httpx
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from database.models import Base, User, Room, enable_foreign_keys_configure_sqlite
+from security import get_password_hash, BCRYPT_ROUNDS
+from password_hasher import password_hasher
+from main import app, get_db, get_async_db
+from benchmarks.bench_ws_latency import percentile
+
+PASSWORD = "motdepasse-bench"
+
+
+def seed(path, users, rounds):
+    engine = create_engine(f"sqlite:///{path}")
+    event.listen(engine, "connect", enable_foreign_keys_configure_sqlite)
+    Base.metadata.create_all(engine)
+    password_hash = get_password_hash(PASSWORD, rounds)
+    with sessionmaker(bind=engine)() as db:
+        db.add(Room(id=1, name="Salon Général", description="bench", icon=1))
+        db.add_all(User(id=i + 1, email=f"bench{i}@cif", password=password_hash, pseudo=f"Bench{i}") for i in range(users))
+        db.commit()
+    return engine
+
+
+def use_database(engine, path):
+    """Branche les dépendances de session de main.py sur la base du benchmark."""
+    Session = sessionmaker(bind=engine)
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}", connect_args={"timeout": 15})
+    event.listen(async_engine.sync_engine, "connect", enable_foreign_keys_configure_sqlite)
+    AsyncSession = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+
+    def bench_db():
+        with Session() as db:
+            yield db
+
+    async def bench_async_db():
+        async with AsyncSession() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = bench_db
+    app.dependency_overrides[get_async_db] = bench_async_db
+    return async_engine
+
+
+def add_legacy_login():
+    """Reproduit l'ancienne route : crud synchrone + bcrypt dans le threadpool."""
+    from fastapi import Depends, HTTPException
+    from database.shemas import LoginRequest
+    from security import verify_password
+    import database.crud as db_inter
+
+    @app.post("/bench/legacy-login")
+    def legacy_login(data: LoginRequest, db=Depends(get_db)):
+        user = db_inter.get_user_by_email(db, data.email)
+        if not user or not verify_password(data.password, user.password):
+            raise HTTPException(status_code=401)
+        return {"ok": True}
+
+
+async def run(mode, users, logins, seconds):
+    url = "/bench/legacy-login" if mode == "inline" else "/login"
+    login_latencies, probe_latencies = [], []
+    statuses = {}
+    begin = time.perf_counter()
+    stop = begin + seconds
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=120) as client:
+
+        async def login_loop(worker):
+            i = worker
+            while time.perf_counter() < stop:
+                start = time.perf_counter()
+                r = await client.post(url, json={"email": f"bench{i % users}@cif", "password": PASSWORD})
+                statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+                if r.status_code == 200:
+                    login_latencies.append(time.perf_counter() - start)
+                else:
+                    await asyncio.sleep(float(r.headers.get("Retry-After", 1)))  # Le client réessaie plus tard
+                i += logins
+
+        async def probe():
+            while time.perf_counter() < stop:
+                start = time.perf_counter()
+                r = await client.get("/users")
+                assert r.status_code == 200
+                probe_latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(0.02)
+
+        await asyncio.gather(probe(), *(login_loop(w) for w in range(logins)))
+    # Les connexions en cours à la fin de la fenêtre sont attendues : durée réelle
+    return time.perf_counter() - begin, login_latencies, probe_latencies, statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--logins", type=int, default=100, help="connexions simultanées")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--rounds", type=int, default=BCRYPT_ROUNDS)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        engine = seed(path, args.users, args.rounds)
+        async_engine = use_database(engine, path)
+        add_legacy_login()
+        password_hasher.rounds = args.rounds  # Pas de rehachage pendant la mesure
+        password_hasher.start()
+
+        print(f"{args.logins} connexions simultanées pendant {args.seconds:.0f} s, bcrypt coût {args.rounds}, {os.cpu_count()} CPU\n")
+        print(f"{'mode':<7} {'login/s':>8} {'p50 (ms)':>9} {'p99 (ms)':>9} {'503':>6} {'sonde p50':>10} {'sonde p99':>10}")
+        results = {}
+        for mode in ("inline", "pool"):
+            elapsed, logins, probes, statuses = asyncio.run(run(mode, args.users, args.logins, args.seconds))
+            results[mode] = percentile(probes, 0.99)
+            print(
+                f"{mode:<7} {len(logins) / elapsed:>8.1f} {percentile(logins, 0.5):>9.0f} {percentile(logins, 0.99):>9.0f} "
+                f"{statuses.get(503, 0):>6} {percentile(probes, 0.5):>10.1f} {results[mode]:>10.1f}"
+            )
+
+        print(f"\nmétriques pool : {password_hasher.metrics()}")
+        password_hasher.stop()
+        asyncio.run(async_engine.dispose())
+        engine.dispose()
+
+    # Les autres routes synchrones ne doivent plus attendre bcrypt
+    assert results["pool"] < results["inline"], results
+
+
+if __name__ == "__main__":
+    main()
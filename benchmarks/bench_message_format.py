@@ -0,0 +1,128 @@
+"""
+Benchmark : une page d'historique au format v1 (MessageSchema) et au format compact (MessageCompactSchema).
+
+v1      : parent imbriqué (avec auteur et réactions), chaque réaction avec son utilisateur,
+          chargés par joinedload/selectinload puis validés objet par objet.
+compact : aperçu du parent par jointure, réactions agrégées par un GROUP BY.
+
+Usage (depuis la racine du dépôt) :
+    python -m benchmarks.bench_message_format --messages 5000 --reactions 6
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from typing import List
+
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.orm import sessionmaker
+
+from database.models import Base, User, Room, Message, Reaction, user_room, enable_foreign_keys_configure_sqlite
+from database.shemas import MessageSchema, MessageCompactSchema
+from database.crud import history_stmt, compact_message_stmt, reaction_summary_stmt, compact_messages
+from database.crud_async import message_full_options, _inject_parent_info
+from pydantic import TypeAdapter
+
+EMOJIS = ["👍", "❤️", "😂", "😮", "😢", "😡"]
+
+
+def seed(path, messages, reactions, users=20):
+    engine = create_engine(f"sqlite:///{path}")
+    event.listen(engine, "connect", enable_foreign_keys_configure_sqlite)
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{"id": u + 1, "email": f"bench{u}@cif", "password": "x", "pseudo": f"Bench{u}"} for u in range(users)])
+        conn.execute(insert(Room).values(id=1, name="Salon", description="bench", icon=1))
+        conn.execute(insert(user_room), [{"user_id": u + 1, "room_id": 1} for u in range(users)])
+        # Un message sur deux répond au précédent, avec un contenu de taille réaliste
+        conn.execute(
+            insert(Message),
+            [
+                {
+                    "id": i + 1,
+                    "content": f"message {i} " + "du texte " * 15,
+                    "author_id": i % users + 1,
+                    "author_display_name": f"Bench{i % users}",
+                    "room_id": 1,
+                    "parent_id": i if i % 2 else None,
+                }
+                for i in range(messages)
+            ],
+        )
+        conn.execute(
+            insert(Reaction),
+            [
+                {"message_id": i + 1, "user_id": (i + r) % users + 1, "emoji": EMOJIS[(i + r) % 3]}
+                for i in range(messages)
+                for r in range(reactions)
+            ],
+        )
+    return engine
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--reactions", type=int, default=6, help="réactions par message")
+    parser.add_argument("--page", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    v1_adapter = TypeAdapter(List[MessageSchema])
+    compact_adapter = TypeAdapter(List[MessageCompactSchema])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = seed(os.path.join(tmp, "bench.db"), args.messages, args.reactions)
+        Session = sessionmaker(bind=engine)
+        queries = 0
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def count(*_):
+            nonlocal queries
+            queries += 1
+
+        def v1(db):
+            page = db.execute(history_stmt(1, before_id=args.messages // 2, limit=args.page).options(*message_full_options())).unique().scalars().all()
+            for msg in page:
+                _inject_parent_info(msg)
+            return v1_adapter.dump_json(v1_adapter.validate_python(page, from_attributes=True))
+
+        def compact(db):
+            rows = db.execute(compact_message_stmt(history_stmt(1, before_id=args.messages // 2, limit=args.page))).all()
+            summary = db.execute(reaction_summary_stmt([row.id for row in rows], 1)).all()
+            return compact_adapter.dump_json(compact_adapter.validate_python(compact_messages(rows, summary)))
+
+        print(f"page de {args.page} messages, {args.reactions} réactions par message, une réponse sur deux\n")
+        print(f"{'format':<8} {'octets':>8} {'requêtes':>9} {'ms/page':>8}")
+        sizes = {}
+        for name, fetch in (("v1", v1), ("compact", compact)):
+            with Session() as db:
+                body = fetch(db)
+                queries = 0
+                start = time.perf_counter()
+                for _ in range(args.rounds):
+                    db.expunge_all()
+                    fetch(db)
+                elapsed = (time.perf_counter() - start) / args.rounds
+            sizes[name] = len(body)
+            print(f"{name:<8} {len(body):>8} {queries / args.rounds:>9.0f} {elapsed * 1000:>8.2f}")
+
+        # Même contenu : les compteurs compact correspondent aux réactions détaillées de v1
+        with Session() as db:
+            detailed = json.loads(v1(db))
+            lean = json.loads(compact(db))
+        for full, small in zip(detailed, lean):
+            counts = {}
+            for r in full["reactions"]:
+                counts[r["emoji"]] = counts.get(r["emoji"], 0) + 1
+            assert counts == small["reactions"] and full["id"] == small["id"]
+            assert (full["parent"] or {}).get("author_display_name") == small["parent_author"]
+        engine.dispose()
+
+    print(f"\ntaille compact / v1 : {sizes['compact'] / sizes['v1']:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark : JSON contre MessagePack (négociation de content_negotiation.py).
+
+Pour des pages d'historique de 50 à 500 messages et une liste de salons, compare
+la taille du corps, le coût d'encodage serveur (orjson / msgpack), le décodage
+client (json.loads de httpx / msgpack.unpackb) et le temps de transfert estimé
+sur un Wi-Fi lent.
+
+Usage (depuis la racine du dépôt) :
+    python -m benchmarks.bench_msgpack --sizes 50 200 500 --mbits 2
+"""
+
+import argparse
+import json
+
+import msgpack
+
+from content_negotiation import encode_frame
+from benchmarks.bench_json import history_page, timed
+
+
+def room_list(size):
+    """Réponse de /user/rooms (user_room_row_to_dict)."""
+    return [
+        {
+            "id": i + 1,
+            "name": f"Salon {i + 1} - Révisions",
+            "description": "Entraide, exercices et annonces de la promo",
+            "access_key": None,
+            "icon": i % 20,
+            "created_at": "2026-01-05T08:00:00",
+            "creator": None,
+            "last_message_content": "On se retrouve à la bibliothèque après le cours ?",
+            "last_message_author": f"Élève {i}",
+            "last_message_time": "17:42",
+            "last_read_id": 10_000 + i * 37,
+            "unread_count": i % 7,
+        }
+        for i in range(size)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 200, 500])
+    parser.add_argument("--rooms", type=int, default=30)
+    parser.add_argument("--mbits", type=float, default=2, help="débit du lien simulé (Mbit/s)")
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    payloads = [(f"historique {size}", history_page(size)) for size in args.sizes]
+    payloads.append((f"salons {args.rooms}", room_list(args.rooms)))
+
+    print(f"{'charge':<16} {'json (o)':>9} {'msgpack (o)':>12} {'taille':>7} {'enc json':>9} {'enc mp':>7} {'dec json':>9} {'dec mp':>7} {'transfert json/mp (ms)':>23}")
+    for name, payload in payloads:
+        as_json = encode_frame(payload).encode()
+        as_msgpack = encode_frame(payload, "msgpack")
+        assert msgpack.unpackb(as_msgpack) == json.loads(as_json)  # Même contenu
+
+        enc_json = timed(lambda: encode_frame(payload), args.rounds)
+        enc_mp = timed(lambda: encode_frame(payload, "msgpack"), args.rounds)
+        dec_json = timed(lambda: json.loads(as_json), args.rounds)
+        dec_mp = timed(lambda: msgpack.unpackb(as_msgpack), args.rounds)
+        transfer = lambda body: len(body) * 8 / (args.mbits * 1_000_000) * 1000
+        print(
+            f"{name:<16} {len(as_json):>9} {len(as_msgpack):>12} {len(as_msgpack) / len(as_json):>7.0%} "
+            f"{enc_json:>9.3f} {enc_mp:>7.3f} {dec_json:>9.3f} {dec_mp:>7.3f} "
+            f"{transfer(as_json):>11.1f} / {transfer(as_msgpack):<9.1f}"
+        )
+    print("\nencodage et décodage en ms ; transfert estimé au débit --mbits, hors latence réseau")
+
+
+if __name__ == "__main__":
+    main()
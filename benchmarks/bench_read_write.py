@@ -0,0 +1,138 @@
+"""
+Benchmark : lectures d'historique pendant des écritures continues.
+
+"legacy" : un seul pool, journal rollback (ancienne configuration) : pendant le
+commit de l'écrivain, les lecteurs attendent le verrou (busy_timeout).
+"split"  : écrivain à une connexion en WAL + pool de lecteurs (SQLITE_PRAGMAS),
+les lecteurs lisent un instantané sans jamais attendre l'écrivain.
+
+Usage (depuis la racine du dépôt) :
+    python -m benchmarks.bench_read_write --seconds 5 --readers 4
+"""
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.orm import sessionmaker, joinedload, selectinload
+
+from database.models import Base, User, Room, Message, Reaction, user_room, sqlite_pragmas, READER_POOL_SIZE
+import database.crud as db_inter
+from benchmarks.bench_ws_latency import percentile
+
+
+def legacy_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.execute("PRAGMA busy_timeout = 5000")
+    cursor.close()
+
+
+def seed(path, messages):
+    engine = create_engine(f"sqlite:///{path}")
+    event.listen(engine, "connect", legacy_pragmas)
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User).values(id=1, email="bench@cif", password="x", pseudo="Bench"))
+        conn.execute(insert(Room).values(id=1, name="Salon", description="bench", icon=1))
+        conn.execute(insert(user_room).values(user_id=1, room_id=1))
+        conn.execute(
+            insert(Message),
+            [{"content": f"message {i}", "author_id": 1, "room_id": 1, "author_display_name": "Bench"} for i in range(messages)],
+        )
+    engine.dispose()
+
+
+def engines(mode, path):
+    url = f"sqlite:///{path}"
+    if mode == "legacy":
+        shared = create_engine(url, connect_args={"timeout": 15})
+        event.listen(shared, "connect", legacy_pragmas)
+        return shared, shared
+    writer = create_engine(url, connect_args={"timeout": 15}, pool_size=1, max_overflow=0)
+    event.listen(writer, "connect", sqlite_pragmas("writer"))
+    reader = create_engine(url, connect_args={"timeout": 15}, pool_size=READER_POOL_SIZE, max_overflow=0)
+    event.listen(reader, "connect", sqlite_pragmas("reader"))
+    return writer, reader
+
+
+def write_loop(mode, path, batch, stop, written):
+    """Écrivain dans un processus séparé (pas de GIL partagé avec les lecteurs)."""
+    writer_engine, _ = engines(mode, path)
+    while not stop.is_set():
+        with writer_engine.begin() as conn:
+            conn.execute(
+                insert(Message),
+                [{"content": f"écriture {i} " * 20, "author_id": 1, "room_id": 1, "author_display_name": "Bench"} for i in range(batch)],
+            )
+        with written.get_lock():
+            written.value += batch
+    writer_engine.dispose()
+
+
+def run(mode, path, seconds, readers, batch):
+    _, reader_engine = engines(mode, path)
+    Reader = sessionmaker(bind=reader_engine)
+    stop = threading.Event()
+    process_stop = multiprocessing.Event()
+    written = multiprocessing.Value("i", 0)
+    latencies = []
+
+    options = (joinedload(Message.author), selectinload(Message.reactions).joinedload(Reaction.user), joinedload(Message.parent))
+
+    def reader():
+        local = []
+        while not stop.is_set():
+            start = time.perf_counter()
+            with Reader() as db:
+                page = db.execute(db_inter.history_stmt(1, before_id=5000, limit=50).options(*options)).unique().scalars().all()
+                assert len(page) == 50
+            local.append(time.perf_counter() - start)
+        latencies.extend(local)
+
+    writer = multiprocessing.Process(target=write_loop, args=(mode, path, batch, process_stop, written))
+    writer.start()
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    process_stop.set()
+    for t in threads:
+        t.join()
+    writer.join()
+    reader_engine.dispose()
+    return latencies, written.value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--batch", type=int, default=20000, help="messages par transaction d'écriture")
+    parser.add_argument("--messages", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'mode':<8} {'lectures/s':>10} {'p50 (ms)':>9} {'p99 (ms)':>9} {'max (ms)':>9} {'écritures/s':>12}")
+    results = {}
+    for mode in ("legacy", "split"):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.db")
+            seed(path, args.messages)
+            latencies, written = run(mode, path, args.seconds, args.readers, args.batch)
+            results[mode] = percentile(latencies, 0.99)
+            print(
+                f"{mode:<8} {len(latencies) / args.seconds:>10.0f} {percentile(latencies, 0.5):>9.2f} "
+                f"{results[mode]:>9.2f} {max(latencies) * 1000:>9.2f} {written / args.seconds:>12.0f}"
+            )
+
+    # Les lectures ne doivent plus attendre la fin des transactions d'écriture
+    assert results["split"] < results["legacy"], results
+
+
+if __name__ == "__main__":
+    main()
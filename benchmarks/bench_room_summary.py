@@ -0,0 +1,124 @@
+"""
+Benchmark : liste des salons tenue à jour par deltas "room_summary" contre "refresh_rooms" global.
+
+U utilisateurs connectés (session /ws), tous membres du Salon Général ; un petit salon
+n'a que M membres. K messages sont postés dans chacun des deux salons.
+"refresh_rooms" : ancien comportement, signal à tous les connectés, et chacun recharge
+                  GET /user/rooms (avec son ETag : 304 si rien n'a changé pour lui) ;
+"room_summary"  : delta envoyé aux seuls membres, appliqué sur place par le client.
+Les requêtes SQL comptent aussi celles des POST.
+
+Usage (depuis la racine du dépôt) :
+    python -m benchmarks.bench_room_summary --users 500 --members 20 --messages 10
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import httpx
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from database.models import Base, User, Room, user_room, enable_foreign_keys_configure_sqlite
+from security import create_access_token
+from main import app
+from write_queue import write_queue
+from websocket_manager import manager
+from benchmarks.bench_login import use_database
+
+
+class FakeSocket:
+    def __init__(self):
+        self.frames = 0
+        self.size = 0
+
+    async def send_text(self, data):
+        self.frames += 1
+        self.size += len(data)
+
+
+def seed(path, users, members):
+    engine = create_engine(f"sqlite:///{path}")
+    event.listen(engine, "connect", enable_foreign_keys_configure_sqlite)
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{"id": u, "email": f"bench{u}@cif", "password": "x", "pseudo": f"Bench{u}"} for u in range(1, users + 1)])
+        conn.execute(insert(Room), [{"id": 1, "name": "Salon Général", "description": "bench", "icon": 1}, {"id": 2, "name": "Petit salon", "description": "bench", "icon": 2}])
+        conn.execute(insert(user_room), [{"user_id": u, "room_id": 1} for u in range(1, users + 1)] + [{"user_id": u, "room_id": 2} for u in range(1, members + 1)])
+    return engine
+
+
+async def scenario(mode, client, tokens, sockets, room_id, messages, queries):
+    """(trames, octets WS, requêtes HTTP, dont 304, octets HTTP, requêtes SQL, ms)"""
+    for socket in sockets.values():
+        socket.frames = socket.size = 0
+    queries.clear()
+    requests = not_modified = http_size = 0
+    start = time.perf_counter()
+    for i in range(messages):
+        r = await client.post(f"/room/{room_id}/messages", json={"content": f"message {i} " + "du texte " * 10}, headers=tokens[1])
+        assert r.status_code == 201, r.text
+        if mode == "refresh_rooms":
+            # Ancien signal global : chaque connecté recharge sa liste (le delta, envoyé aussi, est ignoré)
+            for user_id, headers in tokens.items():
+                r = await client.get("/user/rooms", headers={"Authorization": headers["Authorization"], "If-None-Match": headers["etag"]})
+                requests, not_modified, http_size = requests + 1, not_modified + (r.status_code == 304), http_size + len(r.content)
+                if r.status_code == 200:
+                    headers["etag"] = r.headers.get("etag", "")
+        await asyncio.sleep(0.01)  # Les tâches d'écriture vident les files
+    elapsed = (time.perf_counter() - start) * 1000
+    frames = sum(s.frames for s in sockets.values()) if mode == "room_summary" else len(sockets) * messages
+    size = sum(s.size for s in sockets.values()) if mode == "room_summary" else frames * len('{"action":"refresh_rooms"}')
+    return frames, size, requests, not_modified, http_size, len(queries), elapsed
+
+
+async def run(args, path, engine):
+    async_engine = use_database(engine, path)
+    factory = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+    write_queue.session_factory = manager.session_factory = factory
+    queries = []
+    event.listen(async_engine.sync_engine, "before_cursor_execute", lambda *a: queries.append(1))
+
+    tokens = {
+        u: {"Authorization": "Bearer " + create_access_token(data={"sub": str(u), "pseudo": f"Bench{u}", "role": "user", "email": f"bench{u}@cif", "ver": 0}), "etag": ""}
+        for u in range(1, args.users + 1)
+    }
+    sockets = {u: FakeSocket() for u in tokens}
+    for user_id, socket in sockets.items():
+        manager.add_user_connection(socket, user_id).start()
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        for headers in tokens.values():  # Listes déjà chargées une fois (ETag connue)
+            r = await client.get("/user/rooms", headers={"Authorization": headers["Authorization"]})
+            headers["etag"] = r.headers.get("etag", "")
+        for room_id, label in ((2, f"{args.members} membres"), (1, f"{args.users} membres")):
+            for mode in ("refresh_rooms", "room_summary"):
+                frames, size, requests, not_modified, http_size, sql, ms = await scenario(mode, client, tokens, sockets, room_id, args.messages, queries)
+                print(f"{label:<13} {mode:<14} {frames:>7} {size:>9} {requests:>6} {not_modified:>6} {http_size:>10} {sql:>6} {ms:>9.0f}")
+
+    for user_id, socket in sockets.items():
+        manager.disconnect_user(socket, user_id)
+    await async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=500, help="utilisateurs connectés")
+    parser.add_argument("--members", type=int, default=20, help="membres du petit salon")
+    parser.add_argument("--messages", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{args.users} connectés, {args.messages} messages par salon\n")
+    print(f"{'salon':<13} {'signal':<14} {'trames':>7} {'octets WS':>9} {'HTTP':>6} {'304':>6} {'octets HTTP':>10} {'SQL':>6} {'ms':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        engine = seed(path, args.users, args.members)
+        asyncio.run(run(args, path, engine))
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
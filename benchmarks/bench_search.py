@@ -0,0 +1,144 @@
+"""
+Mesure la recherche plein texte (FTS5, ou tsvector + GIN sous PostgreSQL) sur un gros historique.
+
+Les messages sont générés à partir d'un vocabulaire de fréquences variées
+(mots courants, moyens, rares) ; on mesure la recherche dans un salon et la
+recherche globale limitée aux salons de l'utilisateur. Enfin un salon calme dont le seul
+"bonjour" précède SEARCH_MAX_CANDIDATES "bonjour" d'un autre salon doit rester trouvable.
+
+Usage (depuis la racine du dépôt) :
+    python -m benchmarks.bench_search --messages 1000000
+    # PostgreSQL (tsvector + GIN) : la base désignée est vidée puis remplie
+    CIF_DATABASE_URL=postgresql://postgres@localhost/cif_bench python -m benchmarks.bench_search
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import create_engine, event, insert, select
+from sqlalchemy.orm import sessionmaker
+
+import database.models as models
+from database.models import Base, User, Room, Message, user_room, enable_foreign_keys_configure_sqlite, SEARCH_MAX_CANDIDATES
+import database.crud as db_inter
+
+COMMON = ["bonjour", "merci", "demain", "cours", "salut", "projet", "examen", "groupe"]
+MEDIUM = [f"sujet{i}" for i in range(200)]
+RARE = [f"rare{i}" for i in range(20000)]
+
+ROOMS = 20
+# Y compris les mots courants : SEARCH_MAX_CANDIDATES correspondances visibles, cherchées parmi
+# celles des autres salons (pire cas : salon calme, toutes les correspondances du mot parcourues)
+MAX_SEARCH_MS = 300
+
+
+def random_content(rng):
+    words = rng.choices(COMMON, k=rng.randint(2, 6))
+    if rng.random() < 0.3:
+        words.append(rng.choice(MEDIUM))
+    if rng.random() < 0.05:
+        words.append(rng.choice(RARE))
+    rng.shuffle(words)
+    return " ".join(words)
+
+
+def timed(fn, repeat=20):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1000000)
+    args = parser.parse_args()
+    rng = random.Random(42)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if models.IS_SQLITE:
+            engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+            event.listen(engine, "connect", enable_foreign_keys_configure_sqlite)
+        else:
+            engine = models.engine
+            Base.metadata.drop_all(engine)
+        Base.metadata.create_all(engine)
+
+        start = time.perf_counter()
+        with engine.begin() as conn:
+            conn.execute(insert(User).values(id=1, email="bench@cif", password="x", pseudo="Bench"))
+            conn.execute(insert(Room), [{"id": r, "name": f"Salon {r}", "description": "bench", "icon": 1} for r in range(1, ROOMS + 1)])
+            # L'utilisateur n'est membre que de la moitié des salons
+            conn.execute(insert(user_room), [{"user_id": 1, "room_id": r} for r in range(1, ROOMS + 1, 2)])
+            for chunk in range(0, args.messages, 50000):
+                conn.execute(
+                    insert(Message),
+                    [
+                        {
+                            "content": random_content(rng),
+                            "author_id": 1,
+                            "room_id": 1 + i % ROOMS,
+                            "author_display_name": "Bench",
+                            "message_type": "delete" if i % 19 == 0 else "chat",
+                        }
+                        for i in range(chunk, min(chunk + 50000, args.messages))
+                    ],
+                )
+        print(f"Seed : {args.messages} messages indexés par les triggers en {time.perf_counter() - start:.1f} s")
+
+        with sessionmaker(bind=engine)() as db:
+            # Reconstruction complète (commande rebuild-search)
+            start = time.perf_counter()
+            count = db_inter.rebuild_messages_fts(db)
+            print(f"Rebuild : {count} messages en {time.perf_counter() - start:.1f} s\n")
+
+            cases = [
+                ("rare, salon", "rare123", 1),
+                ("rare, global", "rare123", None),
+                ("moyen, salon", "sujet42", 1),
+                ("moyen, global", "sujet42", None),
+                ("préfixe, global", "sujet4", None),
+                ("courant, salon", "bonjour", 1),
+                ("courant, global", "bonjour", None),
+                ("deux mots, global", "merci sujet7", None),
+            ]
+            print(f"{'recherche':<20} {'médiane (ms)':>12} {'résultats':>10}")
+            for label, q, room_id in cases:
+                ms, rows = timed(lambda: db_inter.search_messages(db, 1, q, room_id))
+                print(f"{label:<20} {ms:>12.2f} {len(rows):>10}")
+                assert all(r["room_id"] % 2 == 1 for r in rows), "résultat hors des salons de l'utilisateur"
+                assert ms < MAX_SEARCH_MS, f"{label} : {ms:.1f} ms"
+
+            # Page suivante : pas de doublon avec la première
+            first = db_inter.search_messages(db, 1, "sujet42", None, limit=20)
+            second = db_inter.search_messages(db, 1, "sujet42", None, limit=20, offset=20)
+            assert not {r["id"] for r in first} & {r["id"] for r in second}
+
+            # Les messages supprimés ne sont jamais indexés
+            ids = [r["id"] for r in db_inter.search_messages(db, 1, "sujet42", None, limit=200)]
+            assert not db.execute(select(Message.id).where(Message.id.in_(ids), Message.message_type == "delete")).first()
+
+            # Salon calme : son seul "bonjour" est plus ancien que SEARCH_MAX_CANDIDATES "bonjour" d'un autre salon
+            quiet = ROOMS + 1
+            db.execute(insert(Room).values(id=quiet, name="Salon calme", description="bench", icon=1))
+            db.execute(insert(user_room).values(user_id=1, room_id=quiet))
+            db.execute(insert(Message).values(content="bonjour calme", author_id=1, room_id=quiet, author_display_name="Bench"))
+            db.execute(
+                insert(Message),
+                [{"content": "bonjour", "author_id": 1, "room_id": 1, "author_display_name": "Bench"} for _ in range(SEARCH_MAX_CANDIDATES + 1000)],
+            )
+            db.commit()
+            ms, rows = timed(lambda: db_inter.search_messages(db, 1, "bonjour", quiet))
+            print(f"{'courant, salon calme':<20} {ms:>12.2f} {len(rows):>10}")
+            assert [r["room_id"] for r in rows] == [quiet], "salon calme : message introuvable"
+            assert ms < MAX_SEARCH_MS, f"salon calme : {ms:.1f} ms"
+
+
+if __name__ == "__main__":
+    main()
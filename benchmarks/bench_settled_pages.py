@@ -0,0 +1,129 @@
+"""
+Benchmark : remontée de l'historique sur des pages figées (settled_pages.py).
+
+Un membre remonte tout l'historique d'un salon dont les messages ont plus de 3 jours,
+page par page (`before_id`). Trois parcours :
+"avec réactions" : reactions=true, chaque page passe par SQLite (adhésion, messages, réactions) ;
+"figée, 1er"     : reactions=false, la page est lue puis encodée dans le LRU ;
+"figée, LRU"     : même parcours par d'autres membres, servi depuis le LRU.
+Chaque page figée est complétée par GET /room/{id}/reactions (un GROUP BY), comme le client.
+
+Usage (depuis la racine du dépôt) :
+    python -m benchmarks.bench_settled_pages --messages 5000 --members 20
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import httpx
+from sqlalchemy import create_engine, event, insert
+
+from database.models import Base, User, Room, Message, Reaction, user_room, enable_foreign_keys_configure_sqlite
+from security import create_access_token
+from settled_pages import settled_pages
+from main import app
+from benchmarks.bench_login import use_database
+
+EMOJIS = ["👍", "❤️", "😂"]
+
+
+def seed(path, messages, members):
+    engine = create_engine(f"sqlite:///{path}")
+    event.listen(engine, "connect", enable_foreign_keys_configure_sqlite)
+    Base.metadata.create_all(engine)
+    start = datetime.now() - timedelta(days=30)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{"id": u + 1, "email": f"bench{u}@cif", "password": "x", "pseudo": f"Bench{u}"} for u in range(members)])
+        conn.execute(insert(Room).values(id=1, name="Salon", description="bench", icon=1))
+        conn.execute(insert(user_room), [{"user_id": u + 1, "room_id": 1} for u in range(members)])
+        conn.execute(
+            insert(Message),
+            [
+                {
+                    "id": i + 1,
+                    "content": f"message {i} " + "du texte " * 15,
+                    "author_id": i % members + 1,
+                    "author_display_name": f"Bench{i % members}",
+                    "room_id": 1,
+                    "parent_id": i if i % 3 == 0 and i else None,
+                    "created_at": start + timedelta(seconds=30 * i),
+                }
+                for i in range(messages)
+            ],
+        )
+        conn.execute(insert(Reaction), [{"message_id": i + 1, "user_id": 1, "emoji": EMOJIS[i % 3]} for i in range(0, messages, 4)])
+    return engine
+
+
+async def scroll_back(client, headers, top_id, reactions, queries):
+    """Remonte tout l'historique ; renvoie (pages, requêtes SQL des pages, des réactions, octets)."""
+    before_id, pages, page_sql, reaction_sql, size = top_id, 0, 0, 0, 0
+    while True:
+        queries.clear()
+        r = await client.get(f"/room/1/messages?before_id={before_id}&reactions={str(reactions).lower()}", headers=headers)
+        assert r.status_code == 200, r.text
+        page = r.json()
+        if not page:
+            return pages, page_sql, reaction_sql, size
+        page_sql += len(queries)
+        size += len(r.content)
+        if not reactions:
+            queries.clear()
+            r = await client.get(f"/room/1/reactions?after_id={page[0]['id'] - 1}&before_id={before_id}", headers=headers)
+            assert r.status_code == 200, r.text
+            reaction_sql += len(queries)
+            size += len(r.content)
+        before_id, pages = page[0]["id"], pages + 1
+
+
+async def run(members, top_id, queries):
+    tokens = [
+        {"Authorization": "Bearer " + create_access_token(data={"sub": str(u + 1), "pseudo": f"Bench{u}", "role": "user", "email": f"bench{u}@cif", "ver": 0})}
+        for u in range(members)
+    ]
+    results = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        # Comme le client : la liste des salons d'abord (auth_cache, adhésions connues en mémoire)
+        for headers in tokens:
+            await client.get("/user/rooms", headers=headers)
+        for name, reactions, users in (("avec réactions", True, tokens[1:]), ("figée, 1er", False, tokens[:1]), ("figée, LRU", False, tokens[1:])):
+            start = time.perf_counter()
+            pages = page_sql = reaction_sql = size = 0
+            for headers in users:
+                p, q, rq, s = await scroll_back(client, headers, top_id, reactions, queries)
+                pages, page_sql, reaction_sql, size = pages + p, page_sql + q, reaction_sql + rq, size + s
+            elapsed = time.perf_counter() - start
+            results.append((name, pages, page_sql / pages, reaction_sql / pages, size / pages, elapsed / pages * 1000))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--members", type=int, default=20, help="membres qui remontent l'historique")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        engine = seed(path, args.messages, args.members)
+        async_engine = use_database(engine, path)
+        queries = []
+        for target in (engine, async_engine.sync_engine):
+            event.listen(target, "before_cursor_execute", lambda *a: queries.append(1))
+        settled_pages.clear()
+
+        print(f"{args.messages} messages de plus de 3 jours, {args.members} membres remontent tout l'historique\n")
+        print(f"{'parcours':<16} {'pages':>6} {'SQL page':>9} {'SQL réactions':>14} {'octets/page':>12} {'ms/page':>8}")
+        for name, pages, page_sql, reaction_sql, size, ms in asyncio.run(run(args.members, args.messages + 1, queries)):
+            print(f"{name:<16} {pages:>6} {page_sql:>9.1f} {reaction_sql:>14.1f} {size:>12.0f} {ms:>8.2f}")
+        print(f"\nLRU : {settled_pages.metrics()}")
+        asyncio.run(async_engine.dispose())
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Benchmark : retour en ligne par GET /sync (journal `events`) contre rechargement complet.
+
+Un membre de N salons (historique déjà chargé) se déconnecte ; pendant son absence les
+autres membres écrivent K changements (nouveaux messages, modifications, suppressions,
+réactions). Deux façons de rattraper :
+"rechargement" : GET /user/rooms puis le chargement initial de chaque salon (seule façon
+                 jusqu'ici de voir les modifications, suppressions et réactions) ;
+"/sync"        : GET /sync?since=<curseur>, rappelé tant que has_more.
+
+Usage (depuis la racine du dépôt) :
+    python -m benchmarks.bench_sync --rooms 20 --messages 500 --changes 0 10 100 1000
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import httpx
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.orm import sessionmaker
+
+import database.crud as db_inter
+from database.models import Base, User, Room, Message, user_room, enable_foreign_keys_configure_sqlite
+from database.shemas import MessageCreate, EditMessageSchema, ReactionCreateSchema
+from security import create_access_token
+from main import app
+from benchmarks.bench_login import use_database
+
+
+def seed(path, rooms, messages):
+    engine = create_engine(f"sqlite:///{path}")
+    event.listen(engine, "connect", enable_foreign_keys_configure_sqlite)
+    Base.metadata.create_all(engine)
+    start = datetime.now() - timedelta(hours=2)  # Encore supprimables (MESSAGE_DELETE_WINDOW)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{"id": u, "email": f"bench{u}@cif", "password": "x", "pseudo": f"Bench{u}"} for u in (1, 2)])
+        conn.execute(insert(Room), [{"id": r + 1, "name": f"Salon {r + 1}", "description": "bench", "icon": 1} for r in range(rooms)])
+        conn.execute(insert(user_room), [{"user_id": u, "room_id": r + 1} for u in (1, 2) for r in range(rooms)])
+        conn.execute(
+            insert(Message),
+            [
+                {
+                    "content": f"message {i} " + "du texte " * 10,
+                    "author_id": 2,
+                    "author_display_name": "Bench2",
+                    "room_id": r + 1,
+                    "created_at": start + timedelta(seconds=i),
+                }
+                for r in range(rooms)
+                for i in range(messages)
+            ],
+        )
+    with sessionmaker(bind=engine)() as db:
+        db_inter.rebuild_room_stats(db)
+    return engine
+
+
+def write_changes(engine, rooms, changes, rng):
+    """K changements par les fonctions de crud.py (qui alimentent le journal) : 70 % new, 10 % edit / delete / react."""
+    with sessionmaker(bind=engine)() as db:
+        fresh = []
+        for _ in range(changes):
+            room_id, roll = rng.randint(1, rooms), rng.random()
+            if roll < 0.1 and fresh:
+                db_inter.edit_message_func(db, rng.choice(fresh), EditMessageSchema(content="modifié pendant l'absence"), 2)
+            elif roll < 0.2 and fresh:
+                db_inter.delete_message_func(db, fresh.pop(rng.randrange(len(fresh))), 2)
+            elif roll < 0.3 and fresh:
+                db_inter.reagir(db, rng.choice(fresh), ReactionCreateSchema(emoji=rng.choice(["👍", "❤️", "😂"])), 2)
+            else:
+                fresh.append(db_inter.create_message(db, room_id, MessageCreate(content="nouveau " + "texte " * rng.randint(1, 20)), 2).id)
+
+
+async def reconnect(headers, rooms, since, queries):
+    """(octets, requêtes HTTP, requêtes SQL, ms) pour chaque façon de rattraper."""
+    results = {}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        queries.clear()
+        start = time.perf_counter()
+        size = requests = 0
+        r = await client.get("/user/rooms", headers=headers)
+        size, requests = size + len(r.content), requests + 1
+        for room in r.json():
+            page = await client.get(f"/room/{room['id']}/messages", headers=headers)
+            size, requests = size + len(page.content), requests + 1
+        results["rechargement"] = (size, requests, len(queries), (time.perf_counter() - start) * 1000)
+
+        queries.clear()
+        start = time.perf_counter()
+        size = requests = 0
+        cursor, more = since, True
+        while more:
+            r = await client.get(f"/sync?since={cursor}", headers=headers)
+            assert r.status_code == 200 and not r.json()["reset"], r.text
+            batch = r.json()
+            cursor, more = batch["seq"], batch["has_more"]
+            size, requests = size + len(r.content), requests + 1
+        results["/sync"] = (size, requests, len(queries), (time.perf_counter() - start) * 1000)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rooms", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=500, help="messages par salon")
+    parser.add_argument("--changes", type=int, nargs="+", default=[0, 10, 100, 1000], help="changements pendant l'absence")
+    args = parser.parse_args()
+
+    headers = {"Authorization": "Bearer " + create_access_token(data={"sub": "1", "pseudo": "Bench1", "role": "user", "email": "bench1@cif", "ver": 0})}
+    print(f"{args.rooms} salons de {args.messages} messages\n")
+    print(f"{'changements':>11} {'méthode':<13} {'octets':>9} {'HTTP':>5} {'SQL':>5} {'ms':>8}")
+    for changes in args.changes:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.db")
+            engine = seed(path, args.rooms, args.messages)
+            async_engine = use_database(engine, path)
+            queries = []
+            event.listen(async_engine.sync_engine, "before_cursor_execute", lambda *a: queries.append(1))
+
+            write_changes(engine, args.rooms, changes, random.Random(changes))
+            # Curseur pris juste avant l'absence : le journal ne contient que les changements
+            results = asyncio.run(reconnect(headers, args.rooms, 0, queries))
+            for name, (size, requests, sql, ms) in results.items():
+                print(f"{changes:>11} {name:<13} {size:>9} {requests:>5} {sql:>5} {ms:>8.1f}")
+            asyncio.run(async_engine.dispose())
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
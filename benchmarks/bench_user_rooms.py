@@ -0,0 +1,76 @@
+"""
+Benchmark : coût de `get_user_rooms` selon le nombre de salons de l'utilisateur.
+
+Compte les requêtes SQL émises et vérifie que ce nombre reste constant
+(plus de boucle N+1 par salon), puis mesure le temps moyen d'un appel.
+
+Usage (depuis la racine du dépôt) :
+    python -m benchmarks.bench_user_rooms --rooms 1 10 30 100
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from database.models import Base, User, Room, Message, user_room, enable_foreign_keys_configure_sqlite
+import database.crud as db_inter
+
+
+def build_db(path, rooms, messages_per_room):
+    engine = create_engine(f"sqlite:///{path}")
+    event.listen(engine, "connect", enable_foreign_keys_configure_sqlite)
+    Base.metadata.create_all(engine)
+    with sessionmaker(bind=engine)() as db:
+        db.add(User(id=1, email="bench@cif", password="x", pseudo="Bench"))
+        for r in range(rooms):
+            db.add(Room(id=r + 1, name=f"Salon {r + 1}", description="bench", icon=1, created_by=1))
+        db.flush()
+        db.execute(user_room.insert(), [{"user_id": 1, "room_id": r + 1, "last_read_message_id": 0} for r in range(rooms)])
+        db.add_all(
+            Message(content=f"message {i}", author_id=1, room_id=r + 1, author_display_name="Bench", message_type="chat")
+            for r in range(rooms)
+            for i in range(messages_per_room)
+        )
+        db.commit()
+        db_inter.rebuild_room_stats(db)
+    return engine
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rooms", type=int, nargs="+", default=[1, 10, 30, 100])
+    parser.add_argument("--messages", type=int, default=200, help="Messages par salon")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    counts = set()
+    for rooms in args.rooms:
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = build_db(os.path.join(tmp, "bench.db"), rooms, args.messages)
+            statements = []
+            event.listen(engine, "before_cursor_execute", lambda *a: statements.append(a[2]))
+
+            with sessionmaker(bind=engine)() as db:
+                result = db_inter.get_user_rooms(db, 1)
+                assert len(result) == rooms
+                queries = len(statements)
+
+                start = time.perf_counter()
+                for _ in range(args.repeat):
+                    db_inter.get_user_rooms(db, 1)
+                elapsed = (time.perf_counter() - start) / args.repeat
+
+            engine.dispose()
+            counts.add(queries)
+            print(f"{rooms:4d} salons | {queries} requête(s) SQL | {elapsed * 1000:7.2f} ms par appel")
+
+    assert len(counts) == 1, f"Le nombre de requêtes dépend du nombre de salons : {sorted(counts)}"
+    print("OK : nombre de requêtes constant")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark : écritures concurrentes avec et sans la file d'écriture (group commit).
+
+"direct" : chaque envoi ouvre sa session et fait son propre commit (crud_async.insert_message + commit),
+les écrivains se disputent le verrou d'écriture de SQLite.
+"queue"  : les envois passent par WriteQueue (write_queue.py), une transaction par lot.
+
+Chaque envoi relit ensuite le message (format compact), comme la route POST /room/{id}/messages.
+
+Usage (depuis la racine du dépôt) :
+    python -m benchmarks.bench_write_queue --senders 100 --messages 20
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from sqlalchemy import create_engine, event, select, func
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from database.models import Base, User, Room, Message, RoomStats, user_room, enable_foreign_keys_configure_sqlite
+from database.shemas import MessageCreate
+import database.crud_async as db_async
+from write_queue import WriteQueue
+from benchmarks.bench_ws_latency import prepare_db, percentile
+
+
+async def run(mode, path, senders, messages):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}", connect_args={"timeout": 15})
+    event.listen(engine.sync_engine, "connect", enable_foreign_keys_configure_sqlite)
+    Session = async_sessionmaker(bind=engine, expire_on_commit=False)
+    queue = WriteQueue(session_factory=Session)
+    queue.start()
+
+    latencies = []
+    errors = 0
+
+    async def sender(user_id):
+        nonlocal errors
+        for i in range(messages):
+            start = time.perf_counter()
+            try:
+                async with Session() as db:
+                    data = MessageCreate(content=f"{mode} {user_id} {i}")
+                    if mode == "direct":
+                        msg_id = await db_async.insert_message(db, 1, data, user_id)
+                        await db.commit()
+                    else:
+                        msg_id = await queue.submit(db_async.insert_message, 1, data, user_id)
+                    msg = await db_async.get_message_compact(db, msg_id)
+                    assert msg["content"] == data.content
+                latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                errors += 1
+                print(f"[{mode}] erreur : {e}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(sender(u + 1) for u in range(senders)))
+    elapsed = time.perf_counter() - start
+    await queue.stop()
+    await engine.dispose()
+    return elapsed, latencies, errors, queue.metrics()
+
+
+def check_consistency(path, expected):
+    """Les projections mises à jour dans les lots doivent rester cohérentes."""
+    engine = create_engine(f"sqlite:///{path}")
+    with sessionmaker(bind=engine)() as db:
+        count = db.execute(select(func.count()).select_from(Message).where(Message.message_type == "chat")).scalar_one()
+        stats = db.get(RoomStats, 1)
+        last_id = db.execute(select(func.max(Message.id))).scalar_one()
+        unread = db.execute(select(func.sum(user_room.c.unread_count))).scalar_one()
+    assert count == expected, (count, expected)
+    assert stats.chat_count == count and stats.last_message_id == last_id
+    return unread
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--senders", type=int, default=100)
+    parser.add_argument("--messages", type=int, default=20)
+    args = parser.parse_args()
+    total = args.senders * args.messages
+
+    print(f"{args.senders} envois concurrents x {args.messages} messages\n")
+    print(f"{'mode':<8} {'msg/s':>8} {'p50 (ms)':>10} {'p99 (ms)':>10} {'erreurs':>8} {'lots':>6} {'lot moyen':>10}")
+    for mode in ("direct", "queue"):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.db")
+            prepare_db(path, args.senders).dispose()
+            elapsed, latencies, errors, metrics = asyncio.run(run(mode, path, args.senders, args.messages))
+            check_consistency(path, total - errors)
+            batches = metrics["batches"] if mode == "queue" else total - errors
+            avg = metrics["avg_batch_size"] if mode == "queue" else 1
+            print(
+                f"{mode:<8} {len(latencies) / elapsed:>8.0f} {percentile(latencies, 0.5):>10.1f} "
+                f"{percentile(latencies, 0.99):>10.1f} {errors:>8} {batches:>6} {avg:>10}"
+            )
+            if mode == "queue":
+                assert errors == 0
+                print(f"\nmétriques : {metrics}")
+
+
+if __name__ == "__main__":
+    main()
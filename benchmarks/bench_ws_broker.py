@@ -0,0 +1,206 @@
+"""
+Benchmark : WebSockets répartis sur plusieurs workers uvicorn (broker.py, CIF_BROKER_URL).
+
+W processus uvicorn (un port chacun, même base SQLite) ; C sessions /ws abonnées au salon 1, réparties entre eux.
+M messages sont postés à tour de rôle sur chaque worker, puis on compte les trames reçues
+et le délai POST -> réception.
+"sans broker" : InProcessBroker, chaque worker ne livre qu'à ses propres sockets ;
+"broker"      : RedisBroker branché sur --redis, ou à défaut sur un serveur de remplacement
+                (RespStandIn, pub/sub RESP minimal lancé par le benchmark).
+Enfin un client quitte le worker 0 et reprend sur le worker 1 avec l'époque du premier :
+repli attendu sur la base ("resync"), les seq étant propres à chaque worker.
+
+Usage (depuis la racine du dépôt) :
+    python -m benchmarks.bench_ws_broker --workers 2 --clients 200 --messages 50
+    python -m benchmarks.bench_ws_broker --redis redis://127.0.0.1:6379
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+import orjson
+import websockets
+
+from broker import read_reply
+from security import create_access_token
+from benchmarks.bench_user_rooms import build_db
+from benchmarks.bench_ws_latency import percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def resp(*items) -> bytes:
+    """Tableau RESP de chaînes binaires et d'entiers."""
+    parts = [b"*%d\r\n" % len(items)]
+    for item in items:
+        parts.append(b":%d\r\n" % item if isinstance(item, int) else b"$%d\r\n%s\r\n" % (len(item), item))
+    return b"".join(parts)
+
+
+class RespStandIn:
+    """Serveur pub/sub minimal parlant RESP (SUBSCRIBE, UNSUBSCRIBE, PUBLISH, PING) : remplace redis-server."""
+
+    def __init__(self):
+        self.subscribers = defaultdict(set)
+        self.published = 0
+
+    async def handle(self, reader, writer):
+        channels = set()
+        try:
+            while True:
+                command = await read_reply(reader)
+                name = command[0].upper()
+                if name == b"SUBSCRIBE":
+                    for channel in command[1:]:
+                        channels.add(channel)
+                        self.subscribers[channel].add(writer)
+                        writer.write(resp(b"subscribe", channel, len(channels)))
+                elif name == b"UNSUBSCRIBE":
+                    for channel in command[1:]:
+                        channels.discard(channel)
+                        self.subscribers[channel].discard(writer)
+                        writer.write(resp(b"unsubscribe", channel, len(channels)))
+                elif name == b"PUBLISH":
+                    channel, data = command[1], command[2]
+                    receivers = self.subscribers.get(channel, ())
+                    frame = resp(b"message", channel, data)
+                    for receiver in receivers:
+                        receiver.write(frame)
+                    writer.write(b":%d\r\n" % len(receivers))
+                    self.published += 1
+                elif name == b"PING":
+                    writer.write(b"+PONG\r\n")
+                else:
+                    writer.write(b"-ERR unknown command\r\n")
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            for channel in channels:
+                self.subscribers[channel].discard(writer)
+            writer.close()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_workers(count, db_path, broker_url):
+    ports = [free_port() for _ in range(count)]
+    env = dict(os.environ, CIF_DATABASE_URL=f"sqlite:///{db_path}", CIF_BROKER_URL=broker_url)
+    processes = [
+        subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"], cwd=ROOT, env=env)
+        for port in ports
+    ]
+    return ports, processes
+
+
+async def wait_ready(ports):
+    async with httpx.AsyncClient() as client:
+        for port in ports:
+            for _ in range(200):
+                try:
+                    await client.get(f"http://127.0.0.1:{port}/docs")
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+
+
+async def subscribe(port, token, **resume):
+    """Session /ws abonnée au salon 1 : (socket, première trame reçue)."""
+    ws = await websockets.connect(f"ws://127.0.0.1:{port}/ws?token={token}")
+    await ws.send(orjson.dumps(dict(resume, action="subscribe", room_id=1)).decode())
+    return ws, orjson.loads(await ws.recv())
+
+
+async def scenario(label, ports, args, token):
+    headers = {"Authorization": f"Bearer {token}"}
+    received = defaultdict(list)  # contenu -> heures de réception
+    clients = [await subscribe(ports[i % len(ports)], token) for i in range(args.clients)]
+
+    async def read(ws):
+        try:
+            async for data in ws:
+                frame = orjson.loads(data)
+                if "seq" in frame and "content" in frame:  # Trames du salon, pas les aperçus "room_summary"
+                    received[frame["content"]].append(time.perf_counter())
+        except websockets.ConnectionClosed:
+            pass
+
+    readers = [asyncio.create_task(read(ws)) for ws, _ in clients]
+    sent_at = {}
+    async with httpx.AsyncClient() as http:
+        for i in range(args.messages):
+            content = f"{label} {i}"
+            sent_at[content] = time.perf_counter()
+            r = await http.post(f"http://127.0.0.1:{ports[i % len(ports)]}/room/1/messages", json={"content": content}, headers=headers)
+            assert r.status_code == 201, r.text
+            await asyncio.sleep(1 / args.rate)
+    await asyncio.sleep(1)
+
+    delays = [t - sent_at[content] for content, times in received.items() for t in times]
+    expected = args.clients * args.messages
+    print(f"{label:<12} {len(ports):>7} {len(delays):>8}/{expected:<8} {percentile(delays, 0.50):>8.1f} {percentile(delays, 0.99):>8.1f}")
+
+    # Reprise sur un autre worker avec l'époque du premier
+    if len(ports) > 1:
+        ws, hello = clients[0]
+        other, first = await subscribe(ports[1], token, resume_from=hello["seq"], epoch=hello["epoch"], since=hello["since"])
+        await other.close()
+        print(f"{'':<12} reprise worker 0 -> 1 : {first['action']} ({len(first.get('messages', []))} messages rattrapés)")
+
+    for ws, _ in clients:
+        await ws.close()
+    await asyncio.gather(*readers)
+
+
+async def run(args):
+    token = create_access_token(data={"sub": "1", "pseudo": "Bench", "role": "user", "email": "bench@cif", "ver": 0})
+    stand_in, server = RespStandIn(), None
+    broker_url = args.redis
+    if not broker_url:
+        server = await asyncio.start_server(stand_in.handle, "127.0.0.1", 0)
+        broker_url = f"redis://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+
+    print(f"{args.clients} clients, {args.messages} messages à {args.rate:g}/s ; broker : {args.redis or 'RespStandIn'}\n")
+    print(f"{'mode':<12} {'workers':>7} {'trames reçues':>17} {'p50 ms':>8} {'p99 ms':>8}")
+    for label, url in (("sans broker", ""), ("broker", broker_url)):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.db")
+            build_db(path, 1, 10).dispose()
+            ports, processes = start_workers(args.workers, path, url)
+            try:
+                await wait_ready(ports)
+                await scenario(label, ports, args, token)
+            finally:
+                for process in processes:
+                    process.terminate()
+                    process.wait()
+                await asyncio.sleep(0.2)  # Le serveur de remplacement voit les connexions se fermer
+    if server is not None:
+        server.close()
+        print(f"\nRespStandIn : {stand_in.published} publications")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=50)
+    parser.add_argument("--rate", type=float, default=20, help="messages postés par seconde")
+    parser.add_argument("--redis", default="", help="URL d'un vrai serveur Redis / Valkey (sinon RespStandIn)")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Benchmark : diffusion WebSocket vers un grand salon avec quelques clients lents (websocket_manager.py).
+
+N sockets dans le salon 1, dont une part de clients lents (téléphone en 3G : chaque envoi
+prend --slow-ms) répartis au hasard dans la liste. M messages sont diffusés à --rate par
+seconde, chacun depuis sa propre tâche (comme des requêtes POST concurrentes).
+"séquentiel" : ancien envoi, `await send_text` socket après socket ;
+"files"      : ConnectionManager, une file bornée et une tâche d'écriture par connexion.
+Les sockets rapides ne rendent pas la main pendant l'envoi (buffer TCP jamais plein), ce qui
+avantage l'envoi séquentiel : seuls les clients lents le ralentissent.
+
+Usage (depuis la racine du dépôt) :
+    python -m benchmarks.bench_ws_fanout --sockets 5000 --slow 0.01 --messages 100 --rate 20
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+from content_negotiation import encode_frame
+from websocket_manager import ConnectionManager, WS_SEND_QUEUE, WS_SEND_TIMEOUT
+from benchmarks.bench_ws_latency import percentile
+
+
+class FakeSocket:
+    """Client simulé : note l'heure de réception de chaque trame ; un client lent met `delay` s par trame."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.received = []
+        self.closed = None
+
+    async def send_text(self, data):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.received.append((data, time.perf_counter()))
+
+    async def close(self, code=1000, reason=None):
+        self.closed = code
+
+
+async def legacy_broadcast(connections, message):
+    """Ancien send_to_all : sérialisé une fois, envoyé socket après socket."""
+    frame = encode_frame(message)
+    for connection in connections:
+        await connection.send_text(frame)
+
+
+async def run(mode, args):
+    rng = random.Random(42)
+    slow_count = int(args.sockets * args.slow)
+    sockets = [FakeSocket(args.slow_ms / 1000) for _ in range(slow_count)] + [FakeSocket() for _ in range(args.sockets - slow_count)]
+    rng.shuffle(sockets)
+    manager = ConnectionManager(send_queue=args.queue, send_timeout=args.timeout)
+    for socket in sockets:
+        manager.add_room_connection(socket, 1).start()
+
+    sent_at = {}
+    call_ms = []
+
+    async def broadcast(i):
+        message = {"id": i, "content": f"message {i} " + "du texte " * 20, "author_display_name": "Bench"}
+        start = time.perf_counter()
+        if mode == "séquentiel":
+            sent_at[encode_frame(message)] = start
+            await legacy_broadcast(list(sockets), message)
+        else:
+            await manager.broadcast_to_room(1, message)
+            sent_at[encode_frame(dict(message, seq=manager.room_seqs[1]))] = start
+        call_ms.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    tasks = []
+    for i in range(args.messages):
+        tasks.append(asyncio.create_task(broadcast(i)))
+        await asyncio.sleep(1 / args.rate)
+    await asyncio.gather(*tasks)
+    # Fin de la livraison : tout est reçu, ou la connexion a été évincée
+    while any(len(outbox) or outbox.sending_since is not None for outbox in manager.outboxes.values()):
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - start
+
+    fast = [t - sent_at[data] for s in sockets if not s.delay for data, t in s.received]
+    slow = [t - sent_at[data] for s in sockets if s.delay for data, t in s.received]
+    lost = args.messages * len(sockets) - len(fast) - len(slow)
+    print(
+        f"{mode:<11} | rapides p50 {percentile(fast, 0.50):8.1f}  p99 {percentile(fast, 0.99):8.1f}  max {percentile(fast, 1):8.1f} ms"
+        f" | lents p99 {percentile(slow, 0.99) if slow else 0:8.1f} ms"
+        f" | diffusion p50 {percentile([ms / 1000 for ms in call_ms], 0.50):7.1f}  max {max(call_ms):7.1f} ms"
+        f" | évincés {sum(1 for s in sockets if s.closed)} ({dict(manager.evictions)}), non livrées {lost} | {elapsed:5.1f} s"
+    )
+    for outbox in list(manager.outboxes.values()):
+        outbox.close()
+    manager.watchdog.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sockets", type=int, default=5000)
+    parser.add_argument("--slow", type=float, default=0.01, help="part de clients lents")
+    parser.add_argument("--slow-ms", type=float, default=200, help="durée d'un envoi à un client lent (ms)")
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=20, help="messages diffusés par seconde")
+    parser.add_argument("--queue", type=int, default=WS_SEND_QUEUE, help="CIF_WS_SEND_QUEUE")
+    parser.add_argument("--timeout", type=float, default=WS_SEND_TIMEOUT, help="CIF_WS_SEND_TIMEOUT (s)")
+    args = parser.parse_args()
+
+    print(f"{args.sockets} sockets dont {int(args.sockets * args.slow)} lents ({args.slow_ms:g} ms/trame), {args.messages} messages à {args.rate:g}/s\n")
+    for mode in ("séquentiel", "files"):
+        asyncio.run(run(mode, args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Benchmark : latence de diffusion WebSocket pendant des envois concurrents.
+
+Compare l'ancien chemin (crud synchrone appelé dans une route `async def`, qui
+bloque la boucle d'événements à chaque commit) au nouveau (crud_async + aiosqlite).
+
+Usage (depuis la racine du dépôt) :
+    python -m benchmarks.bench_ws_latency --senders 50 --listeners 200
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from database.models import Base, User, Room, user_room, enable_foreign_keys_configure_sqlite
+from database.shemas import MessageCreate, MessageSchema
+import database.crud as db_inter
+import database.crud_async as db_async
+from websocket_manager import ConnectionManager
+
+
+class FakeSocket:
+    """Simule un client WebSocket : enregistre l'heure de réception de chaque trame."""
+
+    def __init__(self):
+        self.received = {}
+
+    async def send_json(self, data):
+        self.received.setdefault(data.get("bench_id"), time.perf_counter())
+
+    async def send_text(self, data):
+        await self.send_json(json.loads(data))
+
+
+def prepare_db(path, senders):
+    engine = create_engine(f"sqlite:///{path}")
+    event.listen(engine, "connect", enable_foreign_keys_configure_sqlite)
+    Base.metadata.create_all(engine)
+    with sessionmaker(bind=engine)() as db:
+        db.add(Room(id=1, name="Salon Général", description="bench", icon=1))
+        for i in range(senders):
+            db.add(User(id=i + 1, email=f"bench{i}@cif", password="x", pseudo=f"Bench{i}"))
+        db.flush()
+        db.execute(user_room.insert(), [{"user_id": i + 1, "room_id": 1} for i in range(senders)])
+        db.commit()
+    return engine
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] * 1000
+
+
+async def run(mode, path, senders, listeners, rounds):
+    manager = ConnectionManager()
+    sockets = [FakeSocket() for _ in range(listeners)]
+    for socket in sockets:
+        manager.add_room_connection(socket, 1).start()
+
+    if mode == "sync":
+        engine = create_engine(f"sqlite:///{path}", connect_args={"timeout": 15})
+        event.listen(engine, "connect", enable_foreign_keys_configure_sqlite)
+        Session = sessionmaker(bind=engine)
+    else:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{path}", connect_args={"timeout": 15})
+        event.listen(engine.sync_engine, "connect", enable_foreign_keys_configure_sqlite)
+        Session = async_sessionmaker(bind=engine, expire_on_commit=False)
+
+    sent_at = {}
+    heartbeat_lags = []
+    running = True
+
+    async def heartbeat():
+        # Trame "témoin" diffusée toutes les 5 ms : mesure le gel de la boucle
+        n = 0
+        while running:
+            expected = time.perf_counter() + 0.005
+            await asyncio.sleep(0.005)
+            heartbeat_lags.append(time.perf_counter() - expected)
+            n += 1
+            await manager.broadcast_to_room(1, {"bench_id": f"hb{n}"})
+
+    async def send(author_id, i, wave_start):
+        # La latence est mesurée depuis le lancement de la vague (l'envoi a été demandé à cet instant)
+        bench_id = f"{author_id}-{i}"
+        sent_at[bench_id] = wave_start
+        data = MessageCreate(content=f"message {i}")
+        if mode == "sync":
+            with Session() as db:
+                msg = db_inter.create_message(db, 1, data, author_id)
+                msg_dict = MessageSchema.model_validate(msg).model_dump(mode="json")
+        else:
+            async with Session() as db:
+                msg = await db_async.create_message(db, 1, data, author_id)
+                msg_dict = MessageSchema.model_validate(msg).model_dump(mode="json")
+        msg_dict["bench_id"] = bench_id
+        await manager.broadcast_to_room(1, msg_dict)
+
+    hb = asyncio.create_task(heartbeat())
+    start = time.perf_counter()
+    for i in range(rounds):
+        wave_start = time.perf_counter()
+        await asyncio.gather(*(send(a + 1, i, wave_start) for a in range(senders)))
+    elapsed = time.perf_counter() - start
+    running = False
+    await hb
+    while any(len(outbox) for outbox in manager.outboxes.values()):
+        await asyncio.sleep(0.001)  # Trames encore dans les files d'envoi
+
+    latencies = [s.received[k] - t0 for s in sockets for k, t0 in sent_at.items()]
+    if mode == "sync":
+        engine.dispose()
+    else:
+        await engine.dispose()
+
+    print(
+        f"{mode:>5} | {len(sent_at) / elapsed:7.0f} msg/s"
+        f" | livraison p50 {percentile(latencies, 0.50):7.1f} ms  p99 {percentile(latencies, 0.99):7.1f} ms"
+        f" | gel de la boucle max {max(heartbeat_lags) * 1000:6.1f} ms  moyen {statistics.mean(heartbeat_lags) * 1000:5.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--senders", type=int, default=20, help="Envois concurrents par vague")
+    parser.add_argument("--listeners", type=int, default=100, help="Sockets abonnés au salon")
+    parser.add_argument("--rounds", type=int, default=5, help="Nombre de vagues d'envois")
+    args = parser.parse_args()
+
+    for mode in ("sync", "async"):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.db")
+            prepare_db(path, args.senders).dispose()
+            asyncio.run(run(mode, path, args.senders, args.listeners, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
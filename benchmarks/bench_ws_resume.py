@@ -0,0 +1,98 @@
+"""
+Benchmark : reprise d'un WebSocket de salon après une coupure (websocket_manager.py).
+
+Un client connecté au salon 1 perd sa connexion ; pendant ce temps K messages sont postés.
+Trois façons de rattraper, pour chaque K :
+"tampon"       : abonnement /ws avec resume_from=<seq> et epoch=<époque> : trames renvoyées depuis la mémoire
+                 (tant que K <= CIF_WS_REPLAY_BUFFER, sinon repli sur la base) ;
+"base"         : même reprise après un redémarrage (époque différente) : lot "resync" lu
+                 dans le journal `events` ;
+"rechargement" : ancien comportement, le client rouvre le salon (GET /room/1/messages).
+Les temps passent par TestClient (un aller-retour entre threads par trame reçue) : ils
+surestiment le coût par trame du "tampon" ; les octets et le nombre de trames sont exacts.
+
+Usage (depuis la racine du dépôt) :
+    python -m benchmarks.bench_ws_resume --missed 10 100 250 1000 --repeat 20
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from security import create_access_token
+from main import app
+from write_queue import write_queue
+from websocket_manager import manager, WS_REPLAY_BUFFER
+from benchmarks.bench_user_rooms import build_db
+from benchmarks.bench_login import use_database
+
+
+def resume(client, url, subscribe, timed_frames):
+    """Se reconnecte, se réabonne et lit jusqu'à la trame "hello" ; renvoie (ms, octets, trames)."""
+    start = time.perf_counter()
+    size = frames = 0
+    with client.websocket_connect(url) as ws:
+        ws.send_text(json.dumps(subscribe))
+        while True:
+            data = ws.receive_text()
+            size, frames = size + len(data), frames + 1
+            if '"action":"hello"' in data:
+                break
+    timed_frames.append((time.perf_counter() - start) * 1000)
+    return size, frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--missed", type=int, nargs="+", default=[10, 100, 250, 1000], help="messages manqués pendant la coupure")
+    parser.add_argument("--history", type=int, default=500, help="messages déjà dans le salon")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    token = create_access_token(data={"sub": "1", "pseudo": "Bench", "role": "user", "email": "bench@cif", "ver": 0})
+    headers = {"Authorization": "Bearer " + token}
+    url = f"/ws?token={token}"
+    print(f"tampon : {WS_REPLAY_BUFFER} trames par salon ; {args.repeat} reconnexions par mesure\n")
+    print(f"{'manqués':>8} {'méthode':<13} {'source':<8} {'trames':>7} {'octets':>9} {'ms':>8}")
+    for missed in args.missed:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.db")
+            engine = build_db(path, 1, args.history)
+            async_engine = use_database(engine, path)
+            factory = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+            write_queue.session_factory = manager.session_factory = factory
+
+            with TestClient(app) as client:
+                with client.websocket_connect(url) as ws:
+                    ws.send_json({"action": "subscribe", "room_id": 1})
+                    hello = ws.receive_json()
+                for i in range(missed):
+                    r = client.post("/room/1/messages", json={"content": f"pendant la coupure {i}"}, headers=headers)
+                    assert r.status_code == 201, r.text
+
+                subscribe = {"action": "subscribe", "room_id": 1, "resume_from": hello["seq"], "since": hello["since"]}
+                for name, epoch in (("tampon", hello["epoch"]), ("base", "redémarrage")):
+                    before = manager.metrics()
+                    timings = []
+                    for _ in range(args.repeat):
+                        size, frames = resume(client, url, dict(subscribe, epoch=epoch), timings)
+                    after = manager.metrics()
+                    source = "mémoire" if after["replays"] > before["replays"] else "base"
+                    print(f"{missed:>8} {name:<13} {source:<8} {frames:>7} {size:>9} {sorted(timings)[len(timings) // 2]:>8.2f}")
+
+                timings = []
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    r = client.get("/room/1/messages", headers=headers)
+                    timings.append((time.perf_counter() - start) * 1000)
+                print(f"{missed:>8} {'rechargement':<13} {'base':<8} {'':>7} {len(r.content):>9} {sorted(timings)[len(timings) // 2]:>8.2f}")
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Benchmark : CPU d'une diffusion WebSocket selon la taille du salon (sérialisation unique).
+
+Sockets Starlette réelles branchées sur un `send` ASGI vide : seul le coût côté application
+est mesuré (temps CPU, time.process_time), pas le réseau.
+"send_json"  : ancien envoi, `await websocket.send_json(message)` par socket (un json.dumps chacun) ;
+"une fois"   : ConnectionManager, une sérialisation par format posée dans la file de chaque socket ;
+"une fois mp": idem avec la moitié des clients en MessagePack (deux sérialisations).
+Puis la reprise de R clients après une coupure (100 trames manquées chacun) : trames
+resérialisées pour chaque client, contre celles gardées sérialisées dans le tampon.
+
+Usage (depuis la racine du dépôt) :
+    python -m benchmarks.bench_ws_serialize --sizes 10 100 1000 2000 5000
+"""
+
+import argparse
+import asyncio
+import time
+
+from starlette.websockets import WebSocket, WebSocketState
+
+import websocket_manager
+from content_negotiation import encode_frame
+from websocket_manager import ConnectionManager
+from benchmarks.bench_json import history_page
+
+
+async def null_send(message):
+    pass
+
+
+def open_socket():
+    websocket = WebSocket({"type": "websocket", "path": "/ws/1", "headers": [], "query_string": b""}, receive=None, send=null_send)
+    websocket.application_state = WebSocketState.CONNECTED
+    return websocket
+
+
+class CountingEncoder:
+    """Compte les appels à encode_frame faits par le manager."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, message, frame_format="json"):
+        self.calls += 1
+        return encode_frame(message, frame_format)
+
+
+async def drain(manager):
+    while any(len(outbox) for outbox in manager.outboxes.values()):
+        await asyncio.sleep(0)
+
+
+async def per_broadcast(mode, size, message, rounds):
+    """(ms CPU par diffusion, sérialisations par diffusion)"""
+    sockets = [open_socket() for _ in range(size)]
+    manager = ConnectionManager()
+    encoder = websocket_manager.encode_frame = CountingEncoder()
+    for i, socket in enumerate(sockets):
+        manager.add_room_connection(socket, 1, "msgpack" if mode == "une fois mp" and i % 2 else "json").start()
+    await asyncio.sleep(0)
+
+    start = time.process_time()
+    for _ in range(rounds):
+        if mode == "send_json":
+            for socket in sockets:
+                await socket.send_json(message)
+        else:
+            await manager.broadcast_to_room(1, message)
+            await drain(manager)
+    cpu = (time.process_time() - start) / rounds * 1000
+
+    for outbox in list(manager.outboxes.values()):
+        outbox.close()
+    manager.watchdog.cancel()
+    return cpu, (size if mode == "send_json" else encoder.calls / rounds)
+
+
+def replay_storm(clients, missed, message):
+    """ms CPU pour préparer les trames de reprise de `clients` clients (sans, puis avec le tampon sérialisé)."""
+    manager = ConnectionManager()
+    for _ in range(missed):
+        asyncio.run(manager.broadcast_to_room(1, message))
+    entries = manager.missed_frames(1, 0, manager.epoch)
+    for frame, frames in entries:
+        manager.encoded(frame, frames, "json")  # Sérialisé lors de la diffusion (au moins un client connecté)
+
+    start = time.process_time()
+    for _ in range(clients):
+        [encode_frame(frame, "json") for frame, _ in entries]
+    before = (time.process_time() - start) * 1000
+
+    start = time.process_time()
+    for _ in range(clients):
+        [manager.encoded(frame, frames, "json") for frame, frames in entries]
+    after = (time.process_time() - start) * 1000
+    return before, after
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 2000, 5000], help="sockets dans le salon")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--clients", type=int, nargs="+", default=[100, 1000], help="clients qui reprennent après une coupure")
+    args = parser.parse_args()
+
+    message = dict(history_page(4)[3], action="new")
+    print(f"trame \"nouveau message\" de {len(encode_frame(message))} octets, {args.rounds} diffusions par mesure\n")
+    print(f"{'sockets':>8} {'méthode':<12} {'ms CPU/diffusion':>17} {'µs/socket':>10} {'sérialisations':>15}")
+    for size in args.sizes:
+        for mode in ("send_json", "une fois", "une fois mp"):
+            cpu, encodes = asyncio.run(per_broadcast(mode, size, message, args.rounds))
+            print(f"{size:>8} {mode:<12} {cpu:>17.2f} {cpu / size * 1000:>10.2f} {encodes:>15g}")
+    websocket_manager.encode_frame = encode_frame
+
+    print(f"\n{'reprises':>8} {'resérialisé (ms)':>17} {'tampon (ms)':>12}")
+    for clients in args.clients:
+        before, after = replay_storm(clients, 100, message)
+        print(f"{clients:>8} {before:>17.1f} {after:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
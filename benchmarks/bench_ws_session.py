@@ -0,0 +1,123 @@
+"""
+Benchmark : une connexion /ws multiplexée par client contre une socket par vue (main.py, /ws).
+
+U utilisateurs parcourent chacun K salons (serveur uvicorn réel, base SQLite temporaire).
+"socket par vue" : ancien client, une socket pour les signaux puis une par ChatView,
+                   jamais refermée (les routes /ws/{room_id} et /ws/user/{id} n'existent
+                   plus : chaque socket est ici une session /ws abonnée à un seul salon) ;
+"session /ws"    : une connexion authentifiée, trame "subscribe" à l'entrée d'un salon,
+                   "unsubscribe" à la sortie.
+On mesure le temps d'entrée dans un salon (jusqu'à la trame "hello"), les connexions
+tenues par le serveur à la fin (/metrics/websockets) et la mémoire du processus serveur.
+
+Usage (depuis la racine du dépôt) :
+    python -m benchmarks.bench_ws_session --users 50 --rooms 20
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import websockets
+from sqlalchemy import create_engine, event, insert
+
+from database.models import Base, User, Room, user_room, enable_foreign_keys_configure_sqlite
+from security import create_access_token
+from benchmarks.bench_ws_broker import ROOT, free_port, wait_ready
+from benchmarks.bench_ws_latency import percentile
+
+
+def seed(path, users, rooms):
+    engine = create_engine(f"sqlite:///{path}")
+    event.listen(engine, "connect", enable_foreign_keys_configure_sqlite)
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{"id": u, "email": f"bench{u}@cif", "password": "x", "pseudo": f"Bench{u}"} for u in range(1, users + 1)])
+        conn.execute(insert(Room), [{"id": r, "name": f"Salon {r}", "description": "bench", "icon": 1} for r in range(1, rooms + 1)])
+        conn.execute(insert(user_room), [{"user_id": u, "room_id": r} for u in range(1, users + 1) for r in range(1, rooms + 1)])
+    engine.dispose()
+
+
+def token(user_id):
+    return create_access_token(data={"sub": str(user_id), "pseudo": f"Bench{user_id}", "role": "user", "email": f"bench{user_id}@cif", "ver": 0})
+
+
+async def per_view(base, user_id, rooms, timings):
+    """Ancien client : les sockets de salon restent ouvertes après la navigation."""
+    url = f"{base}/ws?token={token(user_id)}"
+    sockets = [await websockets.connect(url)]
+    for room_id in range(1, rooms + 1):
+        start = time.perf_counter()
+        ws = await websockets.connect(url)
+        await ws.send(json.dumps({"action": "subscribe", "room_id": room_id}))
+        await ws.recv()  # hello
+        timings.append(time.perf_counter() - start)
+        sockets.append(ws)
+    return sockets
+
+
+async def session(base, user_id, rooms, timings):
+    ws = await websockets.connect(f"{base}/ws?token={token(user_id)}")
+    for room_id in range(1, rooms + 1):
+        start = time.perf_counter()
+        await ws.send(json.dumps({"action": "subscribe", "room_id": room_id}))
+        while json.loads(await ws.recv()).get("action") != "hello":
+            pass
+        timings.append(time.perf_counter() - start)
+        await ws.send(json.dumps({"action": "unsubscribe", "room_id": room_id}))
+    return [ws]
+
+
+def rss_mb(pid):
+    with open(f"/proc/{pid}/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith("VmRSS")) / 1024
+
+
+async def run(mode, args, path):
+    port = free_port()
+    env = dict(os.environ, CIF_DATABASE_URL=f"sqlite:///{path}")
+    process = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"], cwd=ROOT, env=env)
+    try:
+        await wait_ready([port])
+        base = f"ws://127.0.0.1:{port}"
+        before = rss_mb(process.pid)
+        timings = []
+        client = per_view if mode == "socket par vue" else session
+        sockets = [ws for user_id in range(1, args.users + 1) for ws in await client(base, user_id, args.rooms, timings)]
+        await asyncio.sleep(0.5)
+        async with httpx.AsyncClient() as http:
+            metrics = (await http.get(f"http://127.0.0.1:{port}/metrics/websockets", headers={"Authorization": f"Bearer {token(1)}"})).json()
+        print(
+            f"{mode:<15} {percentile(timings, 0.50):>9.2f} {percentile(timings, 0.99):>9.2f}"
+            f" {metrics['connections']:>12} {metrics['connections'] / args.users:>10.1f} {rss_mb(process.pid) - before:>9.1f}"
+        )
+        for ws in sockets:
+            await ws.close()
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--rooms", type=int, default=20, help="salons visités par utilisateur")
+    args = parser.parse_args()
+
+    print(f"{args.users} utilisateurs, {args.rooms} salons visités chacun\n")
+    print(f"{'client':<15} {'entrée p50':>9} {'p99 (ms)':>9} {'connexions':>12} {'/ client':>10} {'+RSS Mo':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        seed(path, args.users, args.rooms)
+        for mode in ("socket par vue", "session /ws"):
+            asyncio.run(run(mode, args, path))
+
+
+if __name__ == "__main__":
+    main()
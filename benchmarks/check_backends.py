@@ -0,0 +1,165 @@
+"""
+Vérifie que les chemins propres à chaque SGBD donnent les mêmes résultats (SQLite / PostgreSQL) :
+recherche (FTS5 / tsvector + GIN), curseur de lecture (max / greatest), dernier message par
+salon (row_number / DISTINCT ON) et commandes de maintenance lancées sur une base antérieure
+(colonnes, index et index de recherche manquants).
+
+Le scénario tourne dans un sous-processus par SGBD : IS_SQLITE est fixé à l'import de
+database.models d'après CIF_DATABASE_URL. PostgreSQL n'est vérifié que si CIF_CHECK_PG_URL
+est défini ; cette base est entièrement vidée au début du scénario.
+
+Usage (depuis la racine du dépôt) :
+    python -m benchmarks.check_backends
+    CIF_CHECK_PG_URL=postgresql://postgres@localhost/cif_check python -m benchmarks.check_backends
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+from sqlalchemy import insert, inspect, select, text
+
+from benchmarks.bench_ws_broker import ROOT
+
+
+def maintenance(command):
+    """Lance `python -m database.maintenance <command>` sur la même base et renvoie sa sortie."""
+    result = subprocess.run([sys.executable, "-m", "database.maintenance", command], cwd=ROOT, capture_output=True, text=True)
+    assert result.returncode == 0, f"{command} : {result.stderr}"
+    return result.stdout
+
+
+def downgrade(engine, Base):
+    """Base "antérieure" : sans compteurs de non lus, auth_version, projections ni index de recherche."""
+    with engine.begin() as conn:
+        if conn.dialect.name == "sqlite":
+            for trigger in ("messages_fts_ai", "messages_fts_ad", "messages_fts_au"):
+                conn.execute(text(f"DROP TRIGGER {trigger}"))
+            conn.execute(text("DROP TABLE messages_fts"))
+        else:
+            # Supprime aussi l'index GIN qui porte sur la colonne
+            conn.execute(text("ALTER TABLE messages DROP COLUMN search_vector"))
+        conn.execute(text("DROP INDEX ix_messages_room_id_id"))
+        conn.execute(text("ALTER TABLE users DROP COLUMN auth_version"))
+        conn.execute(text("ALTER TABLE user_room DROP COLUMN unread_count"))
+    Base.metadata.tables["room_stats"].drop(engine)
+    Base.metadata.tables["events"].drop(engine)
+
+
+def scenario():
+    from database.models import Base, engine, SessionLocal, User, Room, Message, user_room, IS_SQLITE
+    from database.shemas import MessageCreate
+    import database.crud as db_inter
+
+    backend = "SQLite" if IS_SQLITE else "PostgreSQL"
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+
+    # Historique écrit avant les migrations : 2 utilisateurs, le second n'est pas membre du salon 2
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{"id": u, "email": f"check{u}@cif", "password": "x", "pseudo": f"Check{u}"} for u in (1, 2)])
+        conn.execute(insert(Room), [{"id": r, "name": f"Salon {r}", "description": "check", "icon": 1} for r in (1, 2)])
+        conn.execute(insert(user_room), [{"user_id": 1, "room_id": 1}, {"user_id": 1, "room_id": 2}, {"user_id": 2, "room_id": 1}])
+        conn.execute(
+            insert(Message),
+            [
+                {"id": 1, "content": "bonjour tout le monde", "author_id": 1, "room_id": 1, "author_display_name": "Check1", "message_type": "chat"},
+                {"id": 2, "content": "réunion demain matin", "author_id": 2, "room_id": 1, "author_display_name": "Check2", "message_type": "chat"},
+                {"id": 3, "content": "bonjour supprimé", "author_id": 2, "room_id": 1, "author_display_name": "Check2", "message_type": "delete"},
+                {"id": 4, "content": "bonjour du salon privé", "author_id": 1, "room_id": 2, "author_display_name": "Check1", "message_type": "chat"},
+            ],
+        )
+        if not IS_SQLITE:
+            # Ids explicites : la séquence doit suivre pour les messages créés ensuite
+            conn.execute(text("SELECT setval(pg_get_serial_sequence('messages', 'id'), 4)"))
+    downgrade(engine, Base)
+    engine.dispose()
+
+    # --- Maintenance sur la base antérieure ---
+    output = maintenance("rebuild-search")
+    for line in ("+ colonne users.auth_version", "+ colonne user_room.unread_count", "+ index ix_messages_room_id_id", "(3 messages)"):
+        assert line in output, f"rebuild-search : {line!r} absent de\n{output}"
+    assert "+ " not in maintenance("rebuild-room-stats"), "migrations rejouées"
+    assert "=== 3 écart(s) détecté(s) ===" in maintenance("check-unread")
+    assert "=== 3 écart(s) corrigé(s) ===" in maintenance("repair-unread")
+    assert "=== 0 écart(s) détecté(s) ===" in maintenance("check-unread")
+    assert "=== Journal purgé (0 événements) ===" in maintenance("prune-events")
+    print(f"{backend:<11} maintenance : migrations, rebuild-search, room_stats, non lus, journal")
+
+    with engine.connect() as conn:
+        inspector = inspect(conn)
+        if IS_SQLITE:
+            assert inspector.has_table("messages_fts")
+        else:
+            assert "search_vector" in {c["name"] for c in inspector.get_columns("messages")}
+            assert "ix_messages_search_vector" in {i["name"] for i in inspector.get_indexes("messages")}
+
+    with SessionLocal() as db:
+        # --- Recherche : préfixe, extrait, messages supprimés et salons d'autrui exclus ---
+        rows = db_inter.search_messages(db, 1, "bonj")
+        assert sorted(r["id"] for r in rows) == [1, 4], rows
+        assert all("[" in r["snippet"] for r in rows), rows
+        assert [r["id"] for r in db_inter.search_messages(db, 2, "bonjour")] == [1]
+        assert [r["id"] for r in db_inter.search_messages(db, 1, "bonjour", room_id=2)] == [4]
+        assert [r["id"] for r in db_inter.search_messages(db, 1, "demain réunion")] == [2]
+
+        # Index tenu à jour par la base (triggers / colonne générée)
+        new_id = db_inter.create_message(db, 1, MessageCreate(content="bonjour encore"), 2).id
+        assert new_id == 5, new_id
+        assert new_id in {r["id"] for r in db_inter.search_messages(db, 1, "encore")}
+        db_inter.delete_message_func(db, new_id, 2)
+        assert db_inter.search_messages(db, 1, "encore") == []
+        print(f"{backend:<11} recherche : préfixe, extraits, visibilité, index à jour")
+
+        # --- Curseur de lecture : avance, ne recule jamais ---
+        db_inter.create_message(db, 1, MessageCreate(content="deux"), 2)
+        db_inter.create_message(db, 1, MessageCreate(content="trois"), 2)
+
+        def cursor():
+            return tuple(
+                db.execute(
+                    select(user_room.c.last_read_message_id, user_room.c.unread_count).where(user_room.c.user_id == 1, user_room.c.room_id == 1)
+                ).one()
+            )
+
+        db_inter.read(1, 6, 1, db)
+        assert cursor() == (6, 1), cursor()
+        db_inter.read(1, 2, 1, db)
+        assert cursor() == (6, 1), cursor()
+        db_inter.read(1, 7, 1, db)
+        assert cursor() == (7, 0), cursor()
+        assert db_inter.check_unread_counters(db) == []
+        print(f"{backend:<11} curseur de lecture : greatest, compteurs")
+
+        # --- Dernier message par salon : maintenu à l'écriture == reconstruit ---
+        maintained = db_inter.get_user_rooms(db, 1)
+        assert [(r["id"], r["last_message_content"]) for r in maintained] == [(1, "trois"), (2, "bonjour du salon privé")], maintained
+        assert db_inter.rebuild_room_stats(db) == 2
+        assert db_inter.get_user_rooms(db, 1) == maintained
+        print(f"{backend:<11} room_stats : projection == reconstruction")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.scenario:
+        scenario()
+        return
+
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        backends = [("SQLite", f"sqlite:///{os.path.join(tmp, 'check.db')}"), ("PostgreSQL", os.getenv("CIF_CHECK_PG_URL"))]
+        for backend, url in backends:
+            if not url:
+                print(f"{backend:<11} ignoré (CIF_CHECK_PG_URL non défini)")
+                continue
+            env = dict(os.environ, CIF_DATABASE_URL=url)
+            failed |= subprocess.run([sys.executable, "-m", "benchmarks.check_backends", "--scenario"], cwd=ROOT, env=env).returncode != 0
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Vérifie le plan d'exécution de l'historique paginé (EXPLAIN QUERY PLAN) et
+mesure le coût d'une page selon sa profondeur dans l'historique.
+
+Le plan doit passer par l'index partiel ix_messages_room_id_id, sans tri
+temporaire (USE TEMP B-TREE), pour before_id comme pour after_id.
+
+Usage (depuis la racine du dépôt) :
+    python -m benchmarks.explain_history --messages 200000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.orm import sessionmaker, joinedload, selectinload
+
+from database.models import Base, User, Room, Message, Reaction, enable_foreign_keys_configure_sqlite
+import database.crud as db_inter
+
+
+def explain(conn, stmt):
+    compiled = stmt.compile(dialect=conn.dialect)
+    params = tuple(compiled.construct_params()[name] for name in compiled.positiontup)
+    return [row[-1] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + str(compiled), params)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        event.listen(engine, "connect", enable_foreign_keys_configure_sqlite)
+        Base.metadata.create_all(engine)
+
+        with engine.begin() as conn:
+            conn.execute(insert(User).values(id=1, email="bench@cif", password="x", pseudo="Bench"))
+            conn.execute(insert(Room), [{"id": r, "name": f"Salon {r}", "description": "bench", "icon": 1} for r in (1, 2)])
+            conn.execute(
+                insert(Message),
+                [
+                    {
+                        "content": f"message {i}",
+                        "author_id": 1,
+                        "room_id": 1 + i % 2,
+                        "author_display_name": "Bench",
+                        "message_type": "delete" if i % 10 == 0 else "chat",
+                    }
+                    for i in range(args.messages)
+                ],
+            )
+            conn.exec_driver_sql("ANALYZE")
+
+        options = (
+            joinedload(Message.author),
+            selectinload(Message.reactions).joinedload(Reaction.user),
+            joinedload(Message.parent).joinedload(Message.author),
+        )
+        cases = {
+            "page initiale": db_inter.history_stmt(1, limit=50),
+            "before_id": db_inter.history_stmt(1, before_id=args.messages // 2, limit=50),
+            "after_id": db_inter.history_stmt(1, after_id=args.messages // 2, limit=50),
+        }
+
+        ok = True
+        with engine.connect() as conn:
+            for name, stmt in cases.items():
+                plan = explain(conn, stmt.options(*options))
+                uses_index = any("ix_messages_room_id_id" in step for step in plan)
+                sorts = any("TEMP B-TREE" in step for step in plan)
+                ok &= uses_index and not sorts
+                print(f"{name:>14} : {' | '.join(plan)}")
+
+        # Coût d'une page selon sa profondeur (keyset : constant)
+        with sessionmaker(bind=engine)() as db:
+            for depth in (1.0, 0.5, 0.01):
+                before_id = int(args.messages * depth)
+                start = time.perf_counter()
+                for _ in range(50):
+                    db.execute(db_inter.history_stmt(1, before_id=before_id, limit=50)).scalars().all()
+                print(f"page avant l'id {before_id:>8} : {(time.perf_counter() - start) / 50 * 1000:6.2f} ms")
+
+        engine.dispose()
+
+    assert ok, "Le plan de l'historique n'utilise pas ix_messages_room_id_id (ou trie en mémoire)"
+    print("OK : historique servi par ix_messages_room_id_id, sans tri temporaire")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+import asyncio
+import os
+from collections import deque
+from typing import Deque, Dict, Optional, Set
+from urllib.parse import unquote, urlsplit
+
+import orjson
+
+BROKER_URL = os.environ.get("CIF_BROKER_URL", "")  # Vide : un seul worker ; "redis://hôte:6379" : plusieurs workers / machines
+BROKER_TIMEOUT = float(os.environ.get("CIF_BROKER_TIMEOUT", 5))  # Secondes pour joindre le broker ou confirmer un abonnement
+
+
+# --- BROKER : DIFFUSION ENTRE WORKERS ---
+# Le ConnectionManager ne livre qu'aux sockets de son processus. Toute diffusion passe donc
+# par un broker : le worker qui publie ne livre rien lui-même, chaque worker abonné au canal
+# reçoit la trame et la livre à ses propres connexions (deliver).
+# Interface commune (voir InProcessBroker) :
+#   start(deliver, on_reset) / stop()
+#   subscribe(channel) : attend la confirmation ; unsubscribe(channel) : sans attendre
+#   publish(channel, message) : message = dict, encodé en JSON entre workers
+#   shared : True si d'autres processus reçoivent aussi les publications
+# on_reset() est appelé quand des publications ont pu être perdues (connexion au broker coupée).
+# RedisBroker parle le protocole Redis (RESP) directement sur asyncio : PUBLISH / SUBSCRIBE
+# suffisent, pas de dépendance ajoutée ; tout serveur compatible (Redis, Valkey, KeyDB) convient.
+
+
+class BrokerError(Exception):
+    pass
+
+
+class InProcessBroker:
+    """Un seul worker : publier, c'est livrer tout de suite aux connexions du processus."""
+
+    shared = False
+
+    def __init__(self):
+        self.deliver = None
+
+    async def start(self, deliver, on_reset=None):
+        self.deliver = deliver
+
+    async def stop(self):
+        pass
+
+    async def subscribe(self, channel: str):
+        pass
+
+    def unsubscribe(self, channel: str):
+        pass
+
+    async def publish(self, channel: str, message: dict):
+        await self.deliver(channel, message)
+
+    def metrics(self):
+        return {"broker": "in-process"}
+
+
+def resp_command(*args) -> bytes:
+    """Commande Redis encodée en RESP (tableau de chaînes binaires)."""
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+async def read_reply(reader: asyncio.StreamReader):
+    """Lit une réponse RESP ; une erreur du serveur est renvoyée (BrokerError), pas levée."""
+    line = await reader.readuntil(b"\r\n")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest.decode()
+    if kind == b"-":
+        return BrokerError(rest.decode())
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        size = int(rest)
+        return None if size < 0 else (await reader.readexactly(size + 2))[:-2]
+    if kind == b"*":
+        size = int(rest)
+        return None if size < 0 else [await read_reply(reader) for _ in range(size)]
+    raise BrokerError(f"Réponse RESP inattendue : {line!r}")
+
+
+class RedisBroker:
+    """
+    Pub/sub Redis : une connexion pour publier (réponses lues en tâche de fond), une pour
+    les abonnements, reconnectée avec backoff ; les canaux sont réabonnés à la reconnexion.
+    """
+
+    shared = True
+
+    def __init__(self, url: str, timeout: float = BROKER_TIMEOUT):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 6379
+        self.username = unquote(parts.username) if parts.username else None
+        self.password = unquote(parts.password) if parts.password else None
+        self.timeout = timeout
+        self.deliver = None
+        self.on_reset = None
+        self.channels: Set[str] = set()  # Abonnements voulus (rejoués à chaque reconnexion)
+        self.confirming: Dict[str, Deque[asyncio.Future]] = {}  # Un SUBSCRIBE envoyé = une confirmation attendue
+        self._listener: Optional[asyncio.Task] = None
+        self._sub_writer: Optional[asyncio.StreamWriter] = None
+        self._pub_writer: Optional[asyncio.StreamWriter] = None
+        self._pub_reader_task: Optional[asyncio.Task] = None
+        self._pub_lock = asyncio.Lock()
+        # Métriques
+        self.published = 0
+        self.received = 0
+        self.publish_errors = 0
+        self.delivery_errors = 0
+        self.reconnects = 0
+
+    async def start(self, deliver, on_reset=None):
+        """Lance l'écoute en tâche de fond : un broker injoignable n'empêche pas le worker de démarrer."""
+        self.deliver = deliver
+        self.on_reset = on_reset
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self.listen())
+
+    async def stop(self):
+        for task in (self._listener, self._pub_reader_task):
+            if task is not None:
+                task.cancel()
+        for writer in (self._sub_writer, self._pub_writer):
+            if writer is not None:
+                writer.close()
+        self._listener = self._pub_reader_task = self._sub_writer = self._pub_writer = None
+
+    async def connect(self):
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+        if self.password is not None:
+            auth = ("AUTH", self.username, self.password) if self.username else ("AUTH", self.password)
+            writer.write(resp_command(*auth))
+            reply = await asyncio.wait_for(read_reply(reader), self.timeout)
+            if isinstance(reply, BrokerError):
+                writer.close()
+                raise reply
+        return reader, writer
+
+    # --- Abonnements ---
+
+    async def subscribe(self, channel: str):
+        if channel not in self.channels:
+            self.channels.add(channel)
+            self.confirming.setdefault(channel, deque()).append(asyncio.get_running_loop().create_future())
+            if self._sub_writer is not None:
+                self._sub_writer.write(resp_command("SUBSCRIBE", channel))
+        pending = self.confirming.get(channel)
+        if pending:
+            # Hors délai (broker injoignable) : la connexion du client échoue, il réessaiera
+            await asyncio.wait_for(asyncio.shield(pending[-1]), self.timeout)
+
+    def unsubscribe(self, channel: str):
+        if channel in self.channels:
+            self.channels.discard(channel)
+            if self._sub_writer is not None:
+                self._sub_writer.write(resp_command("UNSUBSCRIBE", channel))
+
+    async def listen(self):
+        delay = 0.5
+        while True:
+            try:
+                reader, self._sub_writer = await self.connect()
+                if self.channels:
+                    self._sub_writer.write(resp_command("SUBSCRIBE", *self.channels))
+                delay = 0.5
+                while True:
+                    reply = await read_reply(reader)
+                    if isinstance(reply, list) and len(reply) == 3:
+                        await self.handle(*reply)
+            except (OSError, EOFError, asyncio.IncompleteReadError, asyncio.TimeoutError, BrokerError) as e:
+                print(f"Erreur broker: {e}")
+            if self._sub_writer is not None:
+                self._sub_writer.close()
+                self._sub_writer = None
+                # Des publications ont pu se perdre pendant la coupure
+                self.reconnects += 1
+                if self.on_reset is not None:
+                    self.on_reset()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 10)
+
+    async def handle(self, kind: bytes, channel: bytes, data):
+        channel = channel.decode()
+        if kind == b"message":
+            self.received += 1
+            try:
+                await self.deliver(channel, orjson.loads(data))
+            except Exception as e:
+                # Une trame qui échoue (illisible, livraison en erreur) ne doit pas arrêter l'écoute
+                self.delivery_errors += 1
+                print(f"Erreur broker (livraison sur {channel}): {e!r}")
+        elif kind == b"subscribe":
+            pending = self.confirming.get(channel)
+            if pending:
+                future = pending.popleft()
+                if not future.done():
+                    future.set_result(None)
+                if not pending:
+                    del self.confirming[channel]
+
+    # --- Publication ---
+
+    async def publish(self, channel: str, message: dict):
+        """Publie sans attendre la réponse ; une erreur est comptée, la requête HTTP n'échoue pas."""
+        try:
+            if self._pub_writer is None or self._pub_writer.is_closing():
+                async with self._pub_lock:
+                    if self._pub_writer is None or self._pub_writer.is_closing():
+                        reader, self._pub_writer = await self.connect()
+                        self._pub_reader_task = asyncio.create_task(self.read_publish_replies(reader))
+            self._pub_writer.write(resp_command("PUBLISH", channel, orjson.dumps(message)))
+            await self._pub_writer.drain()
+            self.published += 1
+        except (OSError, asyncio.TimeoutError, BrokerError) as e:
+            self.publish_errors += 1
+            print(f"Erreur broker (publication): {e}")
+
+    async def read_publish_replies(self, reader: asyncio.StreamReader):
+        """Les réponses à PUBLISH (nombre d'abonnés) ne servent qu'à repérer les erreurs."""
+        writer = self._pub_writer
+        try:
+            while True:
+                if isinstance(await read_reply(reader), BrokerError):
+                    self.publish_errors += 1
+        except (OSError, EOFError, asyncio.IncompleteReadError, BrokerError):
+            writer.close()
+
+    def metrics(self):
+        return {
+            "broker": f"redis://{self.host}:{self.port}",
+            "connected": self._sub_writer is not None,
+            "channels": len(self.channels),
+            "published": self.published,
+            "received": self.received,
+            "publish_errors": self.publish_errors,
+            "delivery_errors": self.delivery_errors,
+            "reconnects": self.reconnects,
+        }
+
+
+def make_broker(url: str = BROKER_URL):
+    """Broker choisi par CIF_BROKER_URL (vide : InProcessBroker)."""
+    if not url:
+        return InProcessBroker()
+    if urlsplit(url).scheme not in ("redis", "valkey"):
+        raise ValueError(f"CIF_BROKER_URL non pris en charge : {url}")
+    return RedisBroker(url)
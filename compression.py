@@ -0,0 +1,111 @@
+import gzip
+import os
+from typing import Optional
+
+from uvicorn.protocols.websockets.websockets_impl import WebSocketProtocol
+from websockets.extensions.permessage_deflate import ServerPerMessageDeflateFactory
+
+try:
+    import brotli
+except ImportError:  # Optionnel : sans brotli, seul gzip est proposé
+    brotli = None
+
+COMPRESSION_MIN_SIZE = int(os.environ.get("CIF_COMPRESSION_MIN_SIZE", 1024))  # Octets : en dessous, on n'y gagne rien
+GZIP_LEVEL = int(os.environ.get("CIF_GZIP_LEVEL", 6))  # 1 (rapide) à 9 (compact)
+BROTLI_QUALITY = int(os.environ.get("CIF_BROTLI_QUALITY", 4))  # 0 à 11 ; au-delà de 5, trop lent pour du dynamique
+WS_DEFLATE_LEVEL = int(os.environ.get("CIF_WS_DEFLATE_LEVEL", 3))  # Niveau zlib de permessage-deflate (payé par connexion)
+COMPRESSIBLE_TYPES = ("application/json", "application/msgpack", "text/")
+
+
+# --- COMPRESSION DES RÉPONSES ---
+# Le chargement initial d'un salon renvoie jusqu'à max(50, non lus + 100) messages, et
+# /reports ou /users tout en un seul corps : du JSON (ou MessagePack) très répétitif.
+# REST : le middleware compresse en brotli ou gzip selon Accept-Encoding, au-dessus
+# de COMPRESSION_MIN_SIZE. L'ETag forte devient faible (W/"...") : même contenu, octets
+# différents ; resource_versions.matches compare déjà en faible, les 304 restent valides.
+# WebSocket : permessage-deflate est négocié par uvicorn sur la session /ws ;
+# DeflateWebSocketProtocol permet d'en régler le niveau :
+#     uvicorn main:app --ws compression:DeflateWebSocketProtocol
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """"br" si accepté (et brotli installé), sinon "gzip", sinon None. Respecte q=0."""
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.partition(";")
+        name, _, q = params.strip().partition("=")
+        try:
+            if name == "q" and float(q) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(coding.strip())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    """
+    Middleware ASGI (comme ContentNegotiationMiddleware). Les réponses de l'API sont envoyées
+    en un seul morceau ; une réponse en streaming (plusieurs morceaux) passe telle quelle.
+    """
+
+    def __init__(self, app, min_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.min_size = min_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        encoding = choose_encoding(dict(scope["headers"]).get(b"accept-encoding", b"").decode("latin-1"))
+        start_message = None
+
+        async def send_compressed(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = message  # Envoyé avec le corps, une fois la décision prise
+                return
+            if start_message is None or message["type"] != "http.response.body":
+                return await send(message)
+
+            start, start_message = start_message, None
+            body = message.get("body", b"")
+            headers = [(k, v) for k, v in start["headers"]]
+            names = {k.lower(): v for k, v in headers}
+            compressible = names.get(b"content-type", b"").decode("latin-1").startswith(COMPRESSIBLE_TYPES)
+
+            if not compressible or b"content-encoding" in names or message.get("more_body", False):
+                await send(start)
+                return await send(message)
+
+            headers.append((b"vary", b"Accept-Encoding"))
+            if encoding and len(body) >= self.min_size:
+                body = compress(body, encoding)
+                headers = [
+                    (k, b"W/" + v if k.lower() == b"etag" and not v.startswith(b"W/") else v)
+                    for k, v in headers
+                    if k.lower() != b"content-length"
+                ]
+                headers += [(b"content-encoding", encoding.encode()), (b"content-length", str(len(body)).encode())]
+            await send(dict(start, headers=headers))
+            await send(dict(message, body=body))
+
+        await self.app(scope, receive, send_compressed)
+
+
+class DeflateWebSocketProtocol(WebSocketProtocol):
+    """Protocole WebSocket d'uvicorn (implémentation websockets) avec un niveau de compression réglable."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.config.ws_per_message_deflate:
+            self.available_extensions = [ServerPerMessageDeflateFactory(compress_settings={"level": WS_DEFLATE_LEVEL, "memLevel": 5})]
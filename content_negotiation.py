@@ -0,0 +1,85 @@
+from contextvars import ContextVar
+from datetime import date, datetime, time
+
+import msgpack
+import orjson
+from fastapi.responses import ORJSONResponse
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+MSGPACK_SUBPROTOCOL = "msgpack"  # Sous-protocole WebSocket : trames binaires MessagePack
+
+
+# --- NÉGOCIATION DU FORMAT (JSON / MESSAGEPACK) ---
+# REST : un client qui envoie `Accept: application/msgpack` reçoit ses réponses en
+# MessagePack (clés et nombres plus compacts que le JSON), les autres restent en JSON.
+# Le middleware lit l'en-tête Accept et mémorise le format dans une ContextVar,
+# que NegotiatedResponse (default_response_class de main.py) consulte au rendu.
+# WebSocket : le client propose le sous-protocole "msgpack" à la connexion ; voir
+# accept_websocket et encode_frame (utilisés par websocket_manager.py).
+
+response_format: ContextVar[str] = ContextVar("response_format", default="json")
+
+
+def wants_msgpack(accept: str) -> bool:
+    return MSGPACK_MEDIA_TYPE in accept or "application/x-msgpack" in accept
+
+
+class ContentNegotiationMiddleware:
+    """Middleware ASGI (pas BaseHTTPMiddleware : la ContextVar reste visible de la route)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        accept = dict(scope["headers"]).get(b"accept", b"").decode("latin-1")
+        token = response_format.set("msgpack" if wants_msgpack(accept) else "json")
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            response_format.reset(token)
+
+
+class NegotiatedResponse(ORJSONResponse):
+    """JSON (orjson) par défaut, MessagePack si le client l'a demandé."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.headers.append("Vary", "Accept")
+
+    def render(self, content) -> bytes:
+        if response_format.get() == "msgpack":
+            self.media_type = MSGPACK_MEDIA_TYPE
+            return msgpack.packb(content)
+        return super().render(content)
+
+
+async def accept_websocket(websocket) -> str:
+    """Accepte la connexion en choisissant le format des trames ; renvoie "msgpack" ou "json"."""
+    if MSGPACK_SUBPROTOCOL in websocket.scope.get("subprotocols", []):
+        await websocket.accept(subprotocol=MSGPACK_SUBPROTOCOL)
+        return "msgpack"
+    await websocket.accept()
+    return "json"
+
+
+def msgpack_default(value):
+    """Dates en chaînes ISO 8601, comme orjson côté JSON (ex: lot "resync" lu en base)."""
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    raise TypeError(f"Type non sérialisable en MessagePack : {type(value).__name__}")
+
+
+def encode_frame(message: dict, frame_format: str = "json"):
+    """Trame texte (JSON, str) ou binaire (MessagePack, bytes)."""
+    if frame_format == "msgpack":
+        return msgpack.packb(message, default=msgpack_default)
+    return orjson.dumps(message).decode()
+
+
+def decode_frame(data):
+    """Trame reçue d'un client : binaire (MessagePack) ou texte (JSON) ; ValueError si illisible."""
+    if isinstance(data, bytes):
+        return msgpack.unpackb(data)
+    return orjson.loads(data)
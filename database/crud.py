@@ -1,11 +1,13 @@
-from sqlalchemy import select, delete, insert, func, desc, case
+from sqlalchemy import select, delete, insert, update, func, desc, case, text, or_, and_, Integer, String, DateTime
 from sqlalchemy.orm import Session, joinedload, selectinload, aliased
 from sqlalchemy.exc import IntegrityError
-from database.models import User, Room, Message, Reaction, user_room, Report
+from database.models import User, Room, Message, Reaction, user_room, Report, RoomStats, Event, IS_SQLITE, dialect_insert, greatest, ROOM_PREVIEW_LENGTH, PARENT_EXCERPT_LENGTH, MESSAGES_PAGE_SIZE, MESSAGES_MAX_LIMIT, SEARCH_PAGE_SIZE, SEARCH_MAX_CANDIDATES, MESSAGE_EDIT_WINDOW, MESSAGE_DELETE_WINDOW, SYNC_MAX_EVENTS, EVENTS_RETENTION
 from database.shemas import *
 from fastapi import HTTPException, status
 from datetime import datetime, timedelta
 from security import get_password_hash, verify_password
+from auth_cache import auth_cache
+import re
 
 
 # ==============================================================================
@@ -76,6 +78,10 @@ def new_user(db: Session, user_data: RegisterRequest):
                     author_display_name=user.pseudo,
                 )
                 db.add(welcome_msg)
+                db.flush()
+                db.execute(mark_all_read_stmt(user.id, general_room.id))
+                db.execute(event_stmt("join", general_room.id, user_id=user.id))
+                db.execute(event_stmt("new", general_room.id, welcome_msg.id))
                 db.commit()
             except Exception as e:
                 print(f"Erreur message bienvenue: {e}")
@@ -105,9 +111,12 @@ def update_user_pseudo(db: Session, user_id: int, new_pseudo: str):
 
     user.pseudo = new_pseudo
     user.last_pseudo_update = func.current_timestamp()
+    # Le pseudo est inscrit dans le jeton : les anciens jetons ne sont plus valides
+    user.auth_version = User.auth_version + 1
 
     try:
         db.commit()
+        auth_cache.invalidate(user_id)
         db.refresh(user)
         return user
     except IntegrityError:
@@ -115,24 +124,313 @@ def update_user_pseudo(db: Session, user_id: int, new_pseudo: str):
         raise HTTPException(status_code=409, detail="Ce pseudo est déjà utilisé ! Choisissez un autre.")
 
 
+# ==============================================================================
+# STATISTIQUES DES SALONS (room_stats)
+# ==============================================================================
+# Les fonctions *_stmt renvoient des requêtes (sans les exécuter) pour être
+# partagées entre crud.py et crud_async.py. Elles doivent être exécutées dans
+# la même transaction que l'écriture du message concerné.
+
+
+def room_stats_on_create_stmt(msg: Message):
+    """Nouveau message "chat" : il devient le dernier message du salon."""
+    values = {
+        "room_id": msg.room_id,
+        "last_message_id": msg.id,
+        "last_message_author": msg.author_display_name,
+        "last_message_preview": msg.content[:ROOM_PREVIEW_LENGTH],
+        "last_message_at": msg.created_at,
+        "chat_count": 1,
+    }
+    stmt = dialect_insert(RoomStats).values(**values)
+    return stmt.on_conflict_do_update(
+        index_elements=["room_id"],
+        set_={
+            "last_message_id": stmt.excluded.last_message_id,
+            "last_message_author": stmt.excluded.last_message_author,
+            "last_message_preview": stmt.excluded.last_message_preview,
+            "last_message_at": stmt.excluded.last_message_at,
+            "chat_count": RoomStats.chat_count + 1,
+        },
+    )
+
+
+def room_stats_on_edit_stmt(msg: Message):
+    """Message modifié : on ne touche à l'aperçu que s'il s'agit du dernier message."""
+    return (
+        update(RoomStats)
+        .where(RoomStats.room_id == msg.room_id, RoomStats.last_message_id == msg.id)
+        .values(last_message_preview=msg.content[:ROOM_PREVIEW_LENGTH])
+    )
+
+
+def room_stats_on_delete_stmt(msg: Message):
+    """Message supprimé (soft delete) : décrémente et recalcule le dernier message si besoin."""
+    last_chat = (
+        select(Message)
+        .where(Message.room_id == msg.room_id, Message.message_type == "chat", Message.id != msg.id)
+        .order_by(Message.id.desc())
+        .limit(1)
+        .subquery()
+    )
+
+    def last(new_value, current_value):
+        # Si le message supprimé n'était pas le dernier, on garde la valeur actuelle
+        return case((RoomStats.last_message_id == msg.id, select(new_value).scalar_subquery()), else_=current_value)
+
+    return (
+        update(RoomStats)
+        .where(RoomStats.room_id == msg.room_id)
+        .values(
+            chat_count=greatest(RoomStats.chat_count - 1, 0),
+            last_message_id=last(last_chat.c.id, RoomStats.last_message_id),
+            last_message_author=last(last_chat.c.author_display_name, RoomStats.last_message_author),
+            last_message_preview=last(func.substr(last_chat.c.content, 1, ROOM_PREVIEW_LENGTH), RoomStats.last_message_preview),
+            last_message_at=last(last_chat.c.created_at, RoomStats.last_message_at),
+        )
+    )
+
+
+def last_message_per_room_stmt():
+    """Dernier message "chat" de chaque salon, avec le nombre de messages du salon."""
+    columns = (
+        Message.room_id,
+        Message.id,
+        Message.author_display_name,
+        func.substr(Message.content, 1, ROOM_PREVIEW_LENGTH),
+        Message.created_at,
+        func.count().over(partition_by=Message.room_id),
+    )
+    if not IS_SQLITE:
+        # PostgreSQL : DISTINCT ON garde la première ligne (id le plus grand) de chaque salon
+        return select(*columns).where(Message.message_type == "chat").distinct(Message.room_id).order_by(Message.room_id, Message.id.desc())
+
+    ranked = (
+        select(*columns, func.row_number().over(partition_by=Message.room_id, order_by=Message.id.desc()).label("rang"))
+        .where(Message.message_type == "chat")
+        .subquery()
+    )
+    return select(*list(ranked.c)[:-1]).where(ranked.c.rang == 1)
+
+
+def rebuild_room_stats(db: Session):
+    """Reconstruit toute la table room_stats à partir de l'historique des messages."""
+    db.execute(delete(RoomStats))
+    db.execute(
+        insert(RoomStats).from_select(
+            ["room_id", "last_message_id", "last_message_author", "last_message_preview", "last_message_at", "chat_count"],
+            last_message_per_room_stmt(),
+        )
+    )
+    db.commit()
+    return db.execute(select(func.count()).select_from(RoomStats)).scalar_one()
+
+
+# ==============================================================================
+# COMPTEURS DE NON LUS (user_room.unread_count)
+# ==============================================================================
+
+
+def unread_on_create_stmts(msg: Message):
+    """Nouveau message "chat" : +1 pour les autres membres, l'auteur a tout lu."""
+    return (
+        user_room.update()
+        .where(user_room.c.room_id == msg.room_id, user_room.c.user_id != msg.author_id)
+        .values(unread_count=user_room.c.unread_count + 1),
+        user_room.update()
+        .where(user_room.c.room_id == msg.room_id, user_room.c.user_id == msg.author_id)
+        .values(last_read_message_id=msg.id, unread_count=0),
+    )
+
+
+def unread_on_delete_stmt(msg: Message):
+    """Message supprimé : -1 pour les membres qui ne l'avaient pas encore lu."""
+    return (
+        user_room.update()
+        .where(
+            user_room.c.room_id == msg.room_id,
+            func.coalesce(user_room.c.last_read_message_id, 0) < msg.id,
+            user_room.c.unread_count > 0,
+        )
+        .values(unread_count=user_room.c.unread_count - 1)
+    )
+
+
+def unread_count_query(room_id, last_read_id):
+    """Recalcul exact (parcours borné aux messages d'id > last_read_id)."""
+    return (
+        select(func.count(Message.id))
+        .where(Message.room_id == room_id, Message.id > func.coalesce(last_read_id, 0), Message.message_type == "chat")
+        .scalar_subquery()
+    )
+
+
+def mark_all_read_stmt(user_id: int, room_id: int):
+    """Positionne le curseur de lecture sur le dernier message du salon (ex: à l'arrivée d'un membre)."""
+    last_id = select(func.coalesce(func.max(Message.id), 0)).where(Message.room_id == room_id).scalar_subquery()
+    return (
+        user_room.update()
+        .where(user_room.c.user_id == user_id, user_room.c.room_id == room_id)
+        .values(last_read_message_id=last_id, unread_count=0)
+    )
+
+
+def check_unread_counters(db: Session, repair: bool = False):
+    """
+    Compare les compteurs stockés au recalcul depuis les messages.
+    Renvoie la liste des écarts (user_id, room_id, stocké, attendu) et les corrige si repair=True.
+    """
+    expected = unread_count_query(user_room.c.room_id, user_room.c.last_read_message_id)
+    rows = db.execute(select(user_room.c.user_id, user_room.c.room_id, user_room.c.unread_count, expected.label("expected"))).all()
+    mismatches = [tuple(row) for row in rows if row.unread_count != row.expected]
+
+    if repair and mismatches:
+        for user_id, room_id, _, expected_count in mismatches:
+            db.execute(
+                user_room.update().where(user_room.c.user_id == user_id, user_room.c.room_id == room_id).values(unread_count=expected_count)
+            )
+        db.commit()
+
+    return mismatches
+
+
+# ==============================================================================
+# JOURNAL DES CHANGEMENTS (events) ET SYNCHRONISATION
+# ==============================================================================
+# Chaque fonction qui modifie un salon (messages, réactions, adhésions, salon lui-même)
+# exécute event_stmt dans SA transaction : l'événement n'existe que si l'écriture est commitée.
+# GET /sync?since=<seq> relit le journal au-delà du curseur du client et le réduit au
+# dernier état (compact_events) : un retour en ligne coûte ce qui a changé, pas l'historique.
+# NOTE PostgreSQL : deux transactions concurrentes peuvent commiter leurs seq dans le
+# désordre ; en SQLite (un seul écrivain, voir write_queue.py) l'ordre des seq est celui des commits.
+
+EVENT_MEMBERSHIP_KINDS = ("join", "quit")
+
+
+def event_stmt(kind: str, room_id: int, message_id: int = None, user_id: int = None):
+    """INSERT d'un événement du journal (kind : new, edit, delete, react, join, quit, room)."""
+    return insert(Event).values(kind=kind, room_id=room_id, message_id=message_id, user_id=user_id)
+
+
+def event_bounds_stmt():
+    """(plus grand seq, plus petit seq) : deux lectures de la clé primaire (un seul min/max par SELECT)."""
+    return select(select(func.max(Event.seq)).scalar_subquery(), select(func.min(Event.seq)).scalar_subquery())
+
+
+def sync_events_stmt(user_id: int, since: int, limit: int = SYNC_MAX_EVENTS):
+    """Événements d'id > since des salons de l'utilisateur, et ses propres arrivées / départs."""
+    member_rooms = select(user_room.c.room_id).where(user_room.c.user_id == user_id)
+    return (
+        select(Event.seq, Event.kind, Event.room_id, Event.message_id, Event.user_id)
+        .where(
+            Event.seq > since,
+            or_(Event.room_id.in_(member_rooms), and_(Event.user_id == user_id, Event.kind.in_(EVENT_MEMBERSHIP_KINDS))),
+        )
+        .order_by(Event.seq)
+        .limit(limit)
+    )
+
+
+def room_events_stmt(room_id: int, since: int, limit: int = SYNC_MAX_EVENTS):
+    """Événements d'un salon d'id > since (reprise d'un WebSocket de salon, index ix_events_room_id_seq)."""
+    return (
+        select(Event.seq, Event.kind, Event.room_id, Event.message_id, Event.user_id)
+        .where(Event.room_id == room_id, Event.seq > since)
+        .order_by(Event.seq)
+        .limit(limit)
+    )
+
+
+def sync_limit(limit: int = None):
+    return max(1, min(limit or SYNC_MAX_EVENTS, SYNC_MAX_EVENTS))
+
+
+def sync_reset(since: int, head: int, oldest: int):
+    """Le client doit tout recharger : pas de curseur, journal purgé au-delà, ou curseur d'une autre base."""
+    return since is None or since > (head or 0) or (oldest is not None and since < oldest - 1)
+
+
+def compact_events(rows, user_id: int, since: int, limit: int):
+    """
+    Réduit les événements au dernier état utile : un message créé puis modifié n'est relu
+    qu'une fois, un message supprimé n'est plus qu'un id, ses réactions ne sont pas relues.
+    Renvoie le lot (sans les messages, lus ensuite par l'appelant) et les ids à relire.
+    """
+    changed, deleted, reacted, membership, rooms_changed = set(), set(), set(), {}, set()
+    for row in rows:
+        if row.kind in ("new", "edit"):
+            changed.add(row.message_id)
+        elif row.kind == "delete":
+            deleted.add(row.message_id)
+        elif row.kind == "react":
+            reacted.add(row.message_id)
+        elif row.kind in EVENT_MEMBERSHIP_KINDS and row.user_id == user_id:
+            membership[row.room_id] = row.kind  # Le dernier l'emporte (quitté puis rejoint)
+        elif row.kind == "room":
+            rooms_changed.add(row.room_id)
+    batch = {
+        "seq": rows[-1].seq if rows else since,
+        "has_more": len(rows) >= limit,
+        "reset": False,
+        "rooms_joined": sorted(room for room, kind in membership.items() if kind == "join"),
+        "rooms_left": sorted(room for room, kind in membership.items() if kind == "quit"),
+        "rooms_changed": sorted(rooms_changed),
+    }
+    return batch, changed - deleted, deleted, reacted - changed - deleted
+
+
+def sync_messages_stmt(message_ids):
+    """Messages nouveaux ou modifiés du lot, dans leur état actuel (les supprimés sont absents)."""
+    return select(Message).where(Message.id.in_(sorted(message_ids)), Message.message_type != "delete").order_by(Message.id)
+
+
+def get_sync(db: Session, user_id: int, since: int = None, limit: int = None):
+    limit = sync_limit(limit)
+    head, oldest = db.execute(event_bounds_stmt()).one()
+    if sync_reset(since, head, oldest):
+        return {"seq": head or 0, "reset": True}
+
+    batch, changed, deleted, reacted = compact_events(db.execute(sync_events_stmt(user_id, since, limit)).all(), user_id, since, limit)
+    messages = []
+    if changed:
+        rows = db.execute(compact_message_stmt(sync_messages_stmt(changed))).all()
+        messages = compact_messages(rows, db.execute(reaction_summary_stmt([row.id for row in rows], user_id)).all())
+    summaries = db.execute(reaction_summary_stmt(sorted(reacted), user_id)).all() if reacted else []
+    return sync_batch(batch, messages, deleted | (changed - {msg["id"] for msg in messages}), reacted, summaries)
+
+
+def sync_batch(batch: dict, messages: list, deleted: set, reacted: set, summary_rows):
+    """Complète le lot : les messages sans plus aucune réaction sont renvoyés avec des compteurs vides."""
+    reactions = {entry["id"]: entry for entry in reaction_summaries(summary_rows)}
+    batch["messages"] = messages
+    batch["deleted"] = sorted(deleted)
+    batch["reactions"] = [reactions.get(message_id, {"id": message_id, "reactions": {}, "my_reaction": None}) for message_id in sorted(reacted)]
+    return batch
+
+
+def prune_events(db: Session, retention=EVENTS_RETENTION):
+    """Purge le journal ; le dernier événement est gardé (plus petit seq connu = curseurs encore valides)."""
+    last_seq = select(func.max(Event.seq)).scalar_subquery()
+    count = db.execute(delete(Event).where(Event.created_at < datetime.now() - retention, Event.seq < last_seq)).rowcount
+    db.commit()
+    return count
+
+
 # ==============================================================================
 # GESTION DES SALONS (ROOMS)
 # ==============================================================================
 
 
 def get_all_rooms(db: Session):
-    # Sous-requête pour la date du dernier message
-    last_msg_sub = select(Message.room_id, func.max(Message.created_at).label("last_message_date")).group_by(Message.room_id).subquery()
-
     stmt = (
         select(Room)
         .options(joinedload(Room.creator))
-        .outerjoin(last_msg_sub, Room.id == last_msg_sub.c.room_id)
+        .outerjoin(RoomStats, Room.id == RoomStats.room_id)
         .order_by(
             # Critère 1 : Force l'ID 1 en haut (True > False en SQL)
             desc(Room.id == 1),
-            # Critère 2 : Dernier message
-            desc(last_msg_sub.c.last_message_date),
+            # Critère 2 : Dernier message (lu dans la projection room_stats), salons vides en dernier
+            desc(RoomStats.last_message_at).nulls_last(),
             # Critère 3 : Date de création du salon (fallback)
             desc(Room.created_at),
         )
@@ -141,81 +439,127 @@ def get_all_rooms(db: Session):
     return db.execute(stmt).scalars().all()
 
 
-def get_user_rooms(db: Session, user_id: int):
-    # 1. Sous-requête : On filtre avec .where(Message.message_type == "chat")
-    last_msg_sub = (
-        select(Message.room_id, func.max(Message.created_at).label("last_message_date"))
-        .where(Message.message_type == "chat")  # <-- AJOUT ICI
-        .group_by(Message.room_id)
-        .subquery()
-    )
-
-    stmt = (
-        select(Room)
+def user_rooms_stmt(user_id: int):
+    """
+    Requête unique pour la liste des salons d'un utilisateur : salon, dernier message "chat",
+    curseur de lecture et nombre de non lus, quel que soit le nombre de salons.
+    """
+    return (
+        select(
+            Room,
+            user_room.c.last_read_message_id,
+            RoomStats.last_message_preview,
+            RoomStats.last_message_author,
+            RoomStats.last_message_at,
+            # Non lus : compteur maintenu à l'écriture, plus aucun COUNT sur messages
+            user_room.c.unread_count,
+        )
         .options(joinedload(Room.creator))
         .join(user_room, Room.id == user_room.c.room_id)
-        .outerjoin(last_msg_sub, Room.id == last_msg_sub.c.room_id)
+        # Dernier message "chat" : lu directement dans la projection room_stats
+        .outerjoin(RoomStats, Room.id == RoomStats.room_id)
         .where(user_room.c.user_id == user_id, Room.active == True)
         .order_by(
             desc(Room.id == 1),
-            desc(last_msg_sub.c.last_message_date),
+            desc(RoomStats.last_message_at).nulls_last(),
             desc(Room.created_at),
         )
     )
 
-    rooms = db.execute(stmt).scalars().all()
-    result = []
 
-    for r in rooms:
-        ur = db.execute(select(user_room).where(user_room.c.user_id == user_id, user_room.c.room_id == r.id)).first()
-        last_read_id = getattr(ur, "last_read_message_id", 0) if ur else 0
+def last_message_fields(description, last_content, last_author, last_date):
+    """Aperçu du dernier message d'un salon dans la liste (ou sa description s'il n'y en a pas)."""
+    if last_date:
+        return {"last_message_content": last_content, "last_message_author": last_author, "last_message_time": last_date.strftime("%H:%M")}
+    return {"last_message_content": description, "last_message_author": "", "last_message_time": ""}
 
-        # 2. Vrai dernier message : Uniquement de type "chat"
-        last_msg = (
-            db.execute(
-                select(Message)
-                .where(Message.room_id == r.id, Message.message_type == "chat")  # <-- AJOUT ICI
-                .order_by(Message.created_at.desc())
-            )
-            .scalars()
-            .first()
-        )
 
-        # 3. Non lus : Uniquement les messages de type "chat"
-        unread = db.execute(
-            select(func.count(Message.id)).where(
-                Message.room_id == r.id,
-                Message.id > (last_read_id or 0),
-                Message.message_type == "chat",  # <-- AJOUT ICI
-            )
-        ).scalar()
+def user_room_row_to_dict(row):
+    r, last_read_id, last_content, last_author, last_date, unread = row
 
-        r_dict = {c.name: getattr(r, c.name) for c in r.__table__.columns}
-        r_dict["creator"] = r.creator
+    r_dict = {c.name: getattr(r, c.name) for c in r.__table__.columns}
+    r_dict["creator"] = r.creator
+    r_dict.update(last_message_fields(r.description, last_content, last_author, last_date))
+
+    r_dict["unread_count"] = unread or 0
+    r_dict["last_read_id"] = last_read_id or 0
+    return r_dict
+
+
+def get_user_rooms(db: Session, user_id: int):
+    rows = db.execute(user_rooms_stmt(user_id)).all()
+    return [user_room_row_to_dict(row) for row in rows]
+
+
+# --- APERÇU D'UN SALON (DELTA "room_summary") ---
+# Plutôt que de faire recharger /user/rooms à tous les connectés, un nouveau message ou une
+# suppression n'envoie aux membres du salon que ce qui change dans leur liste : l'aperçu
+# du dernier message et +1 / -1 sur le compteur de non lus (voir main.py et rooms_view.py).
 
-        if last_msg:
-            r_dict["last_message_content"] = last_msg.content
-            r_dict["last_message_author"] = last_msg.author_display_name
-            r_dict["last_message_time"] = last_msg.created_at.strftime("%H:%M")
-        else:
-            r_dict["last_message_content"] = r.description
-            r_dict["last_message_author"] = ""
-            r_dict["last_message_time"] = ""
 
-        r_dict["unread_count"] = unread or 0
-        r_dict["last_read_id"] = last_read_id
-        result.append(r_dict)
+def room_members_stmt(room_id: int):
+    return select(user_room.c.user_id).where(user_room.c.room_id == room_id)
 
-    return result
+
+def room_summary_stmt(room_id: int):
+    """Aperçu du dernier message du salon, lu dans la projection room_stats."""
+    return (
+        select(Room.description, RoomStats.last_message_preview, RoomStats.last_message_author, RoomStats.last_message_at)
+        .outerjoin(RoomStats, Room.id == RoomStats.room_id)
+        .where(Room.id == room_id)
+    )
+
+
+def room_summary_delta(room_id: int, message_id: int, unread: int, summary: dict, author_id: int = None):
+    """
+    unread=+1 (nouveau message) : le client ajoute 1 à ses non lus, sauf s'il est l'auteur
+    (il a alors tout lu). unread=-1 (suppression) : il retire 1 si message_id est après son
+    curseur de lecture, comme unread_on_delete_stmt.
+    """
+    return dict(summary, action="room_summary", room_id=room_id, message_id=message_id, author_id=author_id, unread=unread)
+
+
+def new_message_summary(msg: dict):
+    """Aperçu après un nouveau message "chat" (mêmes valeurs que room_stats_on_create_stmt, sans requête)."""
+    return last_message_fields(None, msg["content"][:ROOM_PREVIEW_LENGTH], msg["author_display_name"], msg["created_at"])
+
+
+def read_cursor_stmt(room_id: int, last_read_id: int, user_id: int):
+    """Avance le curseur de lecture et recalcule le compteur de non lus (partagé avec crud_async)."""
+    # Le curseur ne recule jamais (ex: chargement d'une ancienne page)
+    new_last_read = greatest(func.coalesce(user_room.c.last_read_message_id, 0), last_read_id)
+    last_chat_id = select(RoomStats.last_message_id).where(RoomStats.room_id == room_id).scalar_subquery()
+
+    return (
+        user_room.update()
+        .where(user_room.c.user_id == user_id, user_room.c.room_id == room_id)
+        .values(
+            last_read_message_id=new_last_read,
+            # Cas courant : tout est lu -> 0 sans parcourir les messages
+            unread_count=case(
+                (new_last_read >= func.coalesce(last_chat_id, 0), 0),
+                else_=unread_count_query(room_id, new_last_read),
+            ),
+        )
+    )
 
 
 def read(room_id: int, last_read_id: int, user_id: int, db: Session):
-    stmt = user_room.update().where(user_room.c.user_id == user_id, user_room.c.room_id == room_id).values(last_read_message_id=last_read_id)
-    db.execute(stmt)
+    db.execute(read_cursor_stmt(room_id, last_read_id, user_id))
     db.commit()
     return {"status": "ok"}
 
 
+def get_total_unread(db: Session, user_id: int) -> int:
+    """Total des non lus sur tous les salons actifs (somme des compteurs, sans parcourir les messages)."""
+    stmt = (
+        select(func.coalesce(func.sum(user_room.c.unread_count), 0))
+        .join(Room, Room.id == user_room.c.room_id)
+        .where(user_room.c.user_id == user_id, Room.active == True)
+    )
+    return db.execute(stmt).scalar_one()
+
+
 def count_room_members(db: Session, room_id: int) -> int:
     """
     Compte le nombre total d'utilisateurs inscrits dans un salon spécifique.
@@ -267,6 +611,9 @@ def create_room(db: Session, room_data: CreateRoomSchema, creator_id: int):
             author_display_name=creator.pseudo,
         )
         db.add(sys_msg)
+        db.flush()
+        db.execute(event_stmt("join", new_room.id, user_id=creator.id))
+        db.execute(event_stmt("new", new_room.id, sys_msg.id))
 
         db.commit()
         return new_room
@@ -310,6 +657,11 @@ def join_new_room(db: Session, join_data: JoinRoomSchema, user_id: int):
             author_display_name=user.pseudo,
         )
         db.add(sys_msg)
+        db.flush()
+        # Le nouveau membre arrive sans non lus : l'historique n'est pas compté
+        db.execute(mark_all_read_stmt(user.id, room.id))
+        db.execute(event_stmt("join", room.id, user_id=user.id))
+        db.execute(event_stmt("new", room.id, sys_msg.id))
 
         db.commit()
         db.refresh(room)
@@ -349,6 +701,9 @@ def quit_room_func(db: Session, user_id: int, room_id: int):
         author_display_name=user.pseudo,
     )
     db.add(sys_msg)
+    db.flush()
+    db.execute(event_stmt("quit", room.id, user_id=user.id))
+    db.execute(event_stmt("new", room.id, sys_msg.id))
 
     db.commit()
     db.refresh(room)
@@ -379,6 +734,7 @@ def update_room(db: Session, room_id: int, user_id: int, update_data: RoomUpdate
         setattr(room, key, value)
 
     try:
+        db.execute(event_stmt("room", room_id))
         db.commit()
         db.refresh(room)
         return room
@@ -403,6 +759,7 @@ def delete_room_func(db: Session, room_id: int, user_id: int):
     try:
         room.active = False
         db.add(room)
+        db.execute(event_stmt("room", room_id))
         db.commit()
         return {"detail": "Salon supprimé avec succès", "room_id": room_id}
     except Exception as e:
@@ -490,11 +847,16 @@ def process_report_resolution(db: Session, report_id: int, resolution_data: Repo
             else:
                 user_to_ban.ban_expires_at = None  # Infini
 
+            # Les sessions ouvertes sont révoquées
+            user_to_ban.auth_version = User.auth_version + 1
+
     # 3. Mettre à jour le statut du report
     report.status = resolution_data.status
 
     try:
         db.commit()
+        if resolution_data.ban_user and report.reported_id:
+            auth_cache.invalidate(report.reported_id)
         db.refresh(report)
         return report
     except Exception as e:
@@ -538,6 +900,8 @@ def update_user_ban_status(db: Session, target_user_id: int, ban_data: BanUserSc
         else:
             # Ban définitif
             user.ban_expires_at = None
+        # Les sessions ouvertes sont révoquées
+        user.auth_version = User.auth_version + 1
     else:
         # Débannissement
         user.is_banned = False
@@ -546,6 +910,7 @@ def update_user_ban_status(db: Session, target_user_id: int, ban_data: BanUserSc
 
     try:
         db.commit()
+        auth_cache.invalidate(target_user_id)
         db.refresh(user)
         return user
     except Exception as e:
@@ -607,44 +972,137 @@ def update_user_ban_status(db: Session, target_user_id: int, ban_data: BanUserSc
 #         raise HTTPException(status_code=500, detail="Impossible de récupérer les messages")
 
 
-def get_messages(db: Session, room_id: int, user_id: int, before_id: int):
+def history_limit(unread_count: int, limit: int = None, initial: bool = False):
+    """Taille de page, toujours plafonnée à MESSAGES_MAX_LIMIT."""
+    if limit:
+        return max(1, min(limit, MESSAGES_MAX_LIMIT))
+    if initial:
+        # Chargement initial : au moins 50 messages, ou le total non lu + 100
+        return min(max(MESSAGES_PAGE_SIZE, (unread_count or 0) + 100), MESSAGES_MAX_LIMIT)
+    return MESSAGES_PAGE_SIZE
+
+
+def around_limit(count: int):
+    """Messages de contexte d'un côté du message visé (0 accepté), plafonnés à MESSAGES_MAX_LIMIT."""
+    return max(0, min(count, MESSAGES_MAX_LIMIT))
+
+
+def history_stmt(room_id: int, before_id: int = None, after_id: int = None, limit: int = MESSAGES_PAGE_SIZE):
+    """
+    Page d'historique paginée par clé sur (room_id, id) : la page N coûte autant que la page 1.
+    - before_id : messages plus anciens (ordre décroissant, à retourner côté appelant)
+    - after_id  : messages plus récents (ordre croissant)
+    Le filtre `message_type != "delete"` correspond à l'index partiel ix_messages_room_id_id.
+    """
+    stmt = select(Message).where(Message.room_id == room_id, Message.message_type != "delete")
+
+    if before_id:
+        stmt = stmt.where(Message.id < before_id)
+
+    if after_id:
+        return stmt.where(Message.id > after_id).order_by(Message.id.asc()).limit(limit)
+    return stmt.order_by(Message.id.desc()).limit(limit)
+
+
+# --- Format compact (MessageCompactSchema) ---
+# Au lieu de charger le parent (avec son auteur et ses réactions) et chaque réaction
+# avec son utilisateur, on lit des colonnes : le parent par une jointure, les
+# réactions par un GROUP BY sur la page entière.
+
+
+def compact_message_stmt(stmt):
+    """
+    Transforme un select(Message) (ex: history_stmt) en lecture de colonnes :
+    champs du message + auteur et extrait du parent, sans construire d'objets ORM.
+    """
+    Parent = aliased(Message)
+    return stmt.with_only_columns(
+        Message.id,
+        Message.room_id,
+        Message.author_id,
+        Message.author_display_name,
+        Message.content,
+        Message.message_type,
+        Message.created_at,
+        Message.modified,
+        Message.parent_id,
+        Parent.author_display_name.label("parent_author"),
+        func.substr(Parent.content, 1, PARENT_EXCERPT_LENGTH).label("parent_excerpt"),
+    ).outerjoin(Parent, Parent.id == Message.parent_id)
+
+
+def reaction_summary_stmt(message_ids, user_id: int = None):
+    """
+    Une ligne par (message, emoji) : nombre de réactions et si l'utilisateur en fait partie.
+    message_ids : liste d'ids ou sous-requête (ex: room_message_ids_stmt).
+    """
+    return (
+        select(
+            Reaction.message_id,
+            Reaction.emoji,
+            func.count().label("count"),
+            func.max(case((Reaction.user_id == user_id, 1), else_=0)).label("mine"),
+        )
+        .where(Reaction.message_id.in_(message_ids))
+        .group_by(Reaction.message_id, Reaction.emoji)
+        .order_by(Reaction.message_id, func.min(Reaction.id))  # Emojis dans l'ordre d'apparition
+    )
+
+
+def room_message_ids_stmt(room_id: int, after_id: int = None, before_id: int = None):
+    """Ids des messages d'un salon dans l'intervalle ]after_id, before_id[ (parcours de la clé primaire)."""
+    stmt = select(Message.id).where(Message.room_id == room_id)
+    if after_id:
+        stmt = stmt.where(Message.id > after_id)
+    if before_id:
+        stmt = stmt.where(Message.id < before_id)
+    return stmt
+
+
+def reaction_summaries(summary_rows):
+    """Lignes de reaction_summary_stmt -> [{id, reactions, my_reaction}] (messages sans réaction absents)."""
+    by_id = {}
+    for row in summary_rows:
+        entry = by_id.setdefault(row.message_id, {"id": row.message_id, "reactions": {}, "my_reaction": None})
+        entry["reactions"][row.emoji] = row.count
+        if row.mine:
+            entry["my_reaction"] = row.emoji
+    return list(by_id.values())
+
+
+def compact_messages(rows, summary_rows=()):
+    """Assemble les lignes de compact_message_stmt et de reaction_summary_stmt en dictionnaires."""
+    messages = [dict(row._mapping, reactions={}, my_reaction=None) for row in rows]
+    by_id = {msg["id"]: msg for msg in messages}
+    for entry in reaction_summaries(summary_rows):
+        by_id[entry["id"]].update(reactions=entry["reactions"], my_reaction=entry["my_reaction"])
+    return messages
+
+
+def get_messages(db: Session, room_id: int, user_id: int, before_id: int = None, after_id: int = None, limit: int = None):
     if not verify_user_room(db, user_id, room_id):
         raise HTTPException(status_code=401, detail="Vous ne faites pas partie de ce salon !")
     try:
-        # 1. Calcul dynamique de la limite (Non lus + offset de 100)
-        fetch_limit = 50
+        # 1. Calcul de la limite (Non lus + offset de 100 au chargement initial, plafonnée)
+        unread_count = 0
+        initial = not before_id and not after_id
 
-        # On ne calcule l'offset que si c'est le chargement initial (pas de before_id)
-        if not before_id:
+        # On ne calcule l'offset que si c'est le chargement initial
+        if initial and not limit:
             ur = db.execute(select(user_room).where(user_room.c.user_id == user_id, user_room.c.room_id == room_id)).first()
             last_read = getattr(ur, "last_read_message_id", 0) if ur else 0
-
             if last_read > 0:
-                unread_count = db.execute(select(func.count(Message.id)).where(Message.room_id == room_id, Message.id > last_read)).scalar() or 0
-                # On s'assure de prendre au moins 50 messages, ou le total non lu + 100
-                fetch_limit = max(50, unread_count + 100)
-
-        ParentMessage = aliased(Message)
-        ParentAuthor = aliased(User)
-
-        stmt = (
-            select(Message)
-            .options(
-                joinedload(Message.author),
-                selectinload(Message.reactions).joinedload(Reaction.user),
-                joinedload(Message.parent).joinedload(Message.author),
-            )
-            .where(Message.room_id == room_id, Message.message_type != "delete")
-            # 2. Correction cruciale du tri : En cas d'égalité du timestamp, le plus grand ID passe en premier
-            .order_by(Message.created_at.desc(), Message.id.desc())
-            .limit(fetch_limit)
-        )
+                unread_count = ur.unread_count or 0
 
-        if before_id:
-            stmt = stmt.where(Message.id < before_id)
+        stmt = history_stmt(room_id, before_id, after_id, history_limit(unread_count, limit, initial)).options(
+            joinedload(Message.author),
+            selectinload(Message.reactions).joinedload(Reaction.user),
+            joinedload(Message.parent).joinedload(Message.author),
+        )
 
         results = db.execute(stmt).scalars().all()
-        results.reverse()
+        if not after_id:
+            results.reverse()
 
         for msg in results:
             if msg.parent:
@@ -660,6 +1118,38 @@ def get_messages(db: Session, room_id: int, user_id: int, before_id: int):
         raise HTTPException(status_code=500, detail="Impossible de récupérer les messages")
 
 
+def get_messages_around(db: Session, room_id: int, user_id: int, message_id: int, before: int = 25, after: int = 25):
+    """
+    Contexte autour d'un message (saut vers une réponse ou un résultat de recherche) :
+    deux parcours bornés de l'index (room_id, id), de part et d'autre du message visé.
+    """
+    if not verify_user_room(db, user_id, room_id):
+        raise HTTPException(status_code=401, detail="Vous ne faites pas partie de ce salon !")
+
+    options = (
+        joinedload(Message.author),
+        selectinload(Message.reactions).joinedload(Reaction.user),
+        joinedload(Message.parent).joinedload(Message.author),
+    )
+    # Le message visé est inclus dans la partie "avant" (id < message_id + 1)
+    older = db.execute(history_stmt(room_id, before_id=message_id + 1, limit=around_limit(before) + 1).options(*options)).scalars().all()
+    if not older or older[0].id != message_id:
+        raise HTTPException(status_code=404, detail="Message introuvable")
+
+    newer = db.execute(history_stmt(room_id, after_id=message_id, limit=around_limit(after)).options(*options)).scalars().all() if after > 0 else []
+
+    results = list(reversed(older)) + list(newer)
+    for msg in results:
+        if msg.parent:
+            msg.parent_content = msg.parent.content
+            msg.parent_author = msg.parent.author.pseudo if msg.parent.author else "Inconnu"
+        else:
+            msg.parent_content = None
+            msg.parent_author = None
+
+    return results
+
+
 # def create_message(db: Session, room_id: int, message_data: MessageCreate, author_id, message_type="chat"):
 #     # 1. Pseudo actuel de l'auteur
 #     # user = db.query(User).filter(User.id == message_data.author_id).first()
@@ -709,6 +1199,12 @@ def create_message(db: Session, room_id: int, message_data: MessageCreate, autho
             author_display_name=user.pseudo,
         )
         db.add(new_msg)
+        db.flush()
+        if message_type == "chat":
+            db.execute(room_stats_on_create_stmt(new_msg))
+            for stmt in unread_on_create_stmts(new_msg):
+                db.execute(stmt)
+        db.execute(event_stmt("new", room_id, new_msg.id))
         db.commit()
         db.refresh(new_msg)
 
@@ -739,7 +1235,7 @@ def edit_message_func(db: Session, message_id: int, data: EditMessageSchema, use
     if not message:
         raise HTTPException(status_code=404, detail="Message introuvable")
 
-    if (datetime.now() - timedelta(minutes=15)) > message.created_at:
+    if (datetime.now() - MESSAGE_EDIT_WINDOW) > message.created_at:
         raise HTTPException(status_code=401, detail="Impossible de modifier un message après 15 minutes.")
 
     # 2. Protection des messages système
@@ -759,6 +1255,8 @@ def edit_message_func(db: Session, message_id: int, data: EditMessageSchema, use
     try:
         message.content = data.content
         message.modified = True
+        db.execute(room_stats_on_edit_stmt(message))
+        db.execute(event_stmt("edit", message.room_id, message.id))
 
         db.commit()
         db.refresh(message)
@@ -780,7 +1278,7 @@ def delete_message_func(db: Session, message_id: int, user_id: int):
     if not message:
         raise HTTPException(status_code=404, detail="Message introuvable")
 
-    if (datetime.now() - timedelta(days=3)) > message.created_at:
+    if (datetime.now() - MESSAGE_DELETE_WINDOW) > message.created_at:
         raise HTTPException(status_code=403, detail="Impossible de supprimer un message envoyé depuis plus de 3 jours.")
 
     # 2. Protection des messages système
@@ -799,8 +1297,12 @@ def delete_message_func(db: Session, message_id: int, user_id: int):
 
     # 4. Suppression
     try:
+        if message.message_type == "chat":
+            db.execute(room_stats_on_delete_stmt(message))
+            db.execute(unread_on_delete_stmt(message))
         message.message_type = "delete"
         db.add(message)
+        db.execute(event_stmt("delete", message.room_id, message.id))
         db.commit()
         return message
     except Exception as e:
@@ -809,6 +1311,134 @@ def delete_message_func(db: Session, message_id: int, user_id: int):
         raise HTTPException(status_code=500, detail="Impossible de supprimer le message")
 
 
+# ==============================================================================
+# RECHERCHE PLEIN TEXTE (messages_fts / search_vector)
+# ==============================================================================
+# L'index est tenu à jour par la base elle-même (triggers FTS5 en SQLite, colonne
+# tsvector générée en PostgreSQL, voir models.py) : aucune écriture supplémentaire
+# n'est nécessaire dans les fonctions ci-dessus.
+
+
+def fts_query(q: str):
+    """
+    Transforme la saisie utilisateur en requête sûre (pas d'opérateurs injectés),
+    le dernier mot étant un préfixe ("bonj" -> bonjour).
+    FTS5 : "mot1" "mot2"*   /   PostgreSQL (tsquery) : mot1 & mot2:*
+    """
+    words = re.findall(r"\w+", q or "")
+    if not words:
+        return None
+    if not IS_SQLITE:
+        return " & ".join(words) + ":*"
+    terms = [f'"{w}"' for w in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+# Seules les SEARCH_MAX_CANDIDATES correspondances les plus récentes sont classées :
+# un mot très courant ne force pas le calcul du score (et la jointure) sur tout l'historique.
+# Ces candidats sont pris parmi les messages visibles (le salon demandé, sinon les salons
+# actifs dont l'utilisateur est membre, SEARCH_VISIBLE) : sinon un salon calme ne trouverait
+# plus rien dès que d'autres salons ont SEARCH_MAX_CANDIDATES correspondances plus récentes.
+# Le coût suit donc la part du salon dans les correspondances. L'adhésion à un salon demandé
+# est vérifiée avant la requête ; en SQLite la page finale est de toute façon refiltrée.
+# PostgreSQL : le filtre reste toujours dans les candidats et la page ne fait plus que relire
+# ses messages par clé ; refiltrer après coup laissait le planificateur joindre tous les
+# messages visibles aux candidats.
+# SQLite : score (bm25) et extrait sont calculés pendant ce parcours, en une passe ; un
+# `ORDER BY rank` ferait trier par FTS5 toutes les correspondances, avant tout filtre.
+SEARCH_SQL = {
+    "sqlite": """
+        SELECT hits.id, m.room_id, r.name AS room_name, m.author_display_name, m.created_at, hits.snippet
+        FROM (
+            SELECT messages_fts.rowid AS id, bm25(messages_fts) AS score,
+                   snippet(messages_fts, 0, '[', ']', '…', 12) AS snippet
+            FROM messages_fts
+            JOIN messages m ON m.id = messages_fts.rowid
+            {visible}
+            WHERE messages_fts MATCH :match {room_filter}
+            ORDER BY messages_fts.rowid DESC LIMIT :candidates
+        ) hits
+        JOIN messages m ON m.id = hits.id
+        JOIN user_room ur ON ur.room_id = m.room_id AND ur.user_id = :user_id
+        JOIN rooms r ON r.id = m.room_id AND r.active
+        ORDER BY hits.score, hits.id DESC
+        LIMIT :limit OFFSET :offset
+    """,
+    "postgresql": """
+        SELECT m.id, m.room_id, r.name AS room_name, m.author_display_name, m.created_at,
+               ts_headline('french', m.content, q.query, 'StartSel=[, StopSel=], MaxWords=12, MinWords=4') AS snippet
+        FROM (
+            SELECT m.id FROM messages m
+            JOIN user_room ur ON ur.room_id = m.room_id AND ur.user_id = :user_id
+            JOIN rooms r ON r.id = m.room_id AND r.active
+            WHERE m.search_vector @@ to_tsquery('french', :match) AND m.message_type = 'chat' {room_filter}
+            ORDER BY m.id DESC LIMIT :candidates
+        ) hits
+        CROSS JOIN to_tsquery('french', :match) AS q(query)
+        JOIN messages m ON m.id = hits.id
+        JOIN rooms r ON r.id = m.room_id
+        ORDER BY ts_rank(m.search_vector, q.query) DESC, m.id DESC
+        LIMIT :limit OFFSET :offset
+    """,
+}
+SEARCH_VISIBLE = """
+            JOIN user_room ur ON ur.room_id = m.room_id AND ur.user_id = :user_id
+            JOIN rooms r ON r.id = m.room_id AND r.active"""
+# PostgreSQL : psycopg prépare la requête côté serveur dès la 5e exécution, puis le serveur passe à
+# un plan générique qui ignore le mot cherché (x10 sur un mot courant) : plan recalculé à chaque
+# recherche, le temps de la transaction.
+SEARCH_CUSTOM_PLAN = text("SET LOCAL plan_cache_mode = force_custom_plan")
+
+
+def search_stmt(match: str, user_id: int, room_id: int = None, limit: int = SEARCH_PAGE_SIZE, offset: int = 0):
+    """
+    Recherche classée (bm25 / ts_rank) limitée aux salons actifs dont l'utilisateur est membre,
+    avec un extrait du message où les termes trouvés sont entre crochets.
+    """
+    room_filter = "AND m.room_id = :room_id" if room_id is not None else ""
+    visible = SEARCH_VISIBLE if room_id is None else ""
+    params = {"match": match, "user_id": user_id, "candidates": SEARCH_MAX_CANDIDATES, "limit": max(1, min(limit, MESSAGES_MAX_LIMIT)), "offset": max(0, offset)}
+    if room_id is not None:
+        params["room_id"] = room_id
+
+    return (
+        text(SEARCH_SQL["sqlite" if IS_SQLITE else "postgresql"].format(room_filter=room_filter, visible=visible))
+        .bindparams(**params)
+        .columns(id=Integer, room_id=Integer, room_name=String, author_display_name=String, created_at=DateTime, snippet=String)
+    )
+
+
+def search_messages(db: Session, user_id: int, q: str, room_id: int = None, limit: int = SEARCH_PAGE_SIZE, offset: int = 0):
+    if room_id is not None and not verify_user_room(db, user_id, room_id):
+        raise HTTPException(status_code=401, detail="Vous ne faites pas partie de ce salon !")
+
+    match = fts_query(q)
+    if not match:
+        return []
+    if not IS_SQLITE:
+        db.execute(SEARCH_CUSTOM_PLAN)
+    return [dict(row._mapping) for row in db.execute(search_stmt(match, user_id, room_id, limit, offset))]
+
+
+def rebuild_messages_fts(db: Session):
+    """Reconstruit l'index FTS à partir des messages "chat" (ex: base antérieure à la recherche)."""
+    if not IS_SQLITE:
+        # PostgreSQL : la colonne tsvector est générée, seul l'index GIN est reconstruit.
+        # ANALYZE : sans statistiques (ex: après un import massif), le planificateur trie toutes
+        # les correspondances des salons visibles au lieu de s'arrêter aux plus récentes.
+        db.execute(text("REINDEX INDEX ix_messages_search_vector"))
+        db.execute(text("ANALYZE"))
+        db.commit()
+        return db.execute(select(func.count()).select_from(Message).where(Message.message_type == "chat")).scalar_one()
+
+    db.execute(text("INSERT INTO messages_fts(messages_fts) VALUES ('delete-all')"))
+    count = db.execute(text("INSERT INTO messages_fts(rowid, content) SELECT id, content FROM messages WHERE message_type = 'chat'")).rowcount
+    db.execute(text("INSERT INTO messages_fts(messages_fts) VALUES ('optimize')"))
+    db.commit()
+    return count
+
+
 # ==============================================================================
 # GESTION DES RÉACTIONS
 # ==============================================================================
@@ -837,6 +1467,7 @@ def reagir(db: Session, message_id: int, reaction_data: ReactionCreateSchema, us
 
     if existing_reaction:
         db.delete(existing_reaction)
+        db.execute(event_stmt("react", message.room_id, message_id))
         db.commit()
         # On renvoie un objet vide ou simulé pour dire "supprimé" au front,
         # ou on gère ça via un code HTTP spécifique. Ici on retourne l'objet supprimé.
@@ -850,6 +1481,7 @@ def reagir(db: Session, message_id: int, reaction_data: ReactionCreateSchema, us
     )
 
     db.add(reaction)
+    db.execute(event_stmt("react", message.room_id, message_id))
     db.commit()
     db.refresh(reaction)
     return reaction
@@ -867,11 +1499,13 @@ def dereagir(db: Session, user_id: int, reaction_id: int):
 
     try:
         # 2. Suppression
+        room_id = reaction.message.room_id
         db.delete(reaction)
+        db.execute(event_stmt("react", room_id, reaction.message_id))
         db.commit()
 
-        # 3. Retourne un message simple (l'objet n'existe plus)
-        return {"detail": "Réaction supprimée", "reaction_id": reaction_id}
+        # 3. Retourne un message simple (l'objet n'existe plus) ; room_id sert aux ETags (main.py)
+        return {"detail": "Réaction supprimée", "reaction_id": reaction_id, "room_id": room_id}
 
     except Exception as e:
         db.rollback()
@@ -0,0 +1,542 @@
+from sqlalchemy import select, delete, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload, noload
+from sqlalchemy.exc import IntegrityError
+from database.models import User, Room, Message, Reaction, user_room, SEARCH_PAGE_SIZE, MESSAGE_EDIT_WINDOW, MESSAGE_DELETE_WINDOW, IS_SQLITE
+from database.crud import (
+    user_rooms_stmt,
+    user_room_row_to_dict,
+    last_message_fields,
+    room_members_stmt,
+    room_summary_stmt,
+    room_stats_on_create_stmt,
+    room_stats_on_edit_stmt,
+    room_stats_on_delete_stmt,
+    unread_on_create_stmts,
+    unread_on_delete_stmt,
+    read_cursor_stmt,
+    mark_all_read_stmt,
+    history_stmt,
+    history_limit,
+    around_limit,
+    compact_message_stmt,
+    reaction_summary_stmt,
+    room_message_ids_stmt,
+    reaction_summaries,
+    compact_messages,
+    fts_query,
+    search_stmt,
+    SEARCH_CUSTOM_PLAN,
+    event_stmt,
+    event_bounds_stmt,
+    sync_events_stmt,
+    room_events_stmt,
+    sync_limit,
+    sync_reset,
+    compact_events,
+    sync_messages_stmt,
+    sync_batch,
+)
+from database.shemas import *
+from fastapi import HTTPException
+from datetime import datetime, timedelta
+from password_hasher import password_hasher
+
+
+# ==============================================================================
+# VERSIONS ASYNCHRONES DES FONCTIONS "CHAUDES" DE crud.py
+# ==============================================================================
+# Même logique que database/crud.py, mais sur une AsyncSession (aiosqlite) :
+# les routes `async def` de main.py n'immobilisent plus la boucle d'événements
+# (et donc les diffusions WebSocket) pendant un commit SQLite.
+#
+# En asynchrone, aucun chargement paresseux (lazy load) n'est possible : tout ce
+# que MessageSchema lit doit être chargé explicitement par les options ci-dessous.
+
+
+def message_full_options():
+    """Options de chargement nécessaires pour valider un message avec MessageSchema."""
+    return (
+        joinedload(Message.author),
+        selectinload(Message.reactions).joinedload(Reaction.user),
+        # Le parent est chargé avec son auteur et ses réactions, mais pas son propre parent
+        joinedload(Message.parent).options(
+            joinedload(Message.author),
+            selectinload(Message.reactions).joinedload(Reaction.user),
+            noload(Message.parent),
+        ),
+    )
+
+
+def _inject_parent_info(msg: Message):
+    if msg.parent:
+        msg.parent_content = msg.parent.content
+        msg.parent_author = msg.parent.author.pseudo if msg.parent.author else "Inconnu"
+    else:
+        msg.parent_content = None
+        msg.parent_author = None
+
+
+async def fetch_compact(db: AsyncSession, stmt, user_id: int = None, with_reactions: bool = True):
+    """
+    Exécute un select(Message) au format compact : 2 requêtes (messages + GROUP BY des réactions).
+    with_reactions=False : une seule requête, réactions vides (chargées à part, voir get_room_reactions).
+    """
+    rows = (await db.execute(compact_message_stmt(stmt))).all()
+    summary = (await db.execute(reaction_summary_stmt([row.id for row in rows], user_id))).all() if rows and with_reactions else []
+    return compact_messages(rows, summary)
+
+
+async def get_message_compact(db: AsyncSession, message_id: int, user_id: int = None):
+    """Un message au format compact (diffusion WebSocket : user_id absent, donc pas de my_reaction)."""
+    messages = await fetch_compact(db, select(Message).where(Message.id == message_id), user_id)
+    return messages[0] if messages else None
+
+
+async def verify_user_room(db: AsyncSession, user_id: int, room_id: int):
+    stmt = select(user_room.c.user_id).where(user_room.c.user_id == user_id, user_room.c.room_id == room_id)
+    return (await db.execute(stmt)).first() is not None
+
+
+async def get_message_full(db: AsyncSession, message_id: int):
+    """Recharge un message avec toutes ses relations (pour la diffusion WebSocket)."""
+    stmt = select(Message).options(*message_full_options()).where(Message.id == message_id).execution_options(populate_existing=True)
+    msg = (await db.execute(stmt)).scalar_one_or_none()
+    if msg:
+        _inject_parent_info(msg)
+    return msg
+
+
+# ==============================================================================
+# GESTION DES UTILISATEURS
+# ==============================================================================
+
+
+async def get_user_by_email(db: AsyncSession, email: str):
+    stmt = select(User).where(User.email == email)
+    return (await db.execute(stmt)).scalars().first()
+
+
+async def new_user(db: AsyncSession, user_data: RegisterRequest):
+    """Comme crud.new_user, mais le hachage bcrypt passe par password_hasher (pool de processus)."""
+    user_dict = user_data.model_dump()
+
+    # On Vérifie la longueur du mot de passe (avant de payer le hachage)
+    if len(user_dict["password"]) < 8:
+        raise HTTPException(status_code=403, detail="Le mot de pass est trop court !")
+
+    user_dict["password"] = await password_hasher.hash(user_dict["password"])
+
+    try:
+        user = User(**user_dict)
+        stmt = select(Room).where(Room.name == "Salon Général")
+        general_room = (await db.execute(stmt)).scalars().first()
+
+        db.add(user)
+        await db.flush()  # Important pour avoir l'ID généré
+        if general_room:
+            await db.execute(user_room.insert().values(user_id=user.id, room_id=general_room.id))
+        await db.commit()
+    except IntegrityError as IntE:
+        print(f"Erreur : {IntE}")
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Email ou Pseudo déjà utilisé !")
+    except Exception as e:
+        await db.rollback()
+        print(f"Erreur new_user: {e}")
+        raise HTTPException(status_code=500, detail="Erreur serveur")
+
+    # Message de bienvenue automatique (Optionnel)
+    if general_room:
+        try:
+            welcome = Message(
+                content=f"{user.pseudo} a rejoint le chat !",
+                author_id=user.id,
+                room_id=general_room.id,
+                message_type="join",
+                author_display_name=user.pseudo,
+            )
+            db.add(welcome)
+            await db.flush()
+            await db.execute(mark_all_read_stmt(user.id, general_room.id))
+            await db.execute(event_stmt("join", general_room.id, user_id=user.id))
+            await db.execute(event_stmt("new", general_room.id, welcome.id))
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            print(f"Erreur message bienvenue: {e}")
+            # Pas grave si le message échoue, l'user est créé
+
+    return user
+
+
+async def rehash_password(db: AsyncSession, user: User, password: str):
+    """Refait le hachage d'un mot de passe vérifié si BCRYPT_ROUNDS a changé (sans effet en cas d'échec)."""
+    try:
+        user.password = await password_hasher.hash(password)
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        print(f"Erreur rehash: {e}")
+
+
+async def lift_expired_ban(db: AsyncSession, user_id: int):
+    """Lève un ban arrivé à expiration (sans commit : job de write_queue). Renvoie True si levé."""
+    stmt = (
+        update(User)
+        .where(User.id == user_id, User.is_banned.is_(True), User.ban_expires_at < datetime.now())
+        .values(is_banned=False, ban_expires_at=None)
+    )
+    return (await db.execute(stmt)).rowcount > 0
+
+
+# ==============================================================================
+# GESTION DES SALONS (ROOMS)
+# ==============================================================================
+
+
+async def get_user_rooms(db: AsyncSession, user_id: int):
+    rows = (await db.execute(user_rooms_stmt(user_id))).all()
+    return [user_room_row_to_dict(row) for row in rows]
+
+
+async def get_room_member_ids(db: AsyncSession, room_id: int):
+    return set((await db.execute(room_members_stmt(room_id))).scalars().all())
+
+
+async def get_room_summary(db: AsyncSession, room_id: int):
+    """Aperçu du dernier message du salon (après une suppression, il a pu changer)."""
+    row = (await db.execute(room_summary_stmt(room_id))).first()
+    return last_message_fields(*row) if row else None
+
+
+async def update_room(db: AsyncSession, room_id: int, user_id: int, update_data: RoomUpdateSchema):
+    stmt = select(Room).options(joinedload(Room.creator)).where(Room.id == room_id)
+    room = (await db.execute(stmt)).scalars().first()
+
+    if not room:
+        raise HTTPException(status_code=404, detail="Salon introuvable")
+
+    if room.created_by != user_id:
+        raise HTTPException(status_code=403, detail="Seul le créateur peut modifier ce salon")
+
+    for key, value in update_data.model_dump(exclude_unset=True).items():
+        setattr(room, key, value)
+
+    try:
+        await db.execute(event_stmt("room", room_id))
+        await db.commit()
+        return room
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Ce nom de salon est déjà pris.")
+
+
+async def delete_room_func(db: AsyncSession, room_id: int, user_id: int):
+    room = (await db.execute(select(Room).where(Room.id == room_id))).scalars().first()
+
+    if not room:
+        raise HTTPException(status_code=404, detail="Salon introuvable")
+
+    if room.created_by != user_id:
+        raise HTTPException(status_code=403, detail="Seul le créateur peut supprimer ce salon")
+
+    try:
+        room.active = False
+        await db.execute(event_stmt("room", room_id))
+        await db.commit()
+        return {"detail": "Salon supprimé avec succès", "room_id": room_id}
+    except Exception as e:
+        await db.rollback()
+        print(f"Erreur delete_room: {e}")
+        raise HTTPException(status_code=500, detail="Erreur serveur lors de la suppression")
+
+
+# ==============================================================================
+# GESTION DES MESSAGES
+# ==============================================================================
+
+
+async def get_messages(
+    db: AsyncSession, room_id: int, user_id: int, before_id: int = None, after_id: int = None, limit: int = None, with_reactions: bool = True
+):
+    if not await verify_user_room(db, user_id, room_id):
+        raise HTTPException(status_code=401, detail="Vous ne faites pas partie de ce salon !")
+    try:
+        unread_count = 0
+        initial = not before_id and not after_id
+
+        if initial and not limit:
+            ur = (await db.execute(select(user_room).where(user_room.c.user_id == user_id, user_room.c.room_id == room_id))).first()
+            last_read = getattr(ur, "last_read_message_id", 0) if ur else 0
+            if last_read > 0:
+                unread_count = ur.unread_count or 0
+
+        stmt = history_stmt(room_id, before_id, after_id, history_limit(unread_count, limit, initial))
+
+        results = await fetch_compact(db, stmt, user_id, with_reactions)
+        if not after_id:
+            results.reverse()
+
+        return results
+    except Exception as e:
+        print(f"Erreur get_messages: {e}")
+        raise HTTPException(status_code=500, detail="Impossible de récupérer les messages")
+
+
+async def get_messages_around(db: AsyncSession, room_id: int, user_id: int, message_id: int, before: int = 25, after: int = 25):
+    """Contexte autour d'un message : deux parcours bornés de l'index (room_id, id)."""
+    if not await verify_user_room(db, user_id, room_id):
+        raise HTTPException(status_code=401, detail="Vous ne faites pas partie de ce salon !")
+
+    older_stmt = history_stmt(room_id, before_id=message_id + 1, limit=around_limit(before) + 1)
+    older = await fetch_compact(db, older_stmt, user_id)
+    if not older or older[0]["id"] != message_id:
+        raise HTTPException(status_code=404, detail="Message introuvable")
+
+    newer = []
+    if after > 0:
+        newer_stmt = history_stmt(room_id, after_id=message_id, limit=around_limit(after))
+        newer = await fetch_compact(db, newer_stmt, user_id)
+
+    return list(reversed(older)) + newer
+
+
+async def insert_message(db: AsyncSession, room_id: int, message_data: MessageCreate, author_id, message_type="chat"):
+    """
+    Écrit le message et met à jour les projections, SANS commit, puis renvoie son id.
+    Utilisé comme job de la file d'écriture (write_queue.py) et par create_message.
+    """
+    user = await db.get(User, author_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="Utilisateur introuvable")
+
+    if not await verify_user_room(db, author_id, room_id):
+        raise HTTPException(status_code=401, detail="Vous n'avez pas rejoint le salon !")
+
+    try:
+        new_msg = Message(
+            content=message_data.content,
+            author_id=author_id,
+            room_id=room_id,
+            parent_id=message_data.parent_id,
+            message_type=message_type,
+            author_display_name=user.pseudo,
+        )
+        db.add(new_msg)
+        await db.flush()
+        if message_type == "chat":
+            await db.execute(room_stats_on_create_stmt(new_msg))
+            for stmt in unread_on_create_stmts(new_msg):
+                await db.execute(stmt)
+        await db.execute(event_stmt("new", room_id, new_msg.id))
+        return new_msg.id
+    except Exception as e:
+        print(f"Erreur create_message: {e}")
+        raise HTTPException(status_code=400, detail="Erreur lors de l'envoi")
+
+
+async def create_message(db: AsyncSession, room_id: int, message_data: MessageCreate, author_id, message_type="chat"):
+    try:
+        msg_id = await insert_message(db, room_id, message_data, author_id, message_type)
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+
+    # RE-CHARGER AVEC LES RELATIONS (pour avoir le parent_content immédiatement)
+    return await get_message_full(db, msg_id)
+
+
+async def edit_message_func(db: AsyncSession, message_id: int, data: EditMessageSchema, user_id: int):
+    """
+    Modifier un message.
+    """
+    message = await db.get(Message, message_id)
+
+    if not message:
+        raise HTTPException(status_code=404, detail="Message introuvable")
+
+    if (datetime.now() - MESSAGE_EDIT_WINDOW) > message.created_at:
+        raise HTTPException(status_code=401, detail="Impossible de modifier un message après 15 minutes.")
+
+    if message.message_type in ["join", "quit"]:
+        raise HTTPException(status_code=403, detail="Impossible de modifier un message système.")
+
+    if message.author_id != user_id:
+        raise HTTPException(status_code=403, detail="Vous n'avez pas le droit de supprimer ce message.")
+
+    try:
+        message.content = data.content
+        message.modified = True
+        await db.execute(room_stats_on_edit_stmt(message))
+        await db.execute(event_stmt("edit", message.room_id, message.id))
+        await db.commit()
+        return await get_message_compact(db, message_id, user_id)
+    except Exception as e:
+        await db.rollback()
+        print(f"Erreur edit_message: {e}")
+        raise HTTPException(status_code=500, detail="Impossible de modifier le message")
+
+
+async def delete_message_func(db: AsyncSession, message_id: int, user_id: int):
+    """
+    Supprime un message.
+    """
+    message = await db.get(Message, message_id)
+
+    if not message:
+        raise HTTPException(status_code=404, detail="Message introuvable")
+
+    if (datetime.now() - MESSAGE_DELETE_WINDOW) > message.created_at:
+        raise HTTPException(status_code=403, detail="Impossible de supprimer un message envoyé depuis plus de 3 jours.")
+
+    if message.message_type in ["join", "quit"]:
+        raise HTTPException(status_code=403, detail="Impossible de supprimer un message système.")
+
+    user = await db.get(User, user_id)
+    is_admin = (user.role == "admin") if user else False
+    is_author = message.author_id == user_id
+
+    if not (is_author or is_admin):
+        raise HTTPException(status_code=403, detail="Vous n'avez pas le droit de supprimer ce message.")
+
+    try:
+        if message.message_type == "chat":
+            await db.execute(room_stats_on_delete_stmt(message))
+            await db.execute(unread_on_delete_stmt(message))
+        message.message_type = "delete"
+        await db.execute(event_stmt("delete", message.room_id, message.id))
+        await db.commit()
+        return message
+    except Exception as e:
+        await db.rollback()
+        print(f"Erreur delete_message: {e}")
+        raise HTTPException(status_code=500, detail="Impossible de supprimer le message")
+
+
+# ==============================================================================
+# RECHERCHE PLEIN TEXTE
+# ==============================================================================
+
+
+async def search_messages(db: AsyncSession, user_id: int, q: str, room_id: int = None, limit: int = SEARCH_PAGE_SIZE, offset: int = 0):
+    if room_id is not None and not await verify_user_room(db, user_id, room_id):
+        raise HTTPException(status_code=401, detail="Vous ne faites pas partie de ce salon !")
+
+    match = fts_query(q)
+    if not match:
+        return []
+    if not IS_SQLITE:
+        await db.execute(SEARCH_CUSTOM_PLAN)
+    return [dict(row._mapping) for row in await db.execute(search_stmt(match, user_id, room_id, limit, offset))]
+
+
+# ==============================================================================
+# GESTION DES RÉACTIONS
+# ==============================================================================
+
+
+async def insert_reaction(db: AsyncSession, message_id: int, reaction_data: ReactionCreateSchema, user_id):
+    """
+    Ajoute ou remplace la réaction de l'utilisateur, SANS commit, puis renvoie son id.
+    Utilisé comme job de la file d'écriture (write_queue.py) et par reagir.
+    """
+    message = await db.get(Message, message_id)
+
+    if not message:
+        raise HTTPException(status_code=404, detail="Message introuvable")
+
+    if message.message_type in ["join", "quit"]:
+        raise HTTPException(status_code=400, detail="On ne peut pas réagir aux messages système.")
+
+    await db.execute(delete(Reaction).where(Reaction.user_id == user_id, Reaction.message_id == message_id))
+
+    reaction = Reaction(
+        user_id=user_id,
+        message_id=message_id,
+        emoji=reaction_data.emoji,
+    )
+
+    db.add(reaction)
+    await db.flush()
+    await db.execute(event_stmt("react", message.room_id, message_id))
+    return reaction.id
+
+
+async def get_reaction_full(db: AsyncSession, reaction_id: int):
+    stmt = select(Reaction).options(joinedload(Reaction.user)).where(Reaction.id == reaction_id)
+    return (await db.execute(stmt)).scalar_one()
+
+
+async def reagir(db: AsyncSession, message_id: int, reaction_data: ReactionCreateSchema, user_id):
+    """
+    Ajoute ou remplace la réaction de l'utilisateur sur un message.
+    """
+    reaction_id = await insert_reaction(db, message_id, reaction_data, user_id)
+    await db.commit()
+    return await get_reaction_full(db, reaction_id)
+
+
+async def get_room_reactions(db: AsyncSession, room_id: int, user_id: int, after_id: int = None, before_id: int = None):
+    """Réactions agrégées des messages ]after_id, before_id[ d'un salon (pages chargées sans réactions)."""
+    if not await verify_user_room(db, user_id, room_id):
+        raise HTTPException(status_code=401, detail="Vous ne faites pas partie de ce salon !")
+    summary = (await db.execute(reaction_summary_stmt(room_message_ids_stmt(room_id, after_id, before_id), user_id))).all()
+    return reaction_summaries(summary)
+
+
+# ==============================================================================
+# SYNCHRONISATION (journal des changements, voir crud.py)
+# ==============================================================================
+
+
+async def get_sync(db: AsyncSession, user_id: int, since: int = None, limit: int = None):
+    """Lot compact des changements d'id > since dans les salons de l'utilisateur (GET /sync)."""
+    limit = sync_limit(limit)
+    head, oldest = (await db.execute(event_bounds_stmt())).one()
+    if sync_reset(since, head, oldest):
+        return {"seq": head or 0, "reset": True}
+
+    rows = (await db.execute(sync_events_stmt(user_id, since, limit))).all()
+    batch, changed, deleted, reacted = compact_events(rows, user_id, since, limit)
+    messages = await fetch_compact(db, sync_messages_stmt(changed), user_id) if changed else []
+    summaries = (await db.execute(reaction_summary_stmt(sorted(reacted), user_id))).all() if reacted else []
+    return sync_batch(batch, messages, deleted | (changed - {msg["id"] for msg in messages}), reacted, summaries)
+
+
+async def get_event_head(db: AsyncSession):
+    """Dernier seq du journal (curseur donné au client à la connexion d'un WebSocket)."""
+    head, _ = (await db.execute(event_bounds_stmt())).one()
+    return head or 0
+
+
+async def get_room_sync(db: AsyncSession, room_id: int, since: int = None):
+    """
+    Changements d'un salon depuis `since`, pour la reprise d'un WebSocket quand le tampon
+    mémoire ne suffit plus (websocket_manager.py). Sans my_reaction (comme les diffusions).
+    reset=True si le curseur est inutilisable ou si le lot ne tient pas dans SYNC_MAX_EVENTS.
+    """
+    limit = sync_limit()
+    head, oldest = (await db.execute(event_bounds_stmt())).one()
+    if sync_reset(since, head, oldest):
+        return {"seq": head or 0, "reset": True}
+
+    rows = (await db.execute(room_events_stmt(room_id, since, limit))).all()
+    batch, changed, deleted, reacted = compact_events(rows, None, since, limit)
+    if batch["has_more"]:
+        return {"seq": batch["seq"], "reset": True}
+    messages = await fetch_compact(db, sync_messages_stmt(changed)) if changed else []
+    summaries = (await db.execute(reaction_summary_stmt(sorted(reacted)))).all() if reacted else []
+    return sync_batch(batch, messages, deleted | (changed - {msg["id"] for msg in messages}), reacted, summaries)
+
+
+# ==============================================================================
+# CURSEUR DE LECTURE
+# ==============================================================================
+
+
+async def update_read_cursor(db: AsyncSession, room_id: int, last_read_id: int, user_id: int):
+    """Avance le curseur de lecture, SANS commit (job de la file d'écriture)."""
+    await db.execute(read_cursor_stmt(room_id, last_read_id, user_id))
+    return {"status": "ok"}
@@ -0,0 +1,104 @@
+"""
+Tâches de maintenance de la base (à lancer depuis la racine du dépôt) :
+
+    python -m database.maintenance rebuild-room-stats
+    python -m database.maintenance check-unread
+    python -m database.maintenance repair-unread
+    python -m database.maintenance rebuild-search
+    python -m database.maintenance prune-events
+"""
+
+import argparse
+
+from sqlalchemy import inspect, text
+
+from database.models import Base, engine, SessionLocal, Message, create_messages_fts
+import database.crud as db_inter
+
+
+def add_missing_columns():
+    """create_all ne modifie pas les tables existantes : on ajoute les colonnes apparues depuis."""
+    with engine.begin() as conn:
+        # Inspection sur la même connexion : l'écrivain n'en a qu'une (pool_size=1)
+        inspector = inspect(conn)
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                col_type = column.type.compile(dialect=engine.dialect)
+                default = f" DEFAULT {column.server_default.arg}" if column.server_default is not None else ""
+                not_null = " NOT NULL" if not column.nullable and default else ""
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}{not_null}{default}"))
+                print(f"+ colonne {table.name}.{column.name}")
+
+
+def add_missing_indexes():
+    """Idem pour les index déclarés dans models.py (ex: ix_messages_room_id_id)."""
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {i["name"] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(conn)
+                    print(f"+ index {index.name}")
+
+
+def rebuild_room_stats():
+    with SessionLocal() as db:
+        count = db_inter.rebuild_room_stats(db)
+    print(f"=== room_stats reconstruite ({count} salons) ===")
+
+
+def check_unread(repair=False):
+    with SessionLocal() as db:
+        mismatches = db_inter.check_unread_counters(db, repair=repair)
+    for user_id, room_id, stored, expected in mismatches:
+        print(f"user {user_id} / salon {room_id} : {stored} stocké, {expected} attendu")
+    state = "corrigé(s)" if repair else "détecté(s)"
+    print(f"=== {len(mismatches)} écart(s) {state} ===")
+
+
+def rebuild_search():
+    with SessionLocal() as db:
+        count = db_inter.rebuild_messages_fts(db)
+    print(f"=== Index de recherche reconstruit ({count} messages) ===")
+
+
+def prune_events():
+    with SessionLocal() as db:
+        count = db_inter.prune_events(db)
+    print(f"=== Journal purgé ({count} événements) ===")
+
+
+COMMANDS = {
+    "rebuild-room-stats": rebuild_room_stats,
+    "check-unread": check_unread,
+    "repair-unread": lambda: check_unread(repair=True),
+    "rebuild-search": rebuild_search,
+    "prune-events": prune_events,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintenance de la base CIF Connect")
+    parser.add_argument("command", choices=COMMANDS)
+    args = parser.parse_args()
+
+    # Crée les tables, colonnes et index manquants (ex: projections ajoutées après coup)
+    Base.metadata.create_all(engine)
+    add_missing_columns()
+    add_missing_indexes()
+    # La table FTS n'est créée automatiquement qu'avec la table messages : rattrapage ici
+    with engine.begin() as conn:
+        create_messages_fts(Message.__table__, conn)
+    COMMANDS[args.command]()
+
+
+if __name__ == "__main__":
+    main()
@@ -54,6 +54,7 @@ def seed_messages(count=200):
 
         db.commit()
         print(f"Succès ! {count} messages ont été ajoutés au salon ID 1.")
+        print("Pensez à lancer `python -m database.maintenance rebuild-room-stats` depuis la racine.")
 
     except Exception as e:
         db.rollback()
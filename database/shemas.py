@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Dict
 
 # ==============================================================================
 # SCHÉMAS DE BASE (Partagés)
@@ -114,10 +114,67 @@ class MessageSchema(BaseModel):
 
     model_config = {"from_attributes": True}
 
+
+class MessageCompactSchema(BaseModel):
+    """
+    Lecture d'un message, format v2 (compact) :
+    réponse à plat (pas de parent imbriqué) et réactions agrégées par le serveur.
+    """
+
+    id: int
+    room_id: int
+    author_id: Optional[int] = None
+    author_display_name: str
+    content: str
+    message_type: str
+    created_at: datetime
+    modified: bool
+    parent_id: Optional[int] = None
+    parent_author: Optional[str] = None
+    parent_excerpt: Optional[str] = None  # Début du message parent (PARENT_EXCERPT_LENGTH)
+    reactions: Dict[str, int] = {}  # {emoji: nombre}
+    my_reaction: Optional[str] = None  # Emoji de l'utilisateur qui lit (absent des diffusions WebSocket)
+
     # class ConfigDict:
     # 	from_attributes = True
 
 
+class MessageReactionsSchema(BaseModel):
+    """Réactions d'un message, chargées à part des pages d'historique figées (GET /room/{id}/reactions)"""
+
+    id: int
+    reactions: Dict[str, int] = {}
+    my_reaction: Optional[str] = None
+
+
+class SyncSchema(BaseModel):
+    """
+    Changements depuis le curseur `since` (GET /sync), réduits au dernier état.
+    reset=True : curseur absent ou trop ancien, le client recharge salons et historiques puis repart de `seq`.
+    """
+
+    seq: int  # Curseur à renvoyer au prochain appel
+    has_more: bool = False  # Lot plein : rappeler aussitôt avec since=seq
+    reset: bool = False
+    messages: List[MessageCompactSchema] = []  # Nouveaux ou modifiés, dans leur état actuel
+    deleted: List[int] = []  # Ids des messages supprimés
+    reactions: List[MessageReactionsSchema] = []  # Compteurs actuels des messages qui ont reçu / perdu une réaction
+    rooms_joined: List[int] = []
+    rooms_left: List[int] = []
+    rooms_changed: List[int] = []  # Salons modifiés ou supprimés : recharger la liste des salons
+
+
+class SearchResultSchema(BaseModel):
+    """Résultat de recherche plein texte (classé par pertinence)"""
+
+    id: int
+    room_id: int
+    room_name: str
+    author_display_name: str
+    created_at: datetime
+    snippet: str  # Extrait du message, termes trouvés entre [crochets]
+
+
 class EditMessageSchema(BaseModel):
     content: str
 
@@ -1,21 +1,49 @@
 # main.py
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect, WebSocketException, status
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 from websocket_manager import manager
 
 # Import des modules locaux
-from database.models import SessionLocal, Message, User
+from database.models import SessionLocal, ReadSessionLocal, AsyncSessionLocal, AsyncReadSessionLocal, Message, User, SEARCH_PAGE_SIZE, SYNC_MAX_EVENTS, MESSAGES_MAX_LIMIT
 import database.crud as db_inter
+import database.crud_async as db_async
 from database.shemas import *
-from security import create_access_token, verify_password, SECRET_KEY, ALGORITHM
+from security import create_access_token, needs_rehash, SECRET_KEY, ALGORITHM
 
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
-from websocket_manager import router as ws_router, manager
-
-app = FastAPI(title="CIF Connect API", version="1.0.0")
-app.include_router(ws_router)  # On branche les websockets ici
+from write_queue import write_queue
+from auth_cache import auth_cache
+from password_hasher import password_hasher
+from content_negotiation import NegotiatedResponse, ContentNegotiationMiddleware, decode_frame
+from compression import CompressionMiddleware
+from resource_versions import resource_versions
+from settled_pages import settled_pages
+from contextlib import asynccontextmanager
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Un seul écrivain pour les écritures chaudes (group commit, voir write_queue.py)
+    write_queue.start()
+    # bcrypt dans un pool de processus dédié (voir password_hasher.py)
+    password_hasher.start()
+    # Diffusions WebSocket entre workers (CIF_BROKER_URL, voir broker.py)
+    await manager.start()
+    yield
+    await manager.stop()
+    await write_queue.stop()
+    password_hasher.stop()
+
+
+# Réponses encodées par orjson (plusieurs fois plus rapide que json sur les pages d'historique),
+# ou en MessagePack si le client envoie `Accept: application/msgpack` (voir content_negotiation.py)
+app = FastAPI(title="CIF Connect API", version="1.0.0", lifespan=lifespan, default_response_class=NegotiatedResponse)
+app.add_middleware(ContentNegotiationMiddleware)
+# Ajouté en dernier, donc le plus externe : compresse le corps final (brotli / gzip, voir compression.py)
+app.add_middleware(CompressionMiddleware)
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
@@ -49,51 +77,80 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 #         )
 
 
-def get_db():
-    db = SessionLocal()
+# Les routes GET/HEAD sont en lecture seule : elles passent par le pool de lecteurs (WAL),
+# les autres par l'écrivain. Voir SQLITE_PRAGMAS dans database/models.py
+READ_ONLY_METHODS = ("GET", "HEAD")
+
+
+def get_db(request: Request):
+    db = ReadSessionLocal() if request.method in READ_ONLY_METHODS else SessionLocal()
     try:
         yield db
     finally:
         db.close()
 
 
-# Ajoute 'Depends(get_db)' dans les paramètres de get_current_user
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_async_db(request: Request):
+    """Session asynchrone pour les routes `async def` (ne bloque pas la boucle d'événements)"""
+    factory = AsyncReadSessionLocal if request.method in READ_ONLY_METHODS else AsyncSessionLocal
+    async with factory() as db:
+        yield db
+
+
+# Ajoute 'Depends(get_async_db)' dans les paramètres de get_current_user
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: str = payload.get("sub")
         if user_id is None:
             raise db_inter.credentials_exception
+        user_id = int(user_id)
 
-        user = db.query(User).filter(User.id == int(user_id)).first()
-        if not user:
-            raise db_inter.credentials_exception
+        # État d'authentification en mémoire (voir auth_cache.py) : pas de requête SQL si présent
+        state = auth_cache.get(user_id)
+        if state is None:
+            user = await db.get(User, user_id)
+            if not user:
+                raise db_inter.credentials_exception
+            state = auth_cache.put(user)
 
         # VÉRIFICATION DU BANNISSEMENT EN TEMPS RÉEL
-        if user.is_banned:
-            if user.ban_expires_at and user.ban_expires_at < datetime.now():
-                # Le ban est terminé, on le lève
-                user.is_banned = False
-                user.ban_expires_at = None
-                db.commit()
+        if state.is_banned:
+            if state.ban_expires_at and state.ban_expires_at < datetime.now():
+                # Le ban est terminé, on le lève (les GET n'ont qu'une session en lecture seule)
+                await write_queue.submit(db_async.lift_expired_ban, user_id)
+                auth_cache.invalidate(user_id)
             else:
                 raise HTTPException(status_code=403, detail="Votre compte est banni.")
 
-        return int(user_id)
-    except JWTError:
+        # Jeton émis avant un changement de pseudo ou un ban (les anciens jetons sans "ver" valent 0)
+        if payload.get("ver", 0) != state.auth_version:
+            raise HTTPException(status_code=401, detail="Session expirée, reconnectez-vous")
+
+        return user_id
+    except (JWTError, ValueError):
         raise HTTPException(status_code=401, detail="Jeton invalide ou expiré")
 
 
+async def ensure_room_member(db: AsyncSession, user_id: int, room_id: int):
+    """Contrôle d'accès des réponses servies sans requête (pages figées) : SQL seulement si inconnu en mémoire."""
+    if resource_versions.is_member(user_id, room_id):
+        return
+    if not await db_async.verify_user_room(db, user_id, room_id):
+        raise HTTPException(status_code=401, detail="Vous ne faites pas partie de ce salon !")
+
+
 # ==============================================================================
 # UTILISATEURS (USERS)
 # ==============================================================================
 
 
 @app.post("/register", response_model=Token, status_code=status.HTTP_201_CREATED, tags=["Users"])
-def register(data: RegisterRequest, db: Session = Depends(get_db)):
+async def register(data: RegisterRequest, db: AsyncSession = Depends(get_async_db)):
     """Crée un nouvel utilisateur"""
-    user = db_inter.new_user(db, data)
-    access_token = create_access_token(data={"sub": str(user.id), "pseudo": user.pseudo, "role": user.role, "email": user.email})
+    user = await db_async.new_user(db, data)
+    manager.forget_members()  # Le nouvel inscrit a rejoint le Salon Général
+    access_token = create_access_token(data={"sub": str(user.id), "pseudo": user.pseudo, "role": user.role, "email": user.email, "ver": user.auth_version})
     return {"access_token": access_token, "token_type": "bearer"}
 
 
@@ -117,12 +174,13 @@ def register(data: RegisterRequest, db: Session = Depends(get_db)):
 
 # Mise à jour de la fonction login pour le message détaillé
 @app.post("/login", response_model=Token, tags=["Users"])
-def login(data: LoginRequest, db: Session = Depends(get_db)):
-    user = db_inter.get_user_by_email(db, data.email)
+async def login(data: LoginRequest, db: AsyncSession = Depends(get_async_db)):
+    password_hasher.ensure_capacity()  # 503 immédiat pendant un pic, sans requête SQL
+    user = await db_async.get_user_by_email(db, data.email)
 
     if not user:
         raise HTTPException(status_code=401, detail="Utilisateur introuvable !")
-    elif not verify_password(data.password, user.password):
+    elif not await password_hasher.verify(data.password, user.password):
         raise HTTPException(status_code=401, detail="Mot de passe incorrect !")
 
     if user.is_banned:
@@ -130,7 +188,8 @@ def login(data: LoginRequest, db: Session = Depends(get_db)):
         if user.ban_expires_at and user.ban_expires_at < datetime.now():
             user.is_banned = False
             user.ban_expires_at = None
-            db.commit()
+            await db.commit()
+            auth_cache.invalidate(user.id)
         else:
             # Calcul du temps restant
             if user.ban_expires_at:
@@ -142,7 +201,11 @@ def login(data: LoginRequest, db: Session = Depends(get_db)):
                 msg = f"Bannissement définitif. Motif: {user.ban_reason or 'Non spécifié'}"
             raise HTTPException(status_code=403, detail=msg)
 
-    access_token = create_access_token(data={"sub": str(user.id), "pseudo": user.pseudo, "role": user.role, "email": user.email})
+    # Coût bcrypt modifié (BCRYPT_ROUNDS) : on profite du mot de passe en clair pour rehacher
+    if needs_rehash(user.password, password_hasher.rounds):
+        await db_async.rehash_password(db, user, data.password)
+
+    access_token = create_access_token(data={"sub": str(user.id), "pseudo": user.pseudo, "role": user.role, "email": user.email, "ver": user.auth_version})
     return {"access_token": access_token, "token_type": "bearer"}
 
 
@@ -162,7 +225,12 @@ def change_pseudo(
     user = db_inter.update_user_pseudo(db, current_user_id, data.new_pseudo)
     if not user:
         raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
-    return {"detail": "Pseudo modifié", "new_pseudo": user.pseudo}
+    # Le pseudo apparaît dans les salons (créateur) et les signalements : toutes les ETags changent
+    resource_versions.bump_all()
+    # Les anciens jetons sont invalidés (auth_version) : on en renvoie un nouveau
+    manager.revoke_user(user.id)
+    access_token = create_access_token(data={"sub": str(user.id), "pseudo": user.pseudo, "role": user.role, "email": user.email, "ver": user.auth_version})
+    return {"detail": "Pseudo modifié", "new_pseudo": user.pseudo, "access_token": access_token, "token_type": "bearer"}
 
 
 @app.get("/rooms/{room_id}/online", tags=["Rooms"])
@@ -183,6 +251,8 @@ def toggle_ban_user(user_id: int, data: BanUserSchema, db: Session = Depends(get
     """Bannir ou débannir un utilisateur manuellement"""
     # Note : Tu pourras rajouter une vérification ici pour t'assurer que current_user_id est bien admin
     user = db_inter.update_user_ban_status(db, user_id, data)
+    if user.is_banned:
+        manager.revoke_user(user_id)  # Jetons révoqués : ses sessions /ws sont fermées
     return {"detail": "Statut mis à jour", "is_banned": user.is_banned}
 
 
@@ -193,10 +263,16 @@ def toggle_ban_user(user_id: int, data: BanUserSchema, db: Session = Depends(get
 
 @app.get("/rooms", response_model=List[RoomSchema], tags=["Rooms"])
 def list_rooms(
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     current_user_id: int = Depends(get_current_user),  # Le verrou est ici !
 ):
-    """Liste publique des salons"""
+    """Liste publique des salons (304 si If-None-Match correspond, voir resource_versions.py)"""
+    etag = resource_versions.rooms_etag()
+    if resource_versions.matches(request.headers.get("if-none-match"), etag):
+        return resource_versions.not_modified_response(etag)
+    resource_versions.tag(response, etag)
     # Logique pour chercher les salons en base de données
     return db_inter.get_all_rooms(db)
 
@@ -210,33 +286,59 @@ def create_room(
     """Créer un nouveau salon"""
     # await manager.broadcast_global({"action": "refresh_rooms"})
     # L'ID du créateur est dans le body (data.creator_id)
-    return db_inter.create_room(db, data, creator_id=creator_id)
+    room = db_inter.create_room(db, data, creator_id=creator_id)
+    resource_versions.bump_room_list()
+    resource_versions.bump_membership(creator_id)
+    manager.forget_members(room.id)
+    return room
 
 
 @app.put("/rooms/{room_id}", response_model=RoomSchema, tags=["Rooms"])
-async def update_room_info(room_id: int, update_data: RoomUpdateSchema, user_id: int = Depends(get_current_user), db: Session = Depends(get_db)):
+async def update_room_info(room_id: int, update_data: RoomUpdateSchema, user_id: int = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
     """
     Modifier un salon (Nom, description, icône).
     Seul le créateur peut le faire.
     """
-    await manager.broadcast_global({"action": "refresh_rooms"})
-    return db_inter.update_room(db, room_id, user_id, update_data)
+    room = await db_async.update_room(db, room_id, user_id, update_data)
+    resource_versions.bump_room(room_id)
+    resource_versions.bump_room_list()
+    # Nom, description ou icône : rechargement complet, mais seulement chez les membres
+    await manager.notify_room_members(room_id, {"action": "refresh_rooms"})
+    return room
 
 
 @app.delete("/rooms/{room_id}", status_code=status.HTTP_204_NO_CONTENT, tags=["Rooms"])
-async def delete_room(room_id: int, user_id: int = Depends(get_current_user), db: Session = Depends(get_db)):
+async def delete_room(room_id: int, user_id: int = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
     """
     Supprimer définitivement un salon.
     Seul le créateur peut le faire.
     """
-    await manager.broadcast_global({"action": "refresh_rooms"})
-    return db_inter.delete_room_func(db, room_id, user_id)
+    result = await db_async.delete_room_func(db, room_id, user_id)
+    resource_versions.bump_room(room_id)
+    resource_versions.bump_room_list()
+    await manager.notify_room_members(room_id, {"action": "refresh_rooms"})
+    manager.close_room(room_id)
+    return result
 
 
 @app.get("/user/rooms", response_model=List[RoomSchema], tags=["Rooms"])
-def get_my_rooms(db: Session = Depends(get_db), current_user_id: int = Depends(get_current_user)):
-    """Récupère les salons d'un utilisateur spécifique"""
-    return db_inter.get_user_rooms(db, current_user_id)
+async def get_my_rooms(
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    current_user_id: int = Depends(get_current_user),
+):
+    """Récupère les salons d'un utilisateur spécifique (304 si rien n'a changé pour lui)"""
+    etag = resource_versions.user_rooms_etag(current_user_id)
+    if resource_versions.matches(request.headers.get("if-none-match"), etag):
+        return resource_versions.not_modified_response(etag)
+
+    clock = resource_versions.clock
+    rooms = await db_async.get_user_rooms(db, current_user_id)
+    resource_versions.remember_user_rooms(current_user_id, [room["id"] for room in rooms])
+    # Pas d'ETag si une écriture a eu lieu pendant la lecture (la liste lue peut être déjà périmée)
+    resource_versions.tag(response, resource_versions.user_rooms_etag(current_user_id) if resource_versions.clock == clock else None)
+    return rooms
 
 
 @app.post("/user/rooms/join", response_model=RoomSchema, tags=["Rooms"])
@@ -246,13 +348,24 @@ def join_room(
     current_user_id: int = Depends(get_current_user),
 ):
     """Rejoindre un salon existant"""
-    return db_inter.join_new_room(db, data, current_user_id)
+    room = db_inter.join_new_room(db, data, current_user_id)
+    resource_versions.bump_room(room.id)
+    resource_versions.bump_membership(current_user_id)
+    manager.forget_members(room.id)
+    return room
+
+
+@app.get("/user/unread", tags=["Rooms"])
+def get_total_unread(db: Session = Depends(get_db), current_user_id: int = Depends(get_current_user)):
+    """Nombre total de messages non lus, tous salons confondus (lu dans les compteurs, sans scanner les messages)"""
+    return {"total_unread": db_inter.get_total_unread(db, current_user_id)}
 
 
 @app.post("/user/rooms/{room_id}/read", tags=["Rooms"])
-def mark_room_as_read(room_id: int, last_message_id: int, user_id: int = Depends(get_current_user), db: Session = Depends(get_db)):
-    """Met à jour le dernier message lu par l'utilisateur dans ce salon"""
-    if db_inter.read(room_id, last_message_id, user_id, db):
+async def mark_room_as_read(room_id: int, last_message_id: int, user_id: int = Depends(get_current_user)):
+    """Met à jour le dernier message lu par l'utilisateur dans ce salon (via la file d'écriture)"""
+    if await write_queue.submit(db_async.update_read_cursor, room_id, last_message_id, user_id):
+        resource_versions.bump_read(user_id)
         return {"statut": "ok"}
     else:
         return {"statut": "error"}
@@ -261,7 +374,11 @@ def mark_room_as_read(room_id: int, last_message_id: int, user_id: int = Depends
 @app.post("/user/rooms/{room_id}/quit", tags=["Rooms"], status_code=status.HTTP_204_NO_CONTENT)
 def quit_room(room_id: int, user_id: int = Depends(get_current_user), db: Session = Depends(get_db)):
     """Quitter un salon"""
-    return db_inter.quit_room_func(db, user_id=user_id, room_id=room_id)
+    result = db_inter.quit_room_func(db, user_id=user_id, room_id=room_id)
+    resource_versions.bump_room(room_id)
+    resource_versions.bump_membership(user_id)
+    manager.forget_members(room_id)
+    return result
 
 
 # ==============================================================================
@@ -269,71 +386,181 @@ def quit_room(room_id: int, user_id: int = Depends(get_current_user), db: Sessio
 # ==============================================================================
 
 
-@app.get("/room/{room_id}/messages", response_model=List[MessageSchema], tags=["Messages"])
-def read_messages(room_id: int, before_id: int = None, current_user_id: int = Depends(get_current_user), db: Session = Depends(get_db)):
-    """Lire l'historique d'un salon. Si l'utilisateur n'est pas dans le salon on restreind l'accès."""
-    return db_inter.get_messages(db, room_id, current_user_id, before_id)
+@app.get("/room/{room_id}/messages", response_model=List[MessageCompactSchema], tags=["Messages"])
+async def read_messages(
+    request: Request,
+    response: Response,
+    room_id: int,
+    before_id: int = None,
+    after_id: int = None,
+    limit: int = None,
+    reactions: bool = True,
+    current_user_id: int = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Lire l'historique d'un salon. Si l'utilisateur n'est pas dans le salon on restreind l'accès.
+    Pagination par clé : before_id (plus anciens), after_id (plus récents), limit (plafonné).
+    Réponse 304 si la page n'a pas changé depuis l'ETag envoyé dans If-None-Match.
+    reactions=false : réactions vides (voir GET /room/{id}/reactions). Les pages `before_id`
+    entièrement figées sont alors servies depuis settled_pages.py, sans requête SQL.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    may_be_settled = before_id and not after_id and not reactions
+
+    if may_be_settled:
+        key = settled_pages.key(room_id, before_id, db_inter.history_limit(0, limit))
+        settled_etag = settled_pages.etag(key)
+        # ETag de page figée déjà reçue par le client, ou page encodée en mémoire
+        if resource_versions.matches(if_none_match, settled_etag):
+            await ensure_room_member(db, current_user_id, room_id)
+            return settled_pages.not_modified_response(settled_etag)
+        page = settled_pages.get(key)
+        if page is not None:
+            await ensure_room_member(db, current_user_id, room_id)
+            return settled_pages.response(page, settled_etag)
+
+    etag = resource_versions.messages_etag(room_id, current_user_id, before_id, after_id, limit, reactions)
+    if resource_versions.matches(if_none_match, etag):
+        return resource_versions.not_modified_response(etag)
+    resource_versions.tag(response, etag)
+    messages = await db_async.get_messages(db, room_id, current_user_id, before_id, after_id, limit, with_reactions=reactions)
+
+    if may_be_settled and settled_pages.is_settled(messages):
+        return settled_pages.response(settled_pages.put(key, messages), settled_etag)
+    return messages
+
+
+@app.get("/room/{room_id}/reactions", response_model=List[MessageReactionsSchema], tags=["Reactions"])
+async def read_room_reactions(
+    request: Request,
+    response: Response,
+    room_id: int,
+    after_id: int = None,
+    before_id: int = None,
+    current_user_id: int = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Réactions des messages ]after_id, before_id[ d'un salon (un seul GROUP BY), pour les pages
+    chargées avec reactions=false. Seuls les messages qui ont des réactions sont renvoyés.
+    """
+    etag = resource_versions.reactions_etag(room_id, current_user_id, after_id, before_id)
+    if resource_versions.matches(request.headers.get("if-none-match"), etag):
+        return resource_versions.not_modified_response(etag)
+    resource_versions.tag(response, etag)
+    return await db_async.get_room_reactions(db, room_id, current_user_id, after_id, before_id)
+
+
+@app.get("/room/{room_id}/messages/around/{message_id}", response_model=List[MessageCompactSchema], tags=["Messages"])
+async def read_messages_around(
+    room_id: int,
+    message_id: int,
+    before: int = Query(25, ge=0, le=MESSAGES_MAX_LIMIT),
+    after: int = Query(25, ge=0, le=MESSAGES_MAX_LIMIT),
+    current_user_id: int = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Contexte autour d'un message (saut vers une réponse ou un résultat de recherche).
+    Renvoie `before` messages plus anciens, le message lui-même, puis `after` plus récents.
+    """
+    return await db_async.get_messages_around(db, room_id, current_user_id, message_id, before, after)
+
+
+@app.get("/room/{room_id}/search", response_model=List[SearchResultSchema], tags=["Messages"])
+async def search_room_messages(
+    room_id: int,
+    q: str,
+    limit: int = SEARCH_PAGE_SIZE,
+    offset: int = 0,
+    current_user_id: int = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Recherche plein texte dans un salon (résultats classés, paginés par limit/offset)."""
+    return await db_async.search_messages(db, current_user_id, q, room_id, limit, offset)
+
+
+@app.get("/search", response_model=List[SearchResultSchema], tags=["Messages"])
+async def search_messages(
+    q: str,
+    limit: int = SEARCH_PAGE_SIZE,
+    offset: int = 0,
+    current_user_id: int = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Recherche plein texte dans tous les salons dont l'utilisateur est membre."""
+    return await db_async.search_messages(db, current_user_id, q, None, limit, offset)
 
 
 @app.post(
     "/room/{room_id}/messages",
-    response_model=MessageSchema,
+    response_model=MessageCompactSchema,
     status_code=status.HTTP_201_CREATED,
     tags=["Messages"],
 )
 async def send_message(
     room_id: int,
     message_data: MessageCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user_id: int = Depends(get_current_user),
 ):
     """Poster un message dans un salon"""
-    # 1. Sauvegarde en base de données
-    new_msg = db_inter.create_message(db, room_id, message_data, current_user_id)
+    # 1. Sauvegarde en base de données (regroupée avec les autres écritures en attente)
+    msg_id = await write_queue.submit(db_async.insert_message, room_id, message_data, current_user_id)
+    # Historique et non lus du salon changent ; la liste publique est triée par dernier message
+    resource_versions.bump_room(room_id)
+    resource_versions.bump_room_list()
+    new_msg = await db_async.get_message_compact(db, msg_id)
 
     # 2. Conversion en dictionnaire pour le JSON
-    msg_dict = MessageSchema.model_validate(new_msg).model_dump(mode="json")
+    msg_dict = MessageCompactSchema.model_validate(new_msg).model_dump(mode="json")
 
     # 3. Diffusion immédiate aux autres élèves du salon
     await manager.broadcast_to_room(room_id, msg_dict)
-    # 3. CRUCIAL : Notifie TOUS les utilisateurs concernés pour rafraîchir leur liste de salons
-    # On envoie un signal simple "refresh_rooms"
-    await manager.broadcast_global({"action": "refresh_rooms"})
+    # 4. Liste des salons des membres : aperçu et non lus mis à jour sur place, sans rechargement
+    await manager.notify_room_members(room_id, db_inter.room_summary_delta(room_id, msg_id, 1, db_inter.new_message_summary(new_msg), current_user_id))
     return new_msg
 
 
-@app.put("/message/{message_id}", tags=["Messages"])
+@app.put("/message/{message_id}", response_model=MessageCompactSchema, tags=["Messages"])
 async def edit_message(
     message_id: int,
     data: EditMessageSchema,
     user_id: int = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Modifier un message.
     Possible si on est l'auteur.
     """
-    updated_msg = db_inter.edit_message_func(db, message_id, data, user_id)
+    updated_msg = await db_async.edit_message_func(db, message_id, data, user_id)
+    resource_versions.bump_room(updated_msg["room_id"])
+    resource_versions.bump_reports()  # Les signalements affichent le contenu du message
     # 2. Diffusion WebSocket avec action "edit"
-    msg_dict = MessageSchema.model_validate(updated_msg).model_dump(mode="json")
+    msg_dict = MessageCompactSchema.model_validate(updated_msg).model_dump(mode="json", exclude={"my_reaction"})
     msg_dict["action"] = "edit"
-    await manager.broadcast_to_room(updated_msg.room_id, msg_dict)
+    await manager.broadcast_to_room(updated_msg["room_id"], msg_dict)
 
     return updated_msg
 
 
 @app.delete("/message/{message_id}", tags=["Messages"], status_code=status.HTTP_204_NO_CONTENT)
-async def delete_message(message_id: int, user_id: int = Depends(get_current_user), db: Session = Depends(get_db)):
+async def delete_message(message_id: int, user_id: int = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
     """
     Supprimer un message.
     Possible si on est l'auteur.
     """
-    msg = db_inter.delete_message_func(db, message_id, user_id)
+    msg = await db_async.delete_message_func(db, message_id, user_id)
     if msg:
         room_id = msg.room_id
+        resource_versions.bump_room(room_id)
+        resource_versions.bump_room_list()
         # 3. Diffusion WebSocket avec action "delete"
         await manager.broadcast_to_room(room_id, {"action": "delete", "id": message_id})
-        await manager.broadcast_global({"action": "refresh_rooms"})
+        # L'aperçu a pu revenir au message précédent
+        summary = await db_async.get_room_summary(db, room_id)
+        await manager.notify_room_members(room_id, db_inter.room_summary_delta(room_id, message_id, -1, summary))
     return
 
 
@@ -347,16 +574,17 @@ async def add_reaction(
     message_id: int,
     reaction_data: ReactionCreateSchema,
     user_id: int = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """Ajouter un emoji à un message"""
-    reaction = db_inter.reagir(db, message_id, reaction_data, user_id)
-    # 2. On récupère le message avec toutes ses nouvelles réactions
-    msg = db.query(Message).filter(Message.id == message_id).first()
+    reaction_id = await write_queue.submit(db_async.insert_reaction, message_id, reaction_data, user_id)
+    reaction = await db_async.get_reaction_full(db, reaction_id)
+    # 2. On diffuse les compteurs agrégés (et qui vient de réagir, pour que son client mette à jour my_reaction)
+    msg = await db_async.get_message_compact(db, message_id)
     if msg:
-        msg_dict = MessageSchema.model_validate(msg).model_dump(mode="json")
-        msg_dict["action"] = "react"
-        await manager.broadcast_to_room(msg.room_id, msg_dict)
+        resource_versions.bump_room(msg["room_id"])
+        msg_dict = {"action": "react", "id": message_id, "reactions": msg["reactions"], "user_id": user_id, "emoji": reaction.emoji}
+        await manager.broadcast_to_room(msg["room_id"], msg_dict)
 
     return reaction
 
@@ -367,7 +595,96 @@ def remove_reaction(reaction_id: int, user_id: int, db: Session = Depends(get_db
     Supprimer une réaction.
     On demande user_id en query param pour vérifier que c'est bien l'auteur.
     """
-    return db_inter.dereagir(db, user_id, reaction_id)
+    result = db_inter.dereagir(db, user_id, reaction_id)
+    resource_versions.bump_room(result["room_id"])
+    return result
+
+
+# ==============================================================================
+# SYNCHRONISATION
+# ==============================================================================
+
+
+@app.get("/sync", response_model=SyncSchema, tags=["Sync"])
+async def sync_changes(
+    since: int = None,
+    limit: int = SYNC_MAX_EVENTS,
+    current_user_id: int = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Rattrapage après une absence : nouveaux messages, modifications, suppressions, réactions
+    et adhésions dans les salons de l'utilisateur depuis le curseur `since` (journal `events`).
+    Sans `since` (ou curseur purgé) : reset=True et le curseur courant, à partir duquel synchroniser.
+    """
+    return await db_async.get_sync(db, current_user_id, since, limit)
+
+
+@app.websocket("/ws")
+async def session_websocket(websocket: WebSocket, token: str = None):
+    """
+    WebSocket unique par session client (voir websocket_manager.py) : signaux utilisateur, plus
+    les salons suivis via des trames "subscribe" / "unsubscribe".
+    Jeton dans ?token= (ou l'en-tête Authorization) : refus 1008 s'il est invalide.
+    """
+    token = token or websocket.headers.get("authorization", "").removeprefix("Bearer ")
+    try:
+        async with manager.session_factory() as db:
+            user_id = await get_current_user(token, db)
+    except HTTPException as e:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason=e.detail)
+
+    try:
+        await manager.connect_session(websocket, user_id)
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            try:
+                frame = decode_frame(message["text"] if message.get("text") is not None else message["bytes"])
+                room_id = int(frame["room_id"])
+                resume_from = int(frame["resume_from"]) if frame.get("resume_from") is not None else None
+                since = int(frame["since"]) if frame.get("since") is not None else None
+                epoch = str(frame["epoch"]) if frame.get("epoch") is not None else None
+            except (ValueError, TypeError, KeyError):
+                continue  # Trame illisible : ignorée
+            if frame.get("action") == "subscribe":
+                await manager.subscribe_room(websocket, user_id, room_id, resume_from, epoch, since)
+            elif frame.get("action") == "unsubscribe":
+                manager.unsubscribe_room(websocket, room_id)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        manager.disconnect_user(websocket, user_id)
+
+
+# ==============================================================================
+# SUPERVISION
+# ==============================================================================
+
+
+@app.get("/metrics/write-queue", tags=["Monitoring"])
+async def write_queue_metrics(current_user_id: int = Depends(get_current_user)):
+    """Profondeur de la file d'écriture et taille des lots commités"""
+    return write_queue.metrics()
+
+
+@app.get("/metrics/password-hasher", tags=["Monitoring"])
+async def password_hasher_metrics(current_user_id: int = Depends(get_current_user)):
+    """Occupation du pool bcrypt et nombre de requêtes refusées (503)"""
+    return password_hasher.metrics()
+
+
+@app.get("/metrics/websockets", tags=["Monitoring"])
+async def websocket_metrics(current_user_id: int = Depends(get_current_user)):
+    """Reprises des WebSockets de salon : depuis le tampon mémoire, depuis la base, ou rechargement complet"""
+    return manager.metrics()
+
+
+@app.get("/metrics/etags", tags=["Monitoring"])
+async def etag_metrics(current_user_id: int = Depends(get_current_user)):
+    """Réponses 304 (sans requête SQL) contre réponses complètes, et LRU des pages figées"""
+    return dict(resource_versions.metrics(), settled_pages=settled_pages.metrics())
 
 
 # ==============================================================================
@@ -385,14 +702,20 @@ def send_report(
     Créer un nouveau signalement.
     Il suffit de donner l'ID du message et la raison.
     """
-    return db_inter.create_report(db, data, reporter_id)
+    report = db_inter.create_report(db, data, reporter_id)
+    resource_versions.bump_reports()
+    return report
 
 
 @app.get("/reports", response_model=List[ReportFullSchema], tags=["Reports"])
-def list_reports(db: Session = Depends(get_db)):
+def list_reports(request: Request, response: Response, db: Session = Depends(get_db)):
     """
     (Admin) Voir tous les signalements.
     """
+    etag = resource_versions.reports_etag()
+    if resource_versions.matches(request.headers.get("if-none-match"), etag):
+        return resource_versions.not_modified_response(etag)
+    resource_versions.tag(response, etag)
     return db_inter.get_all_reports(db)
 
 
@@ -406,4 +729,8 @@ def resolve_report(report_id: int, resolution_data: ReportResolutionSchema, db:
     - ban_duration_hours: int (si vide = définitif)
     """
     # Ici, tu devrais vérifier si l'user connecté est admin (via dépendance ou check manuel)
-    return db_inter.process_report_resolution(db, report_id, resolution_data)
+    report = db_inter.process_report_resolution(db, report_id, resolution_data)
+    resource_versions.bump_reports()
+    if resolution_data.ban_user and report.reported_id:
+        manager.revoke_user(report.reported_id)
+    return report
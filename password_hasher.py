@@ -0,0 +1,91 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from fastapi import HTTPException
+
+from security import get_password_hash, verify_password, BCRYPT_ROUNDS
+
+HASH_WORKERS = int(os.environ.get("CIF_HASH_WORKERS", max(1, (os.cpu_count() or 2) // 2)))  # Processus bcrypt
+HASH_MAX_PENDING = int(os.environ.get("CIF_HASH_MAX_PENDING", HASH_WORKERS * 8))  # Au-delà : 503 immédiat
+
+
+# --- POOL DE HACHAGE DES MOTS DE PASSE ---
+# bcrypt coûte des centaines de millisecondes de CPU par appel. Appelé dans les routes
+# synchrones /login et /register, il occupait les 40 threads partagés d'AnyIO et
+# bloquait toutes les autres routes `def` pendant les pics de connexions.
+# Les hachages passent donc par un pool de processus dédié, de taille fixe, avec une
+# limite de requêtes en attente : au-delà, on répond 503 tout de suite plutôt que
+# de laisser la file (et la latence) grandir sans fin.
+
+
+class PasswordHasher:
+    def __init__(self, workers=HASH_WORKERS, max_pending=HASH_MAX_PENDING, rounds=BCRYPT_ROUNDS):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.rounds = rounds
+        self._executor: ProcessPoolExecutor = None
+        # Métriques
+        self.pending = 0
+        self.max_seen_pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_ms = 0.0
+
+    def start(self):
+        """Crée le pool (lifespan de main.py). "spawn" : pas de fork d'un processus qui a déjà des threads."""
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        # Lance les processus tout de suite : la première connexion ne paie pas leur démarrage
+        for _ in range(self.workers):
+            self._executor.submit(int)
+
+    def stop(self):
+        if self._executor is None:
+            return
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self._executor = None
+
+    def ensure_capacity(self):
+        """Relève une 503 si la file est pleine (à appeler avant tout travail coûteux, ex: requête SQL)."""
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="Serveur surchargé, réessayez dans un instant", headers={"Retry-After": "1"})
+
+    async def _run(self, func, *args):
+        # Démarrage à la demande (ex: application lancée sans lifespan)
+        if self._executor is None:
+            self.start()
+
+        self.ensure_capacity()
+        self.pending += 1
+        self.max_seen_pending = max(self.max_seen_pending, self.pending)
+        start = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+            self.total_ms += (time.perf_counter() - start) * 1000
+
+    async def hash(self, password: str):
+        return await self._run(get_password_hash, password, self.rounds)
+
+    async def verify(self, password: str, password_hash: str):
+        return await self._run(verify_password, password, password_hash)
+
+    def metrics(self):
+        return {
+            "workers": self.workers,
+            "rounds": self.rounds,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "max_seen_pending": self.max_seen_pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_ms": round(self.total_ms / self.completed, 2) if self.completed else 0,
+        }
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,180 @@
+import hashlib
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from fastapi import Response
+
+from content_negotiation import response_format
+
+
+# --- VERSIONS DES RESSOURCES (ETAG / GET CONDITIONNEL) ---
+# À chaque signal "refresh_rooms", le client re-télécharge toute sa liste de salons,
+# même si rien n'a changé pour lui. On tient donc en mémoire des compteurs de version,
+# incrémentés par les routes de main.py APRÈS le commit de chaque écriture :
+#   - par salon : messages, réactions, informations, membres (et donc non lus des membres) ;
+#   - par utilisateur : ses adhésions, et à part son curseur de lecture ;
+#   - globaux : liste publique des salons, signalements, et une génération pour les
+#     changements transverses (pseudo affiché partout).
+# L'ETag est une empreinte de ces compteurs : le comparer à If-None-Match ne coûte
+# aucune requête SQL ni aucune sérialisation (réponse 304 directe).
+# Comme auth_cache.py, les compteurs vivent dans le processus : l'époque (pid + heure de
+# démarrage) entre dans l'empreinte pour qu'un redémarrage n'en réutilise jamais une.
+# Les écritures faites hors de l'API (scripts de maintenance) ne sont pas vues : redémarrer.
+# Plusieurs workers (CIF_BROKER_URL) : chaque incrément est aussi publié sur le canal
+# VERSIONS_CHANNEL du broker (on_change, branché par websocket_manager.py) et rejoué par
+# les autres workers (apply) ; sans cela, un worker servirait un 304 périmé après une
+# écriture faite sur un autre. Une coupure du broker change toutes les empreintes (bump_all).
+
+
+class ResourceVersions:
+    def __init__(self):
+        self.epoch = f"{os.getpid()}-{time.time_ns()}"
+        self.generation = 0
+        self.room_list = 0
+        self.reports = 0
+        self.rooms: Dict[int, int] = {}
+        self.memberships: Dict[int, int] = {}
+        self.reads: Dict[int, int] = {}
+        # Salons de chaque utilisateur, mémorisés au dernier /user/rooms (ETag sans requête)
+        self.user_rooms: Dict[int, Tuple[int, ...]] = {}
+        # Horloge : avance à chaque changement (détecte une écriture pendant une lecture)
+        self.clock = 0
+        # Les routes `def` incrémentent depuis les threads d'AnyIO : pas d'incrément perdu
+        self._lock = threading.Lock()
+        # Publication des incréments aux autres workers (None : un seul worker)
+        self.on_change: Optional[Callable[[dict], None]] = None
+        # Métriques
+        self.not_modified = 0
+        self.full_responses = 0
+
+    # --- Incréments (après commit) ---
+
+    def _bump(self, counters: Dict[int, int], key: int):
+        with self._lock:
+            counters[key] = counters.get(key, 0) + 1
+            self.clock += 1
+
+    def _count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+            self.clock += 1
+
+    def share(self, kind: str, key: int = None):
+        if self.on_change is not None:
+            self.on_change({"origin": self.epoch, "kind": kind, "key": key})
+
+    def bump_room(self, room_id: int, share: bool = True):
+        self._bump(self.rooms, room_id)
+        if share:
+            self.share("room", room_id)
+
+    def bump_membership(self, user_id: int, share: bool = True):
+        self.user_rooms.pop(user_id, None)
+        self._bump(self.memberships, user_id)
+        if share:
+            self.share("membership", user_id)
+
+    def bump_read(self, user_id: int, share: bool = True):
+        self._bump(self.reads, user_id)
+        if share:
+            self.share("read", user_id)
+
+    def bump_room_list(self, share: bool = True):
+        self._count("room_list")
+        if share:
+            self.share("room_list")
+
+    def bump_reports(self, share: bool = True):
+        self._count("reports")
+        if share:
+            self.share("reports")
+
+    def bump_all(self, share: bool = True):
+        """Change toutes les empreintes (ex: pseudo, affiché dans les salons et les signalements)."""
+        self._count("generation")
+        if share:
+            self.share("all")
+
+    def apply(self, change: dict):
+        """Incrément publié par un autre worker ; les siens lui reviennent aussi et sont ignorés."""
+        if change["origin"] == self.epoch:
+            return
+        bump = getattr(self, f"bump_{change['kind']}")
+        if change["key"] is None:
+            bump(share=False)
+        else:
+            bump(change["key"], share=False)
+
+    def remember_user_rooms(self, user_id: int, room_ids: Iterable[int]):
+        self.user_rooms[user_id] = tuple(room_ids)
+
+    # --- Empreintes ---
+
+    def etag(self, *parts) -> str:
+        """ETag fort : la représentation dépend aussi du format négocié (JSON / MessagePack)."""
+        key = repr((self.epoch, self.generation, response_format.get()) + parts).encode()
+        return f'"{hashlib.blake2b(key, digest_size=12).hexdigest()}"'
+
+    def rooms_etag(self) -> str:
+        return self.etag("rooms", self.room_list)
+
+    def reports_etag(self) -> str:
+        return self.etag("reports", self.reports)
+
+    def user_rooms_etag(self, user_id: int) -> Optional[str]:
+        """None tant que la liste des salons de l'utilisateur n'a pas été lue une première fois."""
+        room_ids = self.user_rooms.get(user_id)
+        if room_ids is None:
+            return None
+        room_versions = tuple(self.rooms.get(room_id, 0) for room_id in room_ids)
+        return self.etag("user_rooms", user_id, self.memberships.get(user_id, 0), self.reads.get(user_id, 0), room_ids, room_versions)
+
+    def messages_etag(
+        self, room_id: int, user_id: int, before_id: int = None, after_id: int = None, limit: int = None, with_reactions: bool = True
+    ) -> str:
+        # La première page sans limite dépend des non lus, donc du curseur de lecture
+        initial = not before_id and not after_id and not limit
+        read = self.reads.get(user_id, 0) if initial else None
+        return self.etag(
+            "messages", room_id, self.rooms.get(room_id, 0), user_id, self.memberships.get(user_id, 0), read, before_id, after_id, limit, with_reactions
+        )
+
+    def reactions_etag(self, room_id: int, user_id: int, after_id: int = None, before_id: int = None) -> str:
+        return self.etag("reactions", room_id, self.rooms.get(room_id, 0), user_id, self.memberships.get(user_id, 0), after_id, before_id)
+
+    def is_member(self, user_id: int, room_id: int) -> bool:
+        """Vrai si le dernier /user/rooms (encore valide) de l'utilisateur contenait ce salon. Faux : inconnu."""
+        return room_id in self.user_rooms.get(user_id, ())
+
+    # --- Requêtes conditionnelles ---
+
+    def matches(self, if_none_match: Optional[str], etag: Optional[str]) -> bool:
+        """Comparaison faible (RFC 9110) entre If-None-Match et l'ETag courant."""
+        if not if_none_match or not etag:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        return etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+    def not_modified_response(self, etag: str) -> Response:
+        self.not_modified += 1
+        return Response(status_code=304, headers={"ETag": etag, "Vary": "Accept"})
+
+    def tag(self, response: Response, etag: Optional[str]):
+        self.full_responses += 1
+        if etag:
+            response.headers["ETag"] = etag
+
+    def metrics(self):
+        return {
+            "not_modified": self.not_modified,
+            "full_responses": self.full_responses,
+            "rooms_tracked": len(self.rooms),
+            "users_tracked": len(self.user_rooms),
+            "clock": self.clock,
+        }
+
+
+resource_versions = ResourceVersions()
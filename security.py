@@ -1,3 +1,4 @@
+import os
 import bcrypt
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
@@ -7,6 +8,10 @@ SECRET_KEY = "6265f35102c7149eae6ab69103731f3a5802a4fdd09637352855d4e30263724e"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_DAYS = 30
 
+# Coût bcrypt (2^rounds itérations). Les hachages d'un autre coût sont refaits à la connexion
+# (voir needs_rehash et /login). Le hachage tourne dans password_hasher.py, hors du threadpool.
+BCRYPT_ROUNDS = int(os.environ.get("CIF_BCRYPT_ROUNDS", 12))
+
 
 def create_access_token(data: dict):
     to_encode = data.copy()
@@ -15,10 +20,10 @@ def create_access_token(data: dict):
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
-def get_password_hash(password: str):
+def get_password_hash(password: str, rounds: int = BCRYPT_ROUNDS):
     # On encode et on coupe brutalement à 72 caractères pour éviter le crash
     pwd_bytes = password.encode("utf-8")[:72]
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=rounds)
     hashed = bcrypt.hashpw(pwd_bytes, salt)
     return hashed.decode("utf-8")
 
@@ -29,5 +34,13 @@ def verify_password(password_clair: str, password_hash: str):
     return bcrypt.checkpw(pwd_bytes, hash_bytes)
 
 
+def needs_rehash(password_hash: str, rounds: int = BCRYPT_ROUNDS):
+    """True si le hachage a été fait avec un autre coût que BCRYPT_ROUNDS ("$2b$12$...")."""
+    try:
+        return int(password_hash.split("$")[2]) != rounds
+    except (IndexError, ValueError):
+        return True
+
+
 # if __name__ == "__main__":
 # 	print(get_password_hash("1234"))
@@ -0,0 +1,94 @@
+import hashlib
+import os
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from fastapi import Response
+from pydantic import TypeAdapter
+
+from content_negotiation import NegotiatedResponse, response_format
+from database.models import MESSAGE_DELETE_WINDOW
+from database.shemas import MessageCompactSchema
+
+SETTLED_CACHE_SIZE = int(os.environ.get("CIF_SETTLED_CACHE_SIZE", 2000))  # Pages encodées gardées en mémoire
+SETTLED_MARGIN = timedelta(hours=1)  # Marge après MESSAGE_DELETE_WINDOW (suppression en cours, horloges)
+SETTLED_CACHE_CONTROL = "private, max-age=31536000, immutable"
+SETTLED_FORMAT_VERSION = 1  # À incrémenter si MessageCompactSchema change : nouvelles ETags
+
+
+# --- PAGES D'HISTORIQUE FIGÉES ---
+# Un message n'est modifiable que 15 minutes et supprimable que 3 jours
+# (MESSAGE_EDIT_WINDOW / MESSAGE_DELETE_WINDOW). Une page `before_id` dont le message
+# le plus récent a dépassé ce délai ne changera donc plus jamais : aucun message ne
+# peut y apparaître (ids croissants), disparaître, ni être modifié, et l'extrait du
+# parent vient d'un message encore plus ancien. Seules les réactions bougent : elles
+# sont retirées de ces pages (`reactions=false`) et chargées par GET /room/{id}/reactions.
+# Une page figée est alors identique pour tous les membres du salon :
+#   - ETag stable (sans l'époque de resource_versions.py, valable après redémarrage) ;
+#   - Cache-Control long et `immutable` : le client ne la redemande plus ;
+#   - corps déjà encodé gardé dans un LRU : remonter l'historique ne touche plus SQLite.
+
+
+class SettledPageCache:
+    def __init__(self, max_pages: int = SETTLED_CACHE_SIZE):
+        self.max_pages = max_pages
+        self._pages: "OrderedDict[tuple, Tuple[bytes, str]]" = OrderedDict()
+        self._adapter = TypeAdapter(List[MessageCompactSchema])
+        # Métriques
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+
+    def key(self, room_id: int, before_id: int, limit: int) -> tuple:
+        """La page dépend aussi du format négocié (JSON / MessagePack). `limit` déjà plafonné."""
+        return (SETTLED_FORMAT_VERSION, room_id, before_id, limit, response_format.get())
+
+    def etag(self, key: tuple) -> str:
+        return f'"s-{hashlib.blake2b(repr(key).encode(), digest_size=12).hexdigest()}"'
+
+    def is_settled(self, messages: list, now: datetime = None) -> bool:
+        """Tous les messages ont passé le délai de suppression (le plus récent suffit)."""
+        if not messages:
+            return False
+        now = now or datetime.now()
+        return max(msg["created_at"] for msg in messages) < now - MESSAGE_DELETE_WINDOW - SETTLED_MARGIN
+
+    def get(self, key: tuple) -> Optional[Tuple[bytes, str]]:
+        page = self._pages.get(key)
+        if page is None:
+            self.misses += 1
+            return None
+        self._pages.move_to_end(key)
+        self.hits += 1
+        return page
+
+    def put(self, key: tuple, messages: list) -> Tuple[bytes, str]:
+        """Encode la page une fois (comme le ferait response_model + NegotiatedResponse) et la garde."""
+        response = NegotiatedResponse(self._adapter.dump_python(self._adapter.validate_python(messages), mode="json"))
+        page = (response.body, response.media_type)
+        self._pages[key] = page
+        self._pages.move_to_end(key)
+        self.stored += 1
+        if len(self._pages) > self.max_pages:
+            self._pages.popitem(last=False)
+        return page
+
+    def response(self, page: Tuple[bytes, str], etag: str) -> Response:
+        body, media_type = page
+        return Response(content=body, media_type=media_type, headers=self.headers(etag))
+
+    def not_modified_response(self, etag: str) -> Response:
+        return Response(status_code=304, headers=self.headers(etag))
+
+    def headers(self, etag: str) -> dict:
+        return {"ETag": etag, "Cache-Control": SETTLED_CACHE_CONTROL, "Vary": "Accept"}
+
+    def clear(self):
+        self._pages.clear()
+
+    def metrics(self):
+        return {"pages": len(self._pages), "max_pages": self.max_pages, "hits": self.hits, "misses": self.misses, "stored": self.stored}
+
+
+settled_pages = SettledPageCache()
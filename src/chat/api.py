@@ -1,4 +1,5 @@
 import httpx
+from urllib.parse import urlencode
 from utils import api, show_top_toast
 
 
@@ -29,10 +30,12 @@ async def fetch_room_messages(page, room_id):
 async def fetch_old_room_messages(page, room_id, oldest_message_id):
     """
     Récupère la liste des anciens messages d'un salon.
+    La page est demandée sans réactions (les pages anciennes, figées, sont alors mises en
+    cache pour de bon), puis les réactions sont chargées à part et fusionnées.
     Gère les erreurs 401 et les erreurs réseau.
     """
     try:
-        response = await api.get(f"/room/{room_id}/messages?before_id={oldest_message_id}")
+        response = await api.get(f"/room/{room_id}/messages?before_id={oldest_message_id}&reactions=false")
 
         if response.status_code in [401, 403]:
             await show_top_toast(page, "La session a expiré !", True)
@@ -43,6 +46,90 @@ async def fetch_old_room_messages(page, room_id, oldest_message_id):
             await show_top_toast(page, "Erreur lors de la récupération", True)
             return None
 
+        messages = response.json()  # Décodé à chaque appel : la réponse en cache reste intacte
+        if messages:
+            reactions = await fetch_room_reactions(room_id, messages[0]["id"] - 1, oldest_message_id)
+            for msg in messages:
+                msg.update(reactions.get(msg["id"], {}))
+        return messages
+
+    except httpx.RequestError:
+        await show_top_toast(page, "Erreur réseau !", True)
+        return None
+
+
+async def fetch_room_reactions(room_id, after_id, before_id):
+    """Réactions des messages ]after_id, before_id[ : {id: {"reactions": ..., "my_reaction": ...}}."""
+    try:
+        response = await api.get(f"/room/{room_id}/reactions?after_id={after_id}&before_id={before_id}")
+        if response.status_code != 200:
+            return {}
+        return {entry["id"]: {"reactions": entry["reactions"], "my_reaction": entry["my_reaction"]} for entry in response.json()}
+    except httpx.RequestError:
+        # Les messages s'affichent quand même, sans réactions
+        return {}
+
+
+async def fetch_sync(since, limit=None):
+    """
+    Changements depuis le curseur `since` (GET /sync) : nouveaux messages, modifications,
+    suppressions, réactions et adhésions. None en cas d'erreur (le client recharge alors tout).
+    """
+    try:
+        query = {"since": since} if since is not None else {}
+        if limit:
+            query["limit"] = limit
+        response = await api.get(f"/sync?{urlencode(query)}")
+        if response.status_code != 200:
+            return None
+        return response.json()
+    except httpx.RequestError:
+        return None
+
+
+async def fetch_messages_around(page, room_id, message_id, before=25, after=25):
+    """
+    Récupère le contexte autour d'un message (saut vers le message cité dans une réponse).
+    """
+    try:
+        response = await api.get(f"/room/{room_id}/messages/around/{message_id}?before={before}&after={after}")
+
+        if response.status_code in [401, 403]:
+            await show_top_toast(page, "La session a expiré !", True)
+            await page.push_route("/login")
+            return None
+
+        if response.status_code == 404:
+            await show_top_toast(page, "Ce message n'existe plus !", True)
+            return None
+
+        if response.status_code != 200:
+            await show_top_toast(page, "Erreur lors de la récupération", True)
+            return None
+
+        return response.json()
+
+    except httpx.RequestError:
+        await show_top_toast(page, "Erreur réseau !", True)
+        return None
+
+
+async def search_room_messages(page, room_id, query, offset=0):
+    """
+    Recherche plein texte côté serveur dans tout l'historique du salon.
+    """
+    try:
+        response = await api.get(f"/room/{room_id}/search?{urlencode({'q': query, 'offset': offset})}")
+
+        if response.status_code == 401:
+            await show_top_toast(page, "La session a expiré !", True)
+            await page.push_route("/login")
+            return None
+
+        if response.status_code != 200:
+            await show_top_toast(page, "Erreur lors de la recherche", True)
+            return None
+
         return response.json()
 
     except httpx.RequestError:
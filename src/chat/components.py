@@ -39,10 +39,11 @@ class SystemMessage(ft.Row):
 
 
 class BaseChatMessage(ft.Row):
-    def __init__(self, message: Message, page: ft.Page, on_copy, on_reply, on_edit, on_report, on_react, on_delete):
+    def __init__(self, message: Message, page: ft.Page, on_copy, on_reply, on_edit, on_report, on_react, on_delete, scroll_to_parent=None):
         super().__init__()
         self.message = message
-        key = str(self.message.id)
+        # Clé utilisée par chat_list.scroll_to(scroll_key=...) pour sauter vers ce message
+        self.key = str(self.message.id)
         self._page_ref = page
         self.on_copy = on_copy
         self.on_reply = on_reply
@@ -50,7 +51,7 @@ class BaseChatMessage(ft.Row):
         self.on_react = on_react
         self.on_report = on_report
         self.on_delete = on_delete
-        # self.scroll_to_parent = scroll_to_parent
+        self.scroll_to_parent = scroll_to_parent
         self.vertical_alignment = ft.CrossAxisAlignment.START
         self.parent_bubble = ft.Container()
         self.content_text = ft.Text(self.message.content, size=15)
@@ -91,7 +92,7 @@ class BaseChatMessage(ft.Row):
                 border_radius=5,
                 border=ft.Border.only(left=ft.BorderSide(3, ft.Colors.BLUE_400)),
                 margin=ft.Margin.only(bottom=5),
-                # on_click=lambda _: self._page_ref.run_task(self.scroll_to_parent, self.message.parent_id),  # <-- On commente ça pour l'instant pour éviter un crash !
+                on_click=(lambda _: self._page_ref.run_task(self.scroll_to_parent, self.message.parent_id)) if self.scroll_to_parent else None,
             )
 
     # --- NOUVELLE FONCTION ---
@@ -115,13 +116,14 @@ class BaseChatMessage(ft.Row):
         reactions_row = ft.Row(spacing=4, tight=True)
         if self.message.reactions:
             for emoji, count in self.message.reactions.items():
+                mine = emoji == self.message.my_reaction  # Notre propre réaction est mise en évidence
                 reactions_row.controls.append(
                     ft.Container(
                         content=ft.Text(f"{emoji} {count}", size=11),
                         bgcolor=ft.Colors.SURFACE_CONTAINER_HIGH,
                         border_radius=10,
                         padding=ft.padding.symmetric(horizontal=6, vertical=2),
-                        border=ft.border.all(1, ft.Colors.OUTLINE_VARIANT),
+                        border=ft.border.all(1, ft.Colors.PRIMARY if mine else ft.Colors.OUTLINE_VARIANT),
                     )
                 )
         return reactions_row
@@ -21,5 +21,6 @@ class Message:
     parent_content: Optional[str] = None
     parent_author: Optional[str] = None
     reactions: dict = field(default_factory=dict)
+    my_reaction: Optional[str] = None # <-- Emoji choisi par l'utilisateur courant
     pending: bool = False # <-- Indique si le message est en attente
     temp_id: Optional[str] = None # <-- ID temporaire pour le retrouver
@@ -5,11 +5,10 @@ from datetime import datetime, date, time, timedelta
 import httpx
 from chat.components import MyChatMessage, OtherChatMessage, SystemMessage
 from chat.models import Message
-from chat.api import fetch_room_messages, post_reaction, post_message_background, mark_room_messages_as_read, fetch_old_room_messages
+from chat.api import fetch_room_messages, post_reaction, post_message_background, mark_room_messages_as_read, fetch_old_room_messages, fetch_messages_around, search_room_messages
 from chat.dialogs import show_edit_dialog, show_delete_dialog, show_report_dialog, show_quit_dialog
-from utils import get_initials, get_avatar_color, get_colors, show_top_toast, format_date, copy_message
+from utils import get_initials, get_avatar_color, get_colors, show_top_toast, format_date, copy_message, live
 import json
-import websockets
 import asyncio
 import uuid
 
@@ -65,6 +64,7 @@ async def ChatView(page: ft.Page):
     current_room_name = page.session.store.get("current_room_name") or "Salon Inconnue..."
     last_read_id = page.session.store.get("last_read_id") or 0
     current_pseudo = await storage.get("user_pseudo") or "Anonyme"
+    current_user_id = int(await storage.get("user_id") or 0)
 
     replying_to_message: Optional[Message] = None
 
@@ -230,6 +230,7 @@ async def ChatView(page: ft.Page):
     )
 
     async def go_to_rooms(e):
+        await live.unsubscribe(current_room_id)
         page.session.store.remove("current_room_id")
         page.session.store.remove("current_room_name")
         await page.push_route("/rooms")
@@ -405,13 +406,31 @@ async def ChatView(page: ft.Page):
         # Lancement sans bloquer
         page.run_task(background_task, content, parent_id, temp_id)
 
-    def on_message(message: Message, is_me):
-        async def scroll_to_parent(parent_key):
+    async def scroll_to_parent(parent_id):
+        """
+        Saute vers le message cité dans une réponse.
+        S'il n'est pas encore chargé, on remplace la liste par son contexte
+        (une seule requête bornée) au lieu de remonter l'historique page par page.
+        """
+        nonlocal last_date, oldest_message_id
+        if not parent_id:
             return
-            await chat_list.scroll_to(scroll_key=str(parent_key))
-            chat_list.update()
-            print("Est en train de scroll")
-            page.update()
+
+        already_loaded = any(hasattr(c, "message") and c.message.id == parent_id for c in chat_list.controls)
+        if not already_loaded:
+            context = await fetch_messages_around(page, current_room_id, parent_id)
+            if not context:
+                return
+            chat_list.auto_scroll = False
+            chat_list.controls.clear()
+            last_date = None
+            await show_messages(context)
+            oldest_message_id = next((m["id"] for m in context if m["message_type"] == "chat"), None)
+
+        await chat_list.scroll_to(scroll_key=str(parent_id), duration=300)
+        page.update()
+
+    def on_message(message: Message, is_me):
 
         if message.message_type in ["join", "quit"]:
             chat_list.controls.append(SystemMessage(message))
@@ -419,13 +438,13 @@ async def ChatView(page: ft.Page):
             if is_me:
                 chat_list.controls.append(
                     MyChatMessage(
-                        message=message, page=page, on_copy=copy_message, on_reply=prepare_reply, on_edit=edit_message, on_report=report_message, on_react=react_to_message, on_delete=delete_message
+                        message=message, page=page, on_copy=copy_message, on_reply=prepare_reply, on_edit=edit_message, on_report=report_message, on_react=react_to_message, on_delete=delete_message, scroll_to_parent=scroll_to_parent
                     )
                 )
             else:
                 chat_list.controls.append(
                     OtherChatMessage(
-                        message=message, page=page, on_copy=copy_message, on_reply=prepare_reply, on_edit=edit_message, on_report=report_message, on_react=react_to_message, on_delete=delete_message
+                        message=message, page=page, on_copy=copy_message, on_reply=prepare_reply, on_edit=edit_message, on_report=report_message, on_react=react_to_message, on_delete=delete_message, scroll_to_parent=scroll_to_parent
                     )
                 )
 
@@ -440,18 +459,10 @@ async def ChatView(page: ft.Page):
                 messages_received = [messages_received]
 
             for message_to_show in messages_received:
-                # On cherche s'il y a parent et le message et l'author du parent
-                parent_id = message_to_show["parent_id"]
-                parent_content = None
-                parent_author = None
-
+                # Le backend fournit l'aperçu du parent à plat (format compact)
                 parent_id = message_to_show.get("parent_id")
-
-                # Plus besoin de boucler ! Le backend fournit déjà ces infos
-                parent = message_to_show.get("parent")
-                if parent:
-                    parent_content = parent.get("content")
-                    parent_author = parent.get("author_display_name")
+                parent_content = message_to_show.get("parent_excerpt")
+                parent_author = message_to_show.get("parent_author")
 
                 if parent_id and not parent_content:
                     parent_content = "Message supprimé !"
@@ -460,13 +471,6 @@ async def ChatView(page: ft.Page):
                 message_datetime = datetime.strptime(message_to_show["created_at"], "%Y-%m-%dT%H:%M:%S")
                 message_date = message_datetime.date()
 
-                # --- AJOUT: Agrégation des réactions ---
-                raw_reactions = message_to_show.get("reactions", [])
-                reactions_counts = {}
-                for r in raw_reactions:
-                    emj = r["emoji"]
-                    reactions_counts[emj] = reactions_counts.get(emj, 0) + 1
-
                 me = Message(
                     id=message_to_show["id"],
                     pseudo=message_to_show["author_display_name"],
@@ -479,7 +483,8 @@ async def ChatView(page: ft.Page):
                     modified=message_to_show["modified"],
                     parent_content=parent_content,
                     parent_author=parent_author,
-                    reactions=reactions_counts,  # <--- On passe notre dictionnaire ici
+                    reactions=message_to_show.get("reactions", {}),  # Déjà agrégées par le serveur {emoji: nombre}
+                    my_reaction=message_to_show.get("my_reaction"),
                 )
                 if first_load and me.id > last_read_id and not unread_divider_inserted and last_read_id != 0:
                     unread_divider = ft.Container(
@@ -529,23 +534,45 @@ async def ChatView(page: ft.Page):
     async def left_room(e):
         await show_quit_dialog(page, current_room_id)
 
-    search_input = ft.TextField(hint_text="Rechercher...", expand=True, autofocus=True, border=ft.InputBorder.NONE, on_change=lambda e: filter_messages(e.control.value))
+    search_input = ft.TextField(
+        hint_text="Rechercher...", expand=True, autofocus=True, border=ft.InputBorder.NONE, on_submit=lambda e: page.run_task(search_messages, e.control.value)
+    )
 
-    def filter_messages(query: str):
-        query = query.lower()
-        # On parcourt les éléments de la chat_list
-        for ctrl in chat_list.controls:
-            if isinstance(ctrl, (MyChatMessage, OtherChatMessage)):
-                # Si le texte correspond, on affiche, sinon on cache
-                ctrl.visible = query in ctrl.message.content.lower()
-        page.update()
+    async def search_messages(query: str):
+        """
+        Recherche sur le serveur (index plein texte) : tout l'historique du salon,
+        pas seulement les messages déjà affichés. Un résultat ouvre son contexte.
+        """
+        if not query.strip():
+            return
+        results = await search_room_messages(page, current_room_id, query.strip())
+        if results is None:
+            return
+
+        async def open_result(message_id):
+            page.pop_dialog()
+            await scroll_to_parent(message_id)
+
+        tiles = [
+            ft.ListTile(
+                title=ft.Text(r["author_display_name"], weight="bold", color=get_avatar_color(r["author_display_name"])),
+                subtitle=ft.Text(r["snippet"], max_lines=2, overflow="ellipsis"),
+                trailing=ft.Text(format_date(datetime.strptime(r["created_at"], "%Y-%m-%dT%H:%M:%S").date()), size=11, color=ft.Colors.OUTLINE),
+                on_click=lambda _, m_id=r["id"]: page.run_task(open_result, m_id),
+            )
+            for r in results
+        ]
+        if not tiles:
+            tiles = [ft.Container(content=ft.Text("Aucun message trouvé", color=ft.Colors.OUTLINE), alignment=ft.Alignment.CENTER, padding=20)]
+
+        page.show_dialog(ft.BottomSheet(content=ft.Container(content=ft.ListView(controls=tiles, spacing=0), padding=10, height=400)))
 
     def toggle_search(e):
         # On remplace le titre par l'input, et on change les boutons
         if app_bar.title == search_input:
             # Annuler la recherche
             app_bar.title = ft.Row(controls=[ft.Text(current_room_name, size=20, weight="bold")])  # ✅            app_bar.actions = [default_menu]
-            filter_messages("")  # On réaffiche tout
+            search_input.value = ""
         else:
             # Activer la recherche
             app_bar.title = search_input
@@ -564,7 +591,7 @@ async def ChatView(page: ft.Page):
 
     app_bar = ft.AppBar(
         # --- BOUTON RETOUR ---
-        leading=ft.IconButton(icon=ft.Icons.ARROW_BACK_IOS_NEW_ROUNDED, on_click=lambda _: page.run_task(page.push_route, "/rooms")),
+        leading=ft.IconButton(icon=ft.Icons.ARROW_BACK_IOS_NEW_ROUNDED, on_click=go_to_rooms),
         leading_width=40,
         # --- TITRE CLIQUABLE (Pour les infos du salon) ---
         title=ft.GestureDetector(
@@ -581,99 +608,123 @@ async def ChatView(page: ft.Page):
 
     icon_send = ft.Container(content=ft.IconButton(icon=ft.Icons.SEND_ROUNDED, icon_color="blue", on_click=send_click))
 
-    # Variable pour garder la main sur la connexion
-    ws_connection = None
+    # --- TRAMES DU SALON (session WebSocket unique, voir utils.LiveSession) ---
+    # Le salon est suivi par un abonnement sur la connexion de la session : la session écarte
+    # les doublons et reprend après un trou ou une coupure ; ici on n'applique que le contenu.
+    def chat_is_open():
+        return page.session.store.get("current_room_id") == current_room_id
+
+    def find_bubble(message_id):
+        return next((m for m in chat_list.controls if hasattr(m, "message") and m.message.id == message_id), None)
+
+    def remove_message(message_id):
+        chat_list.controls = [m for m in chat_list.controls if not (hasattr(m, "message") and m.message.id == message_id)]
+
+    def update_message(msg_data):
+        m = find_bubble(msg_data["id"])
+        if m:
+            m.message.content = msg_data["content"]
+            m.message.modified = True
+            if hasattr(m, "update_ui"):
+                m.update_ui()
+
+    def update_reactions(message_id, reactions, user_id=None, emoji=None):
+        # Compteurs déjà agrégés par le serveur
+        m = find_bubble(message_id)
+        if m:
+            m.message.reactions = reactions
+            if user_id == current_user_id:
+                m.message.my_reaction = emoji
+            if hasattr(m, "update_reactions"):
+                m.update_reactions()
+
+    async def apply_resync(batch):
+        """Rattrapage lu en base par le serveur (tampon dépassé ou serveur redémarré)."""
+        nonlocal last_date
+        if batch.get("reset"):
+            chat_list.controls.clear()
+            last_date = None
+            await load_initial_data()
+            return
+        for msg_data in batch["messages"]:
+            if find_bubble(msg_data["id"]):
+                if msg_data["modified"]:
+                    update_message(msg_data)
+                update_reactions(msg_data["id"], msg_data["reactions"])
+            else:
+                await show_messages([msg_data])
+        for message_id in batch["deleted"]:
+            remove_message(message_id)
+        for entry in batch["reactions"]:
+            update_reactions(entry["id"], entry["reactions"])
+
+    async def apply_frame(msg_data):
+        """Applique une trame du salon, dans l'ordre des seq (doublons et trous gérés par la session)."""
+        if not chat_is_open():
+            await live.unsubscribe(current_room_id)  # Vue quittée sans passer par le bouton retour
+            return
+        action_type = msg_data.get("action", "new")  # Supposons que ton API envoie l'action
+
+        if action_type == "unsubscribed":
+            await show_top_toast(page, msg_data["detail"], True)
+            return
+        if action_type == "resync":
+            await apply_resync(msg_data)
+            page.update()
+            return
+
+        if action_type == "delete":
+            # On supprime visuellement sans recharger
+            remove_message(msg_data["id"])
 
-    async def listen_ws():
-        nonlocal current_room_id, ws_connection
-        ws_url = f"ws://127.0.0.1:8000/ws/{current_room_id}"
+        elif action_type == "edit":
+            # On modifie visuellement
+            update_message(msg_data)
 
-        try:
-            async with websockets.connect(ws_url) as ws:
-                ws_connection = ws
-                async for data in ws:
-                    msg_data = json.loads(data)
-                    action_type = msg_data.get("action", "new")  # Supposons que ton API envoie l'action
-
-                    if action_type == "delete":
-                        # On supprime visuellement sans recharger
-                        chat_list.controls = [m for m in chat_list.controls if not (hasattr(m, "message") and m.message.id == msg_data["id"])]
-                        page.update()
+        elif action_type == "react":
+            update_reactions(msg_data["id"], msg_data.get("reactions", {}), msg_data.get("user_id"), msg_data.get("emoji"))
 
-                    elif action_type == "edit":
-                        # On modifie visuellement
-                        for m in chat_list.controls:
-                            if hasattr(m, "message") and m.message.id == msg_data["id"]:
-                                m.message.content = msg_data["content"]
-                                m.message.modified = True
-                                if hasattr(m, "update_ui"):
-                                    m.update_ui()
-                                break
-                    elif action_type == "react":
-                        # Recalculer les réactions reçues
-                        reactions_counts = {}
-                        for r in msg_data.get("reactions", []):
-                            emj = r["emoji"]
-                            reactions_counts[emj] = reactions_counts.get(emj, 0) + 1
-
-                        # Mettre à jour la bulle ciblée
-                        for m in chat_list.controls:
-                            if hasattr(m, "message") and m.message.id == msg_data["id"]:
-                                m.message.reactions = reactions_counts
-                                # On appelle la nouvelle fonction créée à l'étape 2
-                                if hasattr(m, "update_reactions"):
-                                    m.update_reactions()
-                                break
-                    else:
-                        # Formatage des réactions
-                        reactions_counts = {}
-                        for r in msg_data.get("reactions", []):
-                            emj = r["emoji"]
-                            reactions_counts[emj] = reactions_counts.get(emj, 0) + 1
-
-                        message_datetime = datetime.strptime(msg_data["created_at"], "%Y-%m-%dT%H:%M:%S")
-                        new_msg = Message(
-                            id=msg_data["id"],
-                            pseudo=msg_data["author_display_name"],
-                            content=msg_data["content"],
-                            message_type=msg_data["message_type"],
-                            modified=msg_data.get("modified", False),
-                            parent_id=msg_data.get("parent_id"),
-                            parent_content=msg_data.get("parent_content"),
-                            parent_author=msg_data.get("parent_author"),
-                            message_datetime=message_datetime,
-                            message_date=message_datetime.date(),
-                            message_time=message_datetime.time(),
-                            reactions=reactions_counts,
-                        )
-
-                        # Vérification doublon et Update WebSocket First
-                        page.run_task(mark_room_messages_as_read, page, current_room_id, new_msg.id)
-                        existing_ids = [str(m.message.id) for m in chat_list.controls if hasattr(m, "message")]
-                        if str(new_msg.id) not in existing_ids:
-                            # Sécurité : vérifier si ce n'est pas un message qu'on vient juste d'envoyer
-                            # et que le WS est arrivé plus vite que la réponse HTTP.
-                            duplicate_temp = next((m for m in chat_list.controls if hasattr(m, "message") and getattr(m.message, "pending", False) and m.message.content == new_msg.content), None)
-
-                            if duplicate_temp:
-                                # Le WS a été plus rapide ! On met à jour la bulle existante
-                                duplicate_temp.message.id = new_msg.id
-                                duplicate_temp.message.pending = False
-                                duplicate_temp.message.temp_id = None
-                                if hasattr(duplicate_temp, "update_status"):
-                                    duplicate_temp.update_status()
-                            else:
-                                # C'est un vrai nouveau message d'un tiers
-                                is_me = new_msg.pseudo == current_pseudo
-                                on_message(new_msg, is_me)
-                    page.update()
-
-        except websockets.exceptions.ConnectionClosed:
-            # Comportement normal quand on force la fermeture
-            print(f"Déconnexion du salon {current_room_id}")
-
-    # Lancement en tâche de fond (ne bloque pas l'UI)
-    page.run_task(listen_ws)
+        else:
+            message_datetime = datetime.strptime(msg_data["created_at"], "%Y-%m-%dT%H:%M:%S")
+            new_msg = Message(
+                id=msg_data["id"],
+                pseudo=msg_data["author_display_name"],
+                content=msg_data["content"],
+                message_type=msg_data["message_type"],
+                modified=msg_data.get("modified", False),
+                parent_id=msg_data.get("parent_id"),
+                parent_content=msg_data.get("parent_excerpt"),
+                parent_author=msg_data.get("parent_author"),
+                message_datetime=message_datetime,
+                message_date=message_datetime.date(),
+                message_time=message_datetime.time(),
+                reactions=msg_data.get("reactions", {}),
+            )
+
+            # Vérification doublon et Update WebSocket First
+            page.run_task(mark_room_messages_as_read, page, current_room_id, new_msg.id)
+            existing_ids = [str(m.message.id) for m in chat_list.controls if hasattr(m, "message")]
+            if str(new_msg.id) not in existing_ids:
+                # Sécurité : vérifier si ce n'est pas un message qu'on vient juste d'envoyer
+                # et que le WS est arrivé plus vite que la réponse HTTP.
+                duplicate_temp = next((m for m in chat_list.controls if hasattr(m, "message") and getattr(m.message, "pending", False) and m.message.content == new_msg.content), None)
+
+                if duplicate_temp:
+                    # Le WS a été plus rapide ! On met à jour la bulle existante
+                    duplicate_temp.message.id = new_msg.id
+                    duplicate_temp.message.pending = False
+                    duplicate_temp.message.temp_id = None
+                    if hasattr(duplicate_temp, "update_status"):
+                        duplicate_temp.update_status()
+                else:
+                    # C'est un vrai nouveau message d'un tiers
+                    is_me = new_msg.pseudo == current_pseudo
+                    on_message(new_msg, is_me)
+        page.update()
+
+    # Abonnement au salon sur la connexion de la session (ouverte si besoin)
+    live.start(token)
+    await live.subscribe(current_room_id, apply_frame)
 
     return ft.View(
         route="/chat",
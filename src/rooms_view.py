@@ -1,10 +1,11 @@
 import flet as ft
 import httpx
-from utils import Room, api, show_top_toast
+from utils import Room, api, live, show_top_toast
 import json
-import websockets
 import asyncio
 
+GENERAL_ROOM_ID = 1  # Toujours en tête de liste (même tri que /user/rooms)
+
 
 async def RoomsView(page: ft.Page):
     # 1. On récupère le badge de sécurité (le token)
@@ -52,6 +53,7 @@ async def RoomsView(page: ft.Page):
         page.update()
 
     room_list = ft.ListView(expand=True, spacing=2, padding=10)
+    rooms = {}  # Salons affichés, par id (mis à jour sur place par les deltas "room_summary")
 
     info_text = ft.Text("Chargement des salons...", size=14, margin=ft.Margin.only(bottom=20), color=ft.Colors.GREY_500)
     container_principal = ft.Container(
@@ -69,6 +71,7 @@ async def RoomsView(page: ft.Page):
 
             if response.status_code in [400,401,402,403]:
                 await storage.remove("cif_token")
+                live.stop()
                 await page.push_route("/login")
                 return
 
@@ -88,6 +91,7 @@ async def RoomsView(page: ft.Page):
 
             room_list.controls.clear()
             room_list.controls.append(info_text)
+            rooms.clear()
 
             for r in data:
                 new_room_obj = Room(
@@ -101,8 +105,9 @@ async def RoomsView(page: ft.Page):
                     unread_count=r.get("unread_count", 0),
                     icon=r["icon"],
                 )
+                rooms[new_room_obj.id] = new_room_obj
                 room_list.controls.append(new_room_obj.controls)
-                room_list.controls.append(ft.Divider(height=2))
+                room_list.controls.append(new_room_obj.divider)
 
             container_principal.content = room_list
             container_principal.alignment = None
@@ -113,26 +118,42 @@ async def RoomsView(page: ft.Page):
 
     page.run_task(load_rooms)
 
+    def patch_room(delta, user_id):
+        """Delta "room_summary" : aperçu et non lus mis à jour sur place. False si le salon n'est pas affiché."""
+        room = rooms.get(delta["room_id"])
+        if room is None:
+            return False
+        if room.apply_summary(delta, user_id) and room.id != GENERAL_ROOM_ID:
+            # Nouveau message : le salon remonte en tête (juste après le Salon Général)
+            room_list.controls.remove(room.controls)
+            room_list.controls.remove(room.divider)
+            position = 3 if GENERAL_ROOM_ID in rooms else 1
+            room_list.controls[position:position] = [room.controls, room.divider]
+        return True
+
     async def listen_global_updates():
         current_user_id = await storage.get("user_id")
-        if not current_user_id:
+        token = await storage.get("cif_token")
+        if not current_user_id or not token:
             await page.push_route("/login")
             return
 
-        # Ce WebSocket doit être créé côté serveur (ex: /ws/user/{user_id})
-        # Il enverra un simple message "update" quand l'utilisateur reçoit un message
-        ws_url = f"ws://127.0.0.1:8000/ws/user/{current_user_id}"
-
-        try:
-            async with websockets.connect(ws_url) as ws:
-                async for data in ws:
-                    message = json.loads(data)
-                    if message.get("action") == "refresh_rooms":
-                        # On relance la fonction de chargement des salons
-                        await load_rooms(None)
-        except Exception as e:
-            print(e)
-            await asyncio.sleep(2)  # Reconnexion automatique
+        # Signaux utilisateur reçus sur la connexion unique de la session (/ws, voir utils.LiveSession) :
+        # "room_summary" (nouveau message / suppression dans un de ses salons)
+        # et "refresh_rooms" (salon modifié ou supprimé)
+        async def on_user_frame(message):
+            if message.get("action") == "room_summary":
+                # Nouveau message ou suppression dans un de nos salons : pas de rechargement
+                if patch_room(message, current_user_id):
+                    page.update()
+                else:
+                    await load_rooms(None)
+            elif message.get("action") == "refresh_rooms":
+                # On relance la fonction de chargement des salons
+                await load_rooms(None)
+
+        live.on_user_frame = on_user_frame
+        live.start(token)
 
     # Lancer l'écoute sans bloquer la vue
     page.run_task(listen_global_updates)
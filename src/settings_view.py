@@ -1,5 +1,5 @@
 import flet as ft
-from utils import generer_pseudo, get_avatar_color, host, port
+from utils import generer_pseudo, get_avatar_color, host, port, api, live
 import httpx
 # from flet_storage import FletStorage
 
@@ -29,6 +29,7 @@ async def SettingsView(page: ft.Page):
 
     async def go_login(e):
         await storage.remove("cif_token")
+        live.stop()
         keys = await storage.get_keys("user")
         for key in keys:
             await storage.remove(key)
@@ -88,6 +89,12 @@ async def SettingsView(page: ft.Page):
 
                     pseudo_display_text.value = actuel_pseudo
                     await storage.set("user_pseudo", actuel_pseudo)
+                    # L'ancien jeton est invalidé par le serveur : on garde le nouveau
+                    new_token = response.json()["access_token"]
+                    await storage.set("cif_token", new_token)
+                    api.set_token(new_token)
+                    live.start(new_token)  # La session WebSocket se reconnecte avec le nouveau jeton
+                    page.session.store.set("token", new_token)
                     storage.update()
                     dlg.open = False
                     page.update()
@@ -10,11 +10,26 @@ import base64
 import json
 from datetime import datetime, timedelta, date
 import httpx
-from typing import Optional
+import websockets
+from contextlib import suppress
+from typing import Dict, Optional
+from urllib.parse import urlencode
+
+try:
+    import msgpack  # Réponses et trames plus compactes (optionnel)
+except ImportError:
+    msgpack = None
 
 host = "127.0.0.1"
 port = "8000"
 
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+# Sous-protocoles WebSocket proposés au serveur (il garde le JSON si on n'en propose aucun)
+WS_SUBPROTOCOLS = ["msgpack"] if msgpack else None
+ETAG_CACHE_SIZE = 200  # Réponses GET gardées pour les requêtes conditionnelles (If-None-Match)
+WS_RECONNECT_MIN_DELAY = 0.5  # Secondes avant la première tentative de reconnexion
+WS_RECONNECT_MAX_DELAY = 30  # Plafond de l'attente exponentielle
+
 
 async def view_pop(view, page):
     if len(page.views) > 1:
@@ -258,39 +273,72 @@ class Room:
         self.id = room_id
         self.name = name
         self.icon = int(icon)
-        self.last_read_id = last_read_id
-
-        # Formater le sous-titre (Style WhatsApp)
-        if last_msg_author:
-            subtitle_text = f"~{last_msg_author}: {last_msg_content}"
-        else:
-            subtitle_text = last_msg_content
+        self.last_read_id = last_read_id or 0
+        self.last_message_id = 0  # Dernier message connu par un delta "room_summary"
 
+        self.subtitle = ft.Text(max_lines=1, overflow=ft.TextOverflow.ELLIPSIS)  # Tronquer si trop long
+        self.time_text = ft.Text(size=10, color=ft.Colors.ON_SURFACE_VARIANT)
+        self.badge_text = ft.Text(size=10, color=ft.Colors.WHITE, weight="bold")
         # Rendre le badge dynamique
-        unread_badge = ft.Container(
-            content=ft.Text(str(unread_count), size=10, color=ft.Colors.WHITE, weight="bold"),
+        self.unread_badge = ft.Container(
+            content=self.badge_text,
             bgcolor=ft.Colors.GREEN_500,
             border_radius=10,
             padding=ft.Padding.symmetric(horizontal=6, vertical=2),
-            visible=unread_count > 0,  # Caché si 0 non-lu
         )
+        self.set_summary(last_msg_content, last_msg_author, last_msg_time, unread_count)
 
         self.controls = ft.ListTile(
             key=str(self.id),
             leading=ft.Icon(icon=self.icon, color=ft.Colors.BLUE_600),
             title=ft.Text(self.name, weight="bold"),
-            subtitle=ft.Text(subtitle_text, max_lines=1, overflow=ft.TextOverflow.ELLIPSIS, color=ft.Colors.GREEN_500 if unread_count > 0 else None),  # Tronquer si trop long
+            subtitle=self.subtitle,
             data=self.id,
             on_click=self.join_room,
             trailing=ft.Column(
                 [
-                    ft.Text(last_msg_time or "", size=10, color=ft.Colors.ON_SURFACE_VARIANT),
-                    unread_badge,
+                    self.time_text,
+                    self.unread_badge,
                 ],
                 alignment=ft.MainAxisAlignment.CENTER,
                 spacing=2,
             ),
         )
+        self.divider = ft.Divider(height=2)
+
+    def set_summary(self, last_msg_content, last_msg_author, last_msg_time, unread_count):
+        self.last_msg = (last_msg_content, last_msg_author, last_msg_time)
+        self.unread_count = unread_count
+        # Formater le sous-titre (Style WhatsApp)
+        if last_msg_author:
+            self.subtitle.value = f"~{last_msg_author}: {last_msg_content}"
+        else:
+            self.subtitle.value = last_msg_content
+        self.subtitle.color = ft.Colors.GREEN_500 if unread_count > 0 else None
+        self.time_text.value = last_msg_time or ""
+        self.badge_text.value = str(unread_count)
+        self.unread_badge.visible = unread_count > 0  # Caché si 0 non-lu
+
+    def apply_summary(self, delta, user_id):
+        """
+        Applique un delta "room_summary" du serveur (nouveau message : unread=1, suppression : -1)
+        sans recharger /user/rooms. Renvoie True si c'est un nouveau message (salon à remonter).
+        """
+        unread = self.unread_count
+        preview = (delta["last_message_content"], delta["last_message_author"], delta["last_message_time"])
+        if delta["unread"] > 0:
+            if str(delta["author_id"]) == str(user_id):
+                unread, self.last_read_id = 0, delta["message_id"]  # L'auteur a tout lu
+            else:
+                unread += 1
+            if delta["message_id"] < self.last_message_id:
+                preview = None  # Delta arrivé après celui d'un message plus récent
+            else:
+                self.last_message_id = delta["message_id"]
+        elif delta["message_id"] > int(self.last_read_id) and unread > 0:
+            unread -= 1
+        self.set_summary(*(preview or self.last_msg), unread)
+        return delta["unread"] > 0
 
     async def join_room(self, e):
         self.page.session.store.set("current_room_id", self.id)
@@ -318,6 +366,31 @@ port = 8000
 #         self.token: Optional[str] = None
 
 
+class APIResponse:
+    """
+    Enveloppe une réponse httpx : .json() décode aussi le MessagePack.
+    Le reste (status_code, headers, text...) est celui de la réponse d'origine.
+    """
+
+    def __init__(self, response: httpx.Response):
+        self._response = response
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    def json(self):
+        if msgpack and self._response.headers.get("content-type", "").startswith(MSGPACK_MEDIA_TYPE):
+            return msgpack.unpackb(self._response.content)
+        return self._response.json()
+
+
+def decode_ws_frame(data):
+    """Trame WebSocket : binaire (MessagePack) ou texte (JSON)."""
+    if isinstance(data, bytes):
+        return msgpack.unpackb(data)
+    return json.loads(data)
+
+
 class APIClient:
     def __init__(self):
         # Initialise un client persistant
@@ -330,28 +403,53 @@ class APIClient:
                 max_keepalive_connections=0,  # <-- La clé du problème
                 max_connections=10,
             ),
+            # Le serveur répond en MessagePack si on le demande (plus léger sur le Wi-Fi)
+            headers={"Accept": f"{MSGPACK_MEDIA_TYPE}, application/json"} if msgpack else None,
         )
         self.token: Optional[str] = None
+        # GET conditionnel : dernière réponse et son ETag par endpoint (rejoués sur un 304)
+        self.etag_cache: Dict[str, APIResponse] = {}
 
     def set_token(self, token: str):
         self.token = token
         self.client.headers.update({"Authorization": f"Bearer {token}"})
+        # Les réponses en cache appartenaient à l'ancien jeton (autre utilisateur, autre pseudo)
+        self.etag_cache.clear()
 
     async def get(self, endpoint: str):
-        response = await self.client.get(endpoint)
-        return response
+        cached = self.etag_cache.get(endpoint)
+        # Page d'historique figée (Cache-Control immutable) : inutile de la redemander
+        if cached and "immutable" in cached.headers.get("cache-control", ""):
+            return cached
+        headers = {"If-None-Match": cached.headers["etag"]} if cached else None
+        response = await self.client.get(endpoint, headers=headers)
+
+        # Rien n'a changé : le serveur n'a rien relu ni renvoyé, on rejoue la réponse gardée
+        if response.status_code == 304 and cached:
+            return cached
+
+        result = APIResponse(response)
+        if response.status_code == 200 and "etag" in response.headers:
+            self.etag_cache.pop(endpoint, None)
+            self.etag_cache[endpoint] = result
+            # Borne la mémoire (pages d'historique) : on oublie les plus anciennes
+            if len(self.etag_cache) > ETAG_CACHE_SIZE:
+                del self.etag_cache[next(iter(self.etag_cache))]
+        else:
+            self.etag_cache.pop(endpoint, None)
+        return result
 
     async def post(self, endpoint: str, data: dict = None):
         response = await self.client.post(endpoint, json=data)
-        return response
+        return APIResponse(response)
 
     async def put(self, endpoint: str, data: dict = None):
         response = await self.client.put(endpoint, json=data)
-        return response
+        return APIResponse(response)
 
     async def delete(self, endpoint: str, data: dict = None):
         response = await self.client.request("DELETE", endpoint, json=data)
-        return response
+        return APIResponse(response)
 
     async def close(self):
         await self.client.aclose()
@@ -361,6 +459,122 @@ class APIClient:
 api = APIClient()
 
 
+# --- SESSION WEBSOCKET UNIQUE (/ws) ---
+# Une seule connexion par client, quelles que soient les vues ouvertes : signaux utilisateur
+# (liste des salons, RoomsView) et salons suivis (trames "subscribe" / "unsubscribe", ChatView).
+# Pour chaque salon suivi, la session garde l'état de reprise (seq, époque, curseur "since") :
+# un doublon est ignoré, un trou provoque un réabonnement avec resume_from, et après une
+# coupure tous les salons sont réabonnés (le serveur renvoie les trames manquées ou un "resync").
+
+
+class LiveSession:
+    def __init__(self):
+        self.token: Optional[str] = None
+        self.ws = None
+        self.task: Optional[asyncio.Task] = None
+        self.on_user_frame = None  # Coroutine appelée pour chaque signal utilisateur
+        self.rooms: Dict[int, dict] = {}  # room_id -> handler et état de reprise
+
+    def start(self, token: str):
+        """Ouvre la session si besoin (chaque vue peut l'appeler) ; un nouveau jeton rouvre la connexion."""
+        if token != self.token and self.task is not None:
+            self.task.cancel()
+            self.task = None
+        self.token = token
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        """Déconnexion de l'utilisateur : ferme la session et oublie les salons suivis."""
+        self.token = None
+        self.rooms.clear()
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def subscribe(self, room_id: int, handler):
+        """handler(trame) : coroutine appelée, dans l'ordre, pour chaque trame du salon (resync compris)."""
+        self.rooms[room_id] = {"handler": handler, "seq": None, "epoch": None, "since": None, "resuming": False}
+        await self.send_subscribe(room_id)
+
+    async def unsubscribe(self, room_id: int):
+        if self.rooms.pop(room_id, None) is not None:
+            await self.send({"action": "unsubscribe", "room_id": room_id})
+
+    async def send_subscribe(self, room_id: int):
+        room = self.rooms[room_id]
+        frame = {"action": "subscribe", "room_id": room_id}
+        if room["seq"] is not None:
+            frame.update(resume_from=room["seq"], epoch=room["epoch"], since=room["since"])
+        await self.send(frame)
+
+    async def send(self, frame: dict):
+        # Hors connexion, rien à envoyer : les abonnements sont rejoués à la reconnexion
+        if self.ws is not None:
+            with suppress(websockets.exceptions.ConnectionClosed):
+                await self.ws.send(json.dumps(frame))
+
+    async def run(self):
+        delay = WS_RECONNECT_MIN_DELAY
+        while self.token:
+            try:
+                async with websockets.connect(f"ws://{host}:{port}/ws?{urlencode({'token': self.token})}", subprotocols=WS_SUBPROTOCOLS) as ws:
+                    self.ws = ws
+                    delay = WS_RECONNECT_MIN_DELAY  # Connexion rétablie
+                    for room_id in list(self.rooms):
+                        await self.send_subscribe(room_id)
+                    async for data in ws:
+                        await self.dispatch(decode_ws_frame(data))
+            except websockets.exceptions.InvalidStatus as e:
+                print(f"Session refusée : {e}")  # Jeton expiré : les requêtes HTTP renverront vers /login
+                return
+            except (websockets.exceptions.ConnectionClosed, OSError) as e:
+                print(f"Déconnexion de la session : {e}")
+            finally:
+                self.ws = None
+            # Coupure réseau ou serveur arrêté : attente exponentielle avec gigue
+            await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+            delay = min(delay * 2, WS_RECONNECT_MAX_DELAY)
+
+    async def dispatch(self, frame: dict):
+        action = frame.get("action")
+        room = self.rooms.get(frame.get("room_id"))
+        if action == "unsubscribed":
+            # Abonnement refusé par le serveur (plus membre du salon, trop de salons suivis)
+            self.rooms.pop(frame.get("room_id"), None)
+            if room is not None:
+                await room["handler"](frame)
+            return
+        if "seq" not in frame:
+            if self.on_user_frame is not None:
+                await self.on_user_frame(frame)
+            return
+        if room is None:
+            return  # Salon quitté : trames encore en route
+
+        if action == "hello":
+            room.update(seq=frame["seq"], epoch=frame["epoch"], since=frame["since"], resuming=False)
+            return
+        if action == "resync":
+            await room["handler"](frame)
+            room["seq"] = frame["seq"]
+            return
+        if room["seq"] is not None:
+            if frame["seq"] <= room["seq"]:
+                return  # Déjà reçue (trames renvoyées par la reprise)
+            if frame["seq"] > room["seq"] + 1:
+                # Trou : un seul réabonnement avec reprise, les trames manquées arrivent avant "hello"
+                if not room["resuming"]:
+                    room["resuming"] = True
+                    await self.send_subscribe(frame["room_id"])
+                return
+        room["seq"] = frame["seq"]
+        await room["handler"](frame)
+
+
+live = LiveSession()
+
+
 async def show_top_toast(page: ft.Page, message: str, is_error: bool = False):
     color = ft.Colors.RED_600 if is_error else ft.Colors.GREEN_600
 
@@ -404,6 +618,7 @@ async def refresh_rooms(page, storage):
 
         if response.status_code in [401, 403]:
             await storage.remove("cif_token")
+            live.stop()
             await page.push_route("/login")
             return
 
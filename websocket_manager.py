@@ -1,8 +1,172 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from typing import Dict, List
+import asyncio
+import os
+import time
+from collections import Counter, deque
+from contextlib import suppress
+from fastapi import WebSocket
+from typing import Deque, Dict, List, Optional, Set, Tuple, Union
+from broker import make_broker
+from content_negotiation import accept_websocket, encode_frame
+from database.models import AsyncReadSessionLocal
+import database.crud_async as db_async
+from resource_versions import resource_versions
 
-# On crée un routeur dédié
-router = APIRouter()
+WS_REPLAY_BUFFER = int(os.environ.get("CIF_WS_REPLAY_BUFFER", 256))  # Trames gardées par salon pour la reprise
+WS_SEND_QUEUE = int(os.environ.get("CIF_WS_SEND_QUEUE", 256))  # Trames en attente par connexion avant éviction
+WS_SEND_TIMEOUT = float(os.environ.get("CIF_WS_SEND_TIMEOUT", 10))  # Secondes accordées à un envoi avant éviction
+WS_CLOSE_SLOW_CONSUMER = 1013  # "Try Again Later" : le client se reconnecte et reprend avec resume_from
+WS_MAX_ROOMS = int(os.environ.get("CIF_WS_MAX_ROOMS", 50))  # Salons suivis au plus par une session /ws
+BROKER_LINGER = float(os.environ.get("CIF_BROKER_LINGER", 60))  # Secondes d'abonnement gardé à un salon sans connexion locale
+
+ROOM_CHANNEL = "cif:room:"  # + room_id : trames numérotées du salon
+USER_CHANNEL = "cif:user:"  # + user_id : signaux à un utilisateur
+USERS_CHANNEL = "cif:users"  # Signaux à tous / aux membres d'un salon, oubli des adhésions : tous les workers
+VERSIONS_CHANNEL = "cif:versions"  # Incréments des versions d'ETag (resource_versions.py) : tous les workers
+
+
+# --- REPRISE DES WEBSOCKETS DE SALON ---
+# Chaque trame diffusée dans un salon porte un numéro `seq` propre au salon (1, 2, 3...) :
+# le client repère un trou (seq > dernier + 1) ou un doublon (seq <= dernier).
+# Les WS_REPLAY_BUFFER dernières trames de chaque salon restent en mémoire. Le client
+# se réabonne avec {"action": "subscribe", "room_id", "resume_from": <dernier seq>, "epoch", "since"} :
+#   1. si l'époque est la même (pas de redémarrage) et que le tampon couvre le trou,
+#      les trames manquées sont renvoyées telles quelles ;
+#   2. sinon, repli sur la base : {"action": "resync", ...} avec les changements du salon
+#      depuis le curseur `since` du journal `events` (même lot compact que GET /sync),
+#      ou reset=true si ce n'est plus possible (le client recharge l'historique) ;
+#   3. puis {"action": "hello", "seq", "epoch", "since"} : état à retenir pour la reprise suivante.
+# Le tampon garde aussi les trames déjà sérialisées lors de la diffusion : une reprise (ou mille,
+# après une coupure du serveur) ne resérialise rien.
+# Les diffusions qui arrivent pendant les lectures en base sont reprises du tampon, avant
+# "hello" ; les suivantes attendent dans la file de la connexion.
+
+
+# --- ENVOI : UNE FILE BORNÉE PAR CONNEXION ---
+# Une diffusion ne fait aucun await réseau : la trame, sérialisée une fois par format, est
+# posée dans la file (Outbox) de chaque destinataire, en O(membres), et la tâche d'écriture
+# propre à chaque connexion l'envoie. Un téléphone lent ne retarde plus que lui-même.
+# Il est évincé (fermeture 1013, il reprendra avec resume_from) si sa file dépasse
+# WS_SEND_QUEUE trames ou si un envoi dure plus de WS_SEND_TIMEOUT secondes ; une socket
+# morte est retirée sans interrompre la diffusion.
+# Les trames de contrôle (sans `seq` de salon, ex: refresh_rooms) passent devant les trames
+# de chat, et une trame de contrôle identique déjà en attente n'est pas ajoutée deux fois.
+# Les trames numérotées d'un salon gardent leur ordre.
+
+
+# --- SIGNAUX AUX MEMBRES D'UN SALON ---
+# notify_room_members n'envoie un signal (ex: "room_summary", "refresh_rooms") qu'aux membres
+# connectés du salon, via leur session /ws. Les membres de chaque salon sont mémorisés au
+# premier signal ; les routes qui changent les adhésions appellent forget_members (comme
+# resource_versions.bump_membership). Une écriture faite hors de l'API n'est pas vue : redémarrer.
+
+
+# --- SESSION MULTIPLEXÉE (/ws, main.py) ---
+# Une seule connexion authentifiée (jeton JWT) par client, et la seule route WebSocket : elle
+# reçoit les signaux de l'utilisateur et les trames des salons auxquels le client s'abonne :
+#   {"action": "subscribe", "room_id", "resume_from", "epoch", "since"} : reprise (voir plus haut)
+#   {"action": "unsubscribe", "room_id"}
+# Un abonnement refusé (non membre, trop de salons) renvoie {"action": "unsubscribed", "room_id", "detail"}.
+# L'adhésion est revérifiée à chaque forget_members : qui quitte le salon en est désabonné
+# de la même façon, comme tous ses abonnés quand il est supprimé (close_room). Un ban ou un
+# changement de pseudo (jeton révoqué) ferme les sessions de l'utilisateur (revoke_user) :
+# la reconnexion avec l'ancien jeton est refusée.
+# Le manager indexe les abonnements dans les deux sens : room_connections (salon -> connexions)
+# et session_rooms (connexion -> salons, pour tout retirer à la fin), avec session_users.
+# Les trames de salon portent toutes room_id, pour que le client les aiguille.
+
+
+# --- PLUSIEURS WORKERS (broker.py) ---
+# Chaque worker ne tient que ses propres sockets : les diffusions sont publiées dans le broker
+# (CIF_BROKER_URL) et chaque worker livre ce qu'il reçoit (dispatch). Un worker n'est abonné
+# qu'aux canaux des salons et des utilisateurs dont il tient une connexion (plus USERS_CHANNEL
+# et VERSIONS_CHANNEL) ;
+# l'abonnement est confirmé avant d'inscrire la connexion.
+# Les seq d'un salon sont donc propres à chaque worker, comme l'époque : un client qui reprend
+# sur un autre worker passe par la base. Un worker qui se désabonne d'un salon (aucune
+# connexion depuis BROKER_LINGER secondes) ou perd le broker ne voit plus toutes les trames :
+# le salon change d'époque (le tampon ne sert plus), et une coupure du broker évince toutes
+# les connexions, qui reprennent. Avec InProcessBroker (un seul worker), rien ne change.
+
+
+class Outbox:
+    """File d'envoi d'une connexion et sa tâche d'écriture (lancée par start)."""
+
+    def __init__(self, websocket: WebSocket, frame_format: str, detach, on_evict, max_size: int):
+        self.websocket = websocket
+        self.frame_format = frame_format  # "json" ou "msgpack", négocié à la connexion
+        self.detach = detach  # Retire la connexion de son salon (ou de son utilisateur)
+        self.on_evict = on_evict
+        self.max_size = max_size
+        self.control: Deque[Union[str, bytes]] = deque()
+        self.frames: Deque[Union[str, bytes]] = deque()
+        self.waiter: Optional[asyncio.Future] = None  # Tâche d'écriture endormie sur une file vide
+        self.sending_since: Optional[float] = None  # Début de l'envoi en cours (surveillé par le manager)
+        self.task: Optional[asyncio.Task] = None
+        self.closed = False
+
+    def __len__(self):
+        return len(self.control) + len(self.frames)
+
+    def put(self, data: Union[str, bytes], control: bool = False):
+        """Ajoute une trame déjà sérialisée, sans attendre ; évince la connexion si sa file déborde."""
+        if self.closed:
+            return
+        if not control:
+            self.frames.append(data)
+        elif data not in self.control:
+            self.control.append(data)
+        if len(self) > self.max_size:
+            self.evict("overflow")
+        elif self.waiter is not None:
+            self.waiter.set_result(None)
+            self.waiter = None
+
+    def extend(self, first):
+        """Trames d'entrée dans un salon (reprise, hello), posées d'un bloc hors limite de taille."""
+        if self.closed:
+            return
+        self.frames.extend(first)
+        if self.waiter is not None:
+            self.waiter.set_result(None)
+            self.waiter = None
+
+    def start(self, first=()):
+        """Lance l'écriture ; `first` (trames de reprise) passe devant ce qui est déjà en file."""
+        if self.closed:
+            return
+        self.frames.extendleft(reversed(first))
+        self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                if not self.control and not self.frames:
+                    self.waiter = loop.create_future()
+                    await self.waiter
+                data = self.control.popleft() if self.control else self.frames.popleft()
+                # Pas de minuterie par envoi (trop chère à des milliers de connexions) :
+                # le manager repère les envois trop longs (watch_sends)
+                self.sending_since = loop.time()
+                if isinstance(data, bytes):
+                    await self.websocket.send_bytes(data)
+                else:
+                    await self.websocket.send_text(data)
+                self.sending_since = None
+        except Exception:
+            self.evict("error")  # Socket morte : on la retire, les autres ne sont pas concernées
+
+    def evict(self, reason: str):
+        if not self.closed:
+            self.close()
+            self.on_evict(self, reason)
+
+    def close(self):
+        self.closed = True
+        self.control.clear()
+        self.frames.clear()
+        if self.task is not None and self.task is not asyncio.current_task():
+            self.task.cancel()
 
 
 # --- GESTIONNAIRE WEBSOCKET ---
@@ -33,73 +197,485 @@ router = APIRouter()
 
 
 class ConnectionManager:
-    def __init__(self):
+    def __init__(self, send_queue: int = WS_SEND_QUEUE, send_timeout: float = WS_SEND_TIMEOUT, broker=None):
         # Pour le chat dans les salons
-        self.room_connections: Dict[int, List[WebSocket]] = {}
+        self.room_connections: Dict[int, Set[WebSocket]] = {}
         # Pour les notifications globales (nouveaux messages, salons, etc.)
         self.user_connections: Dict[int, List[WebSocket]] = {}
+        # Salons suivis par chaque session /ws (index inverse de room_connections)
+        self.session_rooms: Dict[WebSocket, Set[int]] = {}
+        self.session_users: Dict[WebSocket, int] = {}
+        # File d'envoi de chaque connexion (voir plus haut)
+        self.outboxes: Dict[WebSocket, Outbox] = {}
+        self.send_queue = send_queue
+        self.send_timeout = send_timeout
+        self.watchdog: Optional[asyncio.Task] = None  # Surveille la durée des envois (watch_sends)
+        self.background = set()  # Tâches de fond en cours (fermetures, publications)
+        # Reprise (voir plus haut) : dernier seq et dernières trames de chaque salon
+        self.epoch = self.new_epoch()
+        self.room_epochs: Dict[int, str] = {}  # Salons repartis sous une autre époque (désabonnement)
+        self.room_seqs: Dict[int, int] = {}
+        self.replay_buffers: Dict[int, Deque[Tuple[dict, Dict[str, Union[str, bytes]]]]] = {}  # (trame, sérialisations par format)
+        self.session_factory = AsyncReadSessionLocal  # Repli sur la base (remplaçable par les benchmarks)
+        # Membres de chaque salon (voir plus haut) ; l'horloge détecte une adhésion pendant une lecture
+        self.room_members: Dict[int, Set[int]] = {}
+        self.membership_clock = 0
+        self.member_deliveries: Dict[int, asyncio.Task] = {}  # Dernière livraison "members" en cours par salon
+        # Broker (voir plus haut) : connexions locales par canal, désabonnements différés
+        self.broker = make_broker() if broker is None else broker
+        self.loop: Optional[asyncio.AbstractEventLoop] = None  # Boucle des connexions, une fois le broker branché
+        self.holders = Counter()
+        self.lingering: Dict[str, asyncio.TimerHandle] = {}
+        # Métriques
+        self.replays = 0
+        self.db_fallbacks = 0
+        self.resets = 0
+        self.evictions = Counter()
 
-    async def connect_user(self, websocket: WebSocket, user_id: int):
-        await websocket.accept()
+    @staticmethod
+    def new_epoch():
+        return f"{os.getpid()}-{time.time_ns()}"
+
+    def send_to_all(self, connections, message: dict, frames: Dict[str, Union[str, bytes]] = None):
+        """
+        Sérialise la trame au plus une fois par format, quel que soit le nombre de destinataires,
+        et pose le même objet str / bytes dans la file de chacun (sans attendre le réseau).
+        `frames` : sérialisations déjà faites, complétées au passage (partagées avec le tampon de reprise).
+        """
+        frames = {} if frames is None else frames
+        control = "seq" not in message
+        for connection in connections:
+            outbox = self.outboxes.get(connection)
+            if outbox is None:
+                continue
+            if outbox.frame_format not in frames:
+                frames[outbox.frame_format] = encode_frame(message, outbox.frame_format)
+            outbox.put(frames[outbox.frame_format], control)
+
+    @staticmethod
+    def encoded(message: dict, frames: Dict[str, Union[str, bytes]], frame_format: str):
+        """Trame sérialisée dans ce format, calculée une seule fois (cache `frames`)."""
+        if frame_format not in frames:
+            frames[frame_format] = encode_frame(message, frame_format)
+        return frames[frame_format]
+
+    def open_outbox(self, websocket: WebSocket, frame_format: str, detach) -> Outbox:
+        outbox = Outbox(websocket, frame_format, detach, self.evict, self.send_queue)
+        self.outboxes[websocket] = outbox
+        # Démarrage à la demande, sur la boucle des connexions
+        if self.watchdog is None or self.watchdog.done():
+            self.watchdog = asyncio.create_task(self.watch_sends())
+        return outbox
+
+    async def watch_sends(self):
+        """Évince les connexions dont l'envoi en cours dure plus de send_timeout secondes."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.send_timeout / 4)
+            deadline = loop.time() - self.send_timeout
+            for outbox in [o for o in self.outboxes.values() if o.sending_since is not None and o.sending_since < deadline]:
+                outbox.evict("timeout")
+
+    def close_outbox(self, websocket: WebSocket):
+        outbox = self.outboxes.pop(websocket, None)
+        if outbox is not None:
+            outbox.close()
+
+    def evict(self, outbox: Outbox, reason: str):
+        """Retire une connexion lente ou morte ; le client se reconnecte et reprend."""
+        self.evictions[reason] += 1
+        outbox.detach()
+        self.spawn(self.close_evicted(outbox.websocket))
+
+    def spawn(self, coroutine) -> asyncio.Task:
+        task = asyncio.create_task(coroutine)
+        self.background.add(task)
+        task.add_done_callback(self.finish_background)
+        return task
+
+    def finish_background(self, task: asyncio.Task):
+        self.background.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Erreur tâche de fond: {task.exception()!r}")
+
+    async def close_evicted(self, websocket: WebSocket):
+        with suppress(Exception):
+            await asyncio.wait_for(websocket.close(code=WS_CLOSE_SLOW_CONSUMER), self.send_timeout)
+
+    # --- Broker ---
+    async def start(self):
+        """Branche le broker (lifespan de main.py, sinon à la première diffusion ou connexion)."""
+        self.loop = asyncio.get_running_loop()
+        await self.broker.start(self.dispatch, self.broker_reset)
+        if self.broker.shared:
+            resource_versions.on_change = lambda change: self.publish_soon(VERSIONS_CHANNEL, change)
+        with suppress(asyncio.TimeoutError):
+            # Broker injoignable : abonné dès son retour
+            await asyncio.gather(self.broker.subscribe(USERS_CHANNEL), self.broker.subscribe(VERSIONS_CHANNEL))
+
+    async def stop(self):
+        await self.broker.stop()
+        resource_versions.on_change = None
+        self.loop = None
+
+    async def publish(self, channel: str, message: dict):
+        if self.loop is None:
+            await self.start()
+        await self.broker.publish(channel, message)
+
+    def publish_soon(self, channel: str, message: dict):
+        """Publication depuis du code synchrone, éventuellement hors de la boucle (routes `def`)."""
+        if self.loop is not None and self.broker.shared:
+            self.loop.call_soon_threadsafe(self.spawn, self.broker.publish(channel, message))
+
+    async def subscribe(self, channel: str):
+        """Attend la confirmation de l'abonnement du worker (à appeler entre retain et release)."""
+        if self.loop is None:
+            await self.start()
+        await self.broker.subscribe(channel)
+
+    def retain(self, channel: str):
+        self.holders[channel] += 1
+        timer = self.lingering.pop(channel, None)
+        if timer is not None:
+            timer.cancel()
+
+    def release(self, channel: str, linger: float = 0):
+        """Dernière connexion locale du canal partie : désabonnement, différé de `linger` secondes."""
+        self.holders[channel] -= 1
+        if self.holders[channel] > 0:
+            return
+        del self.holders[channel]
+        if linger and self.broker.shared and self.loop is not None:
+            self.lingering[channel] = self.loop.call_later(linger, self.drop_channel, channel)
+        else:
+            self.drop_channel(channel)
+
+    def drop_channel(self, channel: str):
+        self.lingering.pop(channel, None)
+        if channel in self.holders:
+            return
+        self.broker.unsubscribe(channel)
+        if self.broker.shared and channel.startswith(ROOM_CHANNEL):
+            self.restart_room(int(channel[len(ROOM_CHANNEL):]))
+
+    def restart_room(self, room_id: int):
+        """Le worker ne reçoit plus les trames du salon : ses seq repartent sous une nouvelle époque."""
+        self.room_seqs.pop(room_id, None)
+        self.replay_buffers.pop(room_id, None)
+        self.room_epochs[room_id] = self.new_epoch()
+
+    def room_epoch(self, room_id: int) -> str:
+        return self.room_epochs.get(room_id, self.epoch)
+
+    def broker_reset(self):
+        """Connexion au broker perdue : des trames ont pu manquer, tout le monde reprend."""
+        self.epoch = self.new_epoch()
+        self.room_epochs.clear()
+        self.room_seqs.clear()
+        self.replay_buffers.clear()
+        self.drop_members()
+        resource_versions.bump_all(share=False)  # Incréments des autres workers peut-être perdus : plus de 304
+        for outbox in list(self.outboxes.values()):
+            outbox.evict("broker")
+
+    async def dispatch(self, channel: str, message: dict):
+        """Livre une publication reçue du broker aux connexions de ce worker."""
+        if channel.startswith(ROOM_CHANNEL):
+            self.deliver_to_room(int(channel[len(ROOM_CHANNEL):]), message)
+        elif channel.startswith(USER_CHANNEL):
+            user_id = int(channel[len(USER_CHANNEL):])
+            if user_id in self.user_connections:
+                self.send_to_all(list(self.user_connections[user_id]), message)
+        elif channel == USERS_CHANNEL:
+            if message["kind"] == "members":
+                self.deliver_to_members_soon(message["room_id"], message["frame"])
+            elif message["kind"] == "all":
+                self.send_to_all([connection for connections in self.user_connections.values() for connection in connections], message["frame"])
+            elif message["kind"] == "forget":
+                self.drop_members(message["room_id"])
+            elif message["kind"] == "revoke":
+                self.close_user(message["user_id"])
+            elif message["kind"] == "close_room":
+                self.unsubscribe_sessions(message["room_id"], "Ce salon a été supprimé.")
+        elif channel == VERSIONS_CHANNEL:
+            resource_versions.apply(message)
+
+    # --- Connexions utilisateur ---
+    def add_user_connection(self, websocket: WebSocket, user_id: int, frame_format: str = "json") -> Outbox:
+        outbox = self.open_outbox(websocket, frame_format, lambda: self.disconnect_user(websocket, user_id))
         if user_id not in self.user_connections:
             self.user_connections[user_id] = []
         self.user_connections[user_id].append(websocket)
+        self.retain(USER_CHANNEL + str(user_id))
+        return outbox
+
+    async def connect_user(self, websocket: WebSocket, user_id: int):
+        frame_format = await accept_websocket(websocket)
+        channel = USER_CHANNEL + str(user_id)
+        self.retain(channel)  # Garde l'abonnement pendant l'attente de sa confirmation
+        try:
+            await self.subscribe(channel)
+            outbox = self.add_user_connection(websocket, user_id, frame_format)
+        finally:
+            self.release(channel)
+        outbox.start()
+
+    async def connect_session(self, websocket: WebSocket, user_id: int):
+        """Session /ws : connexion utilisateur qui pourra s'abonner à des salons."""
+        await self.connect_user(websocket, user_id)
+        self.session_rooms[websocket] = set()
+        self.session_users[websocket] = user_id
 
     def disconnect_user(self, websocket: WebSocket, user_id: int):
-        if user_id in self.user_connections:
+        self.close_outbox(websocket)
+        self.session_users.pop(websocket, None)
+        for room_id in self.session_rooms.pop(websocket, ()):
+            self.leave_room(websocket, room_id)
+        if websocket in self.user_connections.get(user_id, ()):
             self.user_connections[user_id].remove(websocket)
+            if not self.user_connections[user_id]:
+                del self.user_connections[user_id]
+            self.release(USER_CHANNEL + str(user_id))
+
+    def revoke_user(self, user_id: int):
+        """À appeler quand les jetons de l'utilisateur sont révoqués (ban, pseudo) : ferme ses sessions partout."""
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.close_user, user_id)
+        self.publish_soon(USERS_CHANNEL, {"kind": "revoke", "user_id": user_id})
+
+    def close_user(self, user_id: int):
+        for websocket in list(self.user_connections.get(user_id, ())):
+            outbox = self.outboxes.get(websocket)
+            if outbox is not None:
+                outbox.evict("revoked")
 
     async def notify_user(self, user_id: int, message: dict):
         """Envoie un signal à un utilisateur spécifique"""
-        if user_id in self.user_connections:
-            for connection in self.user_connections[user_id]:
-                await connection.send_json(message)
+        await self.publish(USER_CHANNEL + str(user_id), message)
 
     async def broadcast_global(self, message: dict):
         """Envoie un signal à TOUT le monde (ex: nouveau salon créé)"""
-        for connections in self.user_connections.values():
-            for connection in connections:
-                await connection.send_json(message)
+        await self.publish(USERS_CHANNEL, {"kind": "all", "frame": message})
+
+    async def notify_room_members(self, room_id: int, message: dict):
+        """Envoie un signal aux seuls membres du salon connectés (ex: aperçu du dernier message)."""
+        await self.publish(USERS_CHANNEL, {"kind": "members", "room_id": room_id, "frame": message})
+
+    def deliver_to_members_soon(self, room_id: int, message: dict):
+        """
+        Livraison en tâche de fond : la lecture des membres en base ne bloque ni le lecteur du
+        broker ni les trames des autres canaux. Pour un même salon, chaque livraison attend la
+        précédente (les aperçus "room_summary" arrivent dans l'ordre de publication).
+        """
+        task = self.spawn(self.deliver_to_members(room_id, message, after=self.member_deliveries.get(room_id)))
+        self.member_deliveries[room_id] = task
+        task.add_done_callback(lambda done: self.member_deliveries.pop(room_id) if self.member_deliveries.get(room_id) is done else None)
+
+    async def deliver_to_members(self, room_id: int, message: dict, after: Optional[asyncio.Task] = None):
+        if after is not None:
+            await asyncio.wait([after])  # Une erreur de la précédente est déjà signalée (finish_background)
+        if not self.user_connections:
+            return
+        members = await self.get_room_members(room_id)
+        online = self.user_connections
+        # On parcourt le plus petit des deux ensembles : membres du salon ou utilisateurs connectés
+        user_ids = [user_id for user_id in members if user_id in online] if len(members) < len(online) else [user_id for user_id in online if user_id in members]
+        self.send_to_all([connection for user_id in user_ids for connection in online.get(user_id, ())], message)
+
+    async def get_room_members(self, room_id: int) -> Set[int]:
+        members = self.room_members.get(room_id)
+        if members is None:
+            clock = self.membership_clock
+            async with self.session_factory() as db:
+                members = await db_async.get_room_member_ids(db, room_id)
+            if clock == self.membership_clock:
+                self.room_members[room_id] = members
+        return members
+
+    def forget_members(self, room_id: int = None):
+        """À appeler après chaque changement d'adhésion (room_id=None : tous les salons, ex: inscription)."""
+        self.drop_members(room_id)
+        self.publish_soon(USERS_CHANNEL, {"kind": "forget", "room_id": room_id})  # Caches des autres workers
+
+    def drop_members(self, room_id: int = None):
+        self.membership_clock += 1
+        if room_id is None:
+            self.room_members.clear()
+        else:
+            self.room_members.pop(room_id, None)
+            if self.loop is not None:  # Appelé aussi depuis les routes `def` (threads)
+                self.loop.call_soon_threadsafe(self.spawn, self.check_subscriptions(room_id))
+
+    async def check_subscriptions(self, room_id: int):
+        """Adhésions du salon changées : les sessions qui n'en sont plus membres sont désabonnées."""
+        if not self.room_sessions(room_id):
+            return
+        members = await self.get_room_members(room_id)
+        self.unsubscribe_sessions(room_id, "Vous n'êtes plus membre de ce salon.", lambda user_id: user_id not in members)
+
+    def close_room(self, room_id: int):
+        """Salon supprimé : toutes les sessions en sont désabonnées, sur tous les workers."""
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.unsubscribe_sessions, room_id, "Ce salon a été supprimé.")
+        self.publish_soon(USERS_CHANNEL, {"kind": "close_room", "room_id": room_id})
+
+    def room_sessions(self, room_id: int) -> List[WebSocket]:
+        return [websocket for websocket in self.room_connections.get(room_id, ()) if websocket in self.session_users]
+
+    def unsubscribe_sessions(self, room_id: int, detail: str, revoked=lambda user_id: True):
+        for websocket in self.room_sessions(room_id):
+            if revoked(self.session_users[websocket]):
+                self.unsubscribe_room(websocket, room_id)
+                self.refuse(self.outboxes[websocket], room_id, detail)
 
     # --- Garde tes méthodes existantes pour les rooms ---
-    async def connect_room(self, websocket: WebSocket, room_id: int):
-        await websocket.accept()
+    def add_room_connection(self, websocket: WebSocket, room_id: int, frame_format: str = "json") -> Outbox:
+        """Inscrit la connexion au salon ; sa file se remplit dès maintenant mais ne part qu'à outbox.start()."""
+        outbox = self.open_outbox(websocket, frame_format, lambda: self.disconnect_room(websocket, room_id))
+        self.join_room(websocket, room_id)
+        return outbox
+
+    def join_room(self, websocket: WebSocket, room_id: int):
         if room_id not in self.room_connections:
-            self.room_connections[room_id] = []
-        self.room_connections[room_id].append(websocket)
+            self.room_connections[room_id] = set()
+        if websocket not in self.room_connections[room_id]:
+            self.room_connections[room_id].add(websocket)
+            self.retain(ROOM_CHANNEL + str(room_id))
 
-    def disconnect_room(self, websocket: WebSocket, room_id: int):
-        if room_id in self.room_connections:
-            self.room_connections[room_id].remove(websocket)
+    def leave_room(self, websocket: WebSocket, room_id: int):
+        if websocket in self.room_connections.get(room_id, ()):
+            self.room_connections[room_id].discard(websocket)
             if not self.room_connections[room_id]:
                 del self.room_connections[room_id]
+            # Abonnement gardé un moment : une reconnexion reprend depuis le tampon
+            self.release(ROOM_CHANNEL + str(room_id), BROKER_LINGER)
 
-    # ... (reste de tes méthodes broadcast_to_room)
+    async def subscribe_room(self, websocket: WebSocket, user_id: int, room_id: int, resume_from: int = None, epoch: str = None, since: int = None):
+        """Abonne une session /ws à un salon (ou la réabonne avec reprise, après un trou)."""
+        outbox, rooms = self.outboxes.get(websocket), self.session_rooms.get(websocket)
+        if outbox is None or rooms is None:
+            return
+        if room_id not in rooms and len(rooms) >= WS_MAX_ROOMS:
+            return self.refuse(outbox, room_id, f"Pas plus de {WS_MAX_ROOMS} salons suivis à la fois.")
+        clock = self.membership_clock
+        if user_id not in await self.get_room_members(room_id):
+            return self.refuse(outbox, room_id, "Vous n'êtes pas membre de ce salon.")
+        # Réabonnement : plus aucune trame live pour ce salon avant la fin de la reprise
+        self.unsubscribe_room(websocket, room_id)
+        channel = ROOM_CHANNEL + str(room_id)
+        self.retain(channel)
+        try:
+            await self.subscribe(channel)
+            first = await self.room_handshake(room_id, resume_from, epoch, since, outbox.frame_format)
+            if outbox.closed:
+                return
+            rooms.add(room_id)
+            self.join_room(websocket, room_id)
+        finally:
+            self.release(channel)
+        outbox.extend(first)
+        if clock != self.membership_clock:
+            # Adhésion changée pendant la reprise : vérifiée à nouveau, maintenant que la session est inscrite
+            self.spawn(self.check_subscriptions(room_id))
 
-    async def broadcast_to_room(self, room_id: int, message_data: dict):
-        if room_id in self.room_connections:
-            for connection in self.room_connections[room_id]:
-                await connection.send_json(message_data)
+    def unsubscribe_room(self, websocket: WebSocket, room_id: int):
+        rooms = self.session_rooms.get(websocket)
+        if rooms is not None and room_id in rooms:
+            rooms.discard(room_id)
+            self.leave_room(websocket, room_id)
 
+    def refuse(self, outbox: Outbox, room_id: int, detail: str):
+        outbox.put(encode_frame({"action": "unsubscribed", "room_id": room_id, "detail": detail}, outbox.frame_format), control=True)
 
-manager = ConnectionManager()
+    async def room_handshake(self, room_id: int, resume_from: Optional[int], epoch: Optional[str], since: Optional[int], frame_format: str) -> List[Union[str, bytes]]:
+        """
+        Trames d'entrée dans un salon : manquées (ou "resync" lu en base), puis "hello".
+        L'appelant inscrit la connexion dès le retour, sans await : les trames diffusées pendant
+        les lectures sont reprises du tampon, les suivantes passeront par la file.
+        """
+        current, room_epoch = self.room_seqs.get(room_id, 0), self.room_epoch(room_id)
+        missed = self.missed_frames(room_id, resume_from, epoch)
 
+        # Lectures en base (curseur du journal, repli éventuel) avant tout envoi
+        async with self.session_factory() as db:
+            resync = await self.resync_frame(db, room_id, since, current) if missed is None and resume_from is not None else None
+            head = await db_async.get_event_head(db)
 
-@router.websocket("/ws/{room_id}")
-async def websocket_endpoint(websocket: WebSocket, room_id: int):
-    await manager.connect_room(websocket, room_id)
-    try:
-        while True:
-            data = await websocket.receive_json()
-    except WebSocketDisconnect:
-        manager.disconnect_room(websocket, room_id)
+        later = self.missed_frames(room_id, current, room_epoch)
+        first = []
+        if later is None:
+            # Salon reparti sous une autre époque pendant les lectures (broker coupé) : rechargement
+            self.resets += 1
+            first.append(encode_frame({"action": "resync", "room_id": room_id, "seq": self.room_seqs.get(room_id, 0), "reset": True}, frame_format))
+        else:
+            if missed is not None:
+                self.replays += 1
+                later = missed + later
+            elif resync is not None:
+                first.append(encode_frame(resync, frame_format))
+            first.extend(self.encoded(frame, frames, frame_format) for frame, frames in later)
+        first.append(encode_frame({"action": "hello", "room_id": room_id, "seq": self.room_seqs.get(room_id, 0), "epoch": self.room_epoch(room_id), "since": head}, frame_format))
+        return first
 
+    def missed_frames(self, room_id: int, resume_from: Optional[int], epoch: Optional[str]):
+        """Entrées du tampon de seq > resume_from s'il les a toutes, sinon None (repli sur la base)."""
+        if resume_from is None or epoch != self.room_epoch(room_id):
+            return None
+        current = self.room_seqs.get(room_id, 0)
+        if resume_from > current:
+            return None
+        buffer = self.replay_buffers.get(room_id, ())
+        oldest = buffer[0][0]["seq"] if buffer else current + 1
+        if resume_from + 1 < oldest:
+            return None
+        return [entry for entry in buffer if entry[0]["seq"] > resume_from]
 
-@router.websocket("/ws/user/{user_id}")
-async def user_websocket_endpoint(websocket: WebSocket, user_id: int):
-    await manager.connect_user(websocket, user_id)
-    try:
-        while True:
-            await websocket.receive_text()  # Maintient la connexion ouverte
-    except WebSocketDisconnect:
-        manager.disconnect_user(websocket, user_id)
+    async def resync_frame(self, db, room_id: int, since: Optional[int], current: int):
+        """Changements du salon lus dans le journal `events` depuis le curseur du client."""
+        self.db_fallbacks += 1
+        batch = await db_async.get_room_sync(db, room_id, since)
+        if batch.get("reset"):
+            self.resets += 1
+        return dict(batch, action="resync", room_id=room_id, seq=current)
+
+    def disconnect_room(self, websocket: WebSocket, room_id: int):
+        self.close_outbox(websocket)
+        self.leave_room(websocket, room_id)
+
+    # ... (reste de tes méthodes broadcast_to_room)
+
+    async def broadcast_to_room(self, room_id: int, message_data: dict):
+        """Publie la trame du salon ; chaque worker abonné la livre (deliver_to_room)."""
+        await self.publish(ROOM_CHANNEL + str(room_id), message_data)
+
+    def deliver_to_room(self, room_id: int, message_data: dict):
+        """Numérote la trame dans le salon et la garde pour la reprise, même sans connexion ouverte."""
+        seq = self.room_seqs.get(room_id, 0) + 1
+        self.room_seqs[room_id] = seq
+        frame, frames = dict(message_data, room_id=room_id, seq=seq), {}
+        if room_id not in self.replay_buffers:
+            self.replay_buffers[room_id] = deque(maxlen=WS_REPLAY_BUFFER)
+        self.replay_buffers[room_id].append((frame, frames))
+        if room_id in self.room_connections:
+            self.send_to_all(list(self.room_connections[room_id]), frame, frames)
+
+    def metrics(self):
+        return {
+            "rooms": len(self.room_seqs),
+            "buffered_frames": sum(len(buffer) for buffer in self.replay_buffers.values()),
+            "replays": self.replays,
+            "db_fallbacks": self.db_fallbacks,
+            "resets": self.resets,
+            "connections": len(self.outboxes),
+            "sessions": len(self.session_rooms),
+            "session_subscriptions": sum(len(rooms) for rooms in self.session_rooms.values()),
+            "queued_frames": sum(len(outbox) for outbox in self.outboxes.values()),
+            "evictions": dict(self.evictions),
+            "cached_memberships": len(self.room_members),
+            "subscriptions": len(self.holders) + len(self.lingering),
+            **self.broker.metrics(),
+        }
+
+
+manager = ConnectionManager()
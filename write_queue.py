@@ -0,0 +1,128 @@
+import asyncio
+import time
+from collections import Counter
+from contextlib import suppress
+
+from database.models import AsyncSessionLocal
+
+WRITE_BATCH_MAX = 200  # Nombre maximum d'écritures regroupées dans une transaction
+WRITE_BATCH_LINGER = 0.002  # Attente (s) après la première écriture pour laisser les suivantes arriver
+
+
+# --- FILE D'ÉCRITURE UNIQUE (GROUP COMMIT) ---
+# SQLite n'accepte qu'un seul écrivain à la fois : plutôt que de laisser chaque
+# requête faire son propre commit (et attendre le verrou via busy_timeout), les
+# écritures chaudes (messages, réactions, curseurs de lecture) passent par cette
+# file. Un unique worker les regroupe en lots : une transaction par lot, un
+# SAVEPOINT par écriture (un échec n'annule que la sienne), puis chaque requête
+# récupère le résultat de son écriture (ex: l'id du message) une fois le lot commité.
+
+
+class WriteQueue:
+    def __init__(self, session_factory=AsyncSessionLocal, max_batch=WRITE_BATCH_MAX, linger=WRITE_BATCH_LINGER):
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self.linger = linger
+        self._queue: asyncio.Queue = None
+        self._worker_task: asyncio.Task = None
+        # Métriques
+        self.batches = 0
+        self.jobs = 0
+        self.failed_jobs = 0
+        self.failed_batches = 0
+        self.max_depth = 0
+        self.batch_sizes = Counter()
+        self.commit_ms_total = 0.0
+
+    def start(self):
+        """Démarre le worker sur la boucle d'événements courante (lifespan de main.py)."""
+        self._queue = asyncio.Queue()
+        self._worker_task = asyncio.create_task(self._worker())
+
+    async def stop(self):
+        """Termine les écritures en attente puis arrête le worker."""
+        if self._worker_task is None:
+            return
+        if not self._worker_task.done():
+            await self._queue.join()
+        self._worker_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await self._worker_task
+        self._worker_task = None
+
+    async def submit(self, job, *args):
+        """
+        Met en file `job(db, *args)` (coroutine qui écrit sans commit) et attend le commit
+        de son lot. Renvoie la valeur du job, ou relève son exception (ex: HTTPException).
+        """
+        # Démarrage à la demande (ex: application lancée sans lifespan)
+        if self._worker_task is None or self._worker_task.done():
+            self.start()
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((job, args, future))
+        self.max_depth = max(self.max_depth, self._queue.qsize())
+        return await future
+
+    async def _worker(self):
+        while True:
+            batch = [await self._queue.get()]
+            if self.linger:
+                await asyncio.sleep(self.linger)
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self._run_batch(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _run_batch(self, batch):
+        outcomes = []
+        start = time.perf_counter()
+        try:
+            async with self.session_factory() as db:
+                for job, args, future in batch:
+                    try:
+                        async with db.begin_nested():
+                            outcomes.append((future, await job(db, *args), None))
+                    except Exception as e:
+                        outcomes.append((future, None, e))
+                await db.commit()
+        except Exception as e:
+            # Le commit du lot a échoué : aucune écriture du lot n'est conservée
+            print(f"Erreur write_queue: {e}")
+            self.failed_batches += 1
+            outcomes = [(future, None, e) for _, _, future in batch]
+
+        self.batches += 1
+        self.jobs += len(batch)
+        self.batch_sizes[len(batch)] += 1
+        self.commit_ms_total += (time.perf_counter() - start) * 1000
+
+        for future, result, error in outcomes:
+            if error is not None:
+                self.failed_jobs += 1
+            if future.done():  # Requête abandonnée par le client
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def metrics(self):
+        return {
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "max_queue_depth": self.max_depth,
+            "batches": self.batches,
+            "jobs": self.jobs,
+            "failed_jobs": self.failed_jobs,
+            "failed_batches": self.failed_batches,
+            "avg_batch_size": round(self.jobs / self.batches, 2) if self.batches else 0,
+            "max_batch_size": max(self.batch_sizes, default=0),
+            "avg_batch_ms": round(self.commit_ms_total / self.batches, 2) if self.batches else 0,
+            "batch_sizes": dict(sorted(self.batch_sizes.items())),
+        }
+
+
+write_queue = WriteQueue()